@@ -30,6 +30,7 @@ import platform
 import datetime
 sys.path.append('./resources/python')
 from cpydColours import color
+from cpydPrefs import loadPrefs, getPref, movePrefs, PrefsError, LIVE_DIR, USER_DIR
 try:
     from pypresence import Presence
 except:
@@ -122,7 +123,7 @@ def startup():
     #    fts()
 
     
-    if os.path.exists("blobs/user/USR_CFG.apb"):
+    if getPref(USER_DIR, "USR_CFG") is not None:
             print(color.BOLD+"\n\n  "+color.CYAN,"ULTMOS"+color.END+color.GRAY,"v"+version+color.END)
             print("   by Coopydood"+color.END)
             tainted = 1
@@ -136,33 +137,33 @@ def startup():
         print(color.YELLOW+"\n   ⚠  Virtual machine detected, functionality may be limited"+color.END)
     
 
-    if os.path.exists("./blobs/USR_TARGET_OS.apb") and not os.path.exists("./blobs/user/USR_TARGET_OS.apb"):  # Rescue live blobs if coming from older repo version
-        os.system("mv ./blobs/*.apb ./blobs/user")
+    if getPref(LIVE_DIR, "USR_TARGET_OS") is not None and getPref(USER_DIR, "USR_TARGET_OS") is None:  # Rescue live blobs if coming from older repo version
+        movePrefs(LIVE_DIR, USER_DIR)
 
+    try:
+        userPrefs = loadPrefs(USER_DIR)
+    except PrefsError:
+        userPrefs = {}
 
-    if os.path.exists("./blobs/user/USR_CFG.apb"):
+    if "USR_CFG" in userPrefs:
             global apFilePath
             global apFilePathNoPT
             global apFile
             global apFilePathNoUSB
             global macOSVer
             global mOSString
-            apFilePath = open("./blobs/user/USR_CFG.apb")
-            apFilePath = apFilePath.read()
-            if os.path.exists("./blobs/user/USR_TARGET_OS_NAME.apb"):
-                macOSVer = open("./blobs/user/USR_TARGET_OS_NAME.apb")
-                macOSVer = macOSVer.read()
+            apFilePath = userPrefs["USR_CFG"]
+            if "USR_TARGET_OS_NAME" in userPrefs:
+                macOSVer = userPrefs["USR_TARGET_OS_NAME"]
            
-            macOSVer = open("./blobs/user/USR_TARGET_OS.apb")
-            macOSVer = macOSVer.read()
+            macOSVer = userPrefs["USR_TARGET_OS"]
             if int(macOSVer) <= 999 and int(macOSVer) > 99:
                 macOSVer = str(int(macOSVer) / 100)
                 mOSString = "Mac OS X"
             else:
                 mOSString = "macOS"
-            if os.path.exists("./blobs/user/USR_TARGET_OS_NAME.apb"):
-                macOSVer = open("./blobs/user/USR_TARGET_OS_NAME.apb")
-                macOSVer = macOSVer.read()
+            if "USR_TARGET_OS_NAME" in userPrefs:
+                macOSVer = userPrefs["USR_TARGET_OS_NAME"]
             if os.path.exists("./"+apFilePath):
                 global REQUIRES_SUDO
                 global VALID_FILE
@@ -195,10 +196,9 @@ def startup():
                 if "APC-RUN" in apFileM:
                     VALID_FILE = 1
 
-                    if "#-drive id=BaseSystem,if=none,file=\"$VM_PATH/BaseSystem.img\",format=raw" not in apFileM and "-drive id=BaseSystem,if=none,file=\"$VM_PATH/BaseSystem.img\",format=raw" in apFileM and "HDD_PATH=\"/dev/disk/" not in apFileM:
-                        if os.path.exists("./blobs/user/USR_HDD_PATH.apb"):
-                            hddPath = open("./blobs/user/USR_HDD_PATH.apb")
-                            hddPath = hddPath.read()
+                    if re.search(r'^-drive id=BaseSystem,', apFileM, re.MULTILINE) and "HDD_PATH=\"/dev/disk/" not in apFileM:
+                        if "USR_HDD_PATH" in userPrefs:
+                            hddPath = userPrefs["USR_HDD_PATH"]
                             hddPath = hddPath.replace("$VM_PATH",os.path.realpath(os.curdir))
                         if (os.path.getsize(hddPath)) > 22177079296 and not os.path.exists("./blobs/user/.noBaseSystemReminder"):
                             baseSystemNotifArmed = True
@@ -273,7 +273,8 @@ def baseSystemAlert():
     if detectChoice5 == "1":
         with open("./"+apFilePath,"r") as apFile:
             apFileM = apFile.read()
-            apFileM = apFileM.replace("-drive id=BaseSystem,if=none,file=\"$VM_PATH/BaseSystem.img\",format=raw\n-device ide-hd,bus=sata.4,drive=BaseSystem","#-drive id=BaseSystem,if=none,file=\"$VM_PATH/BaseSystem.img\",format=raw\n#-device ide-hd,bus=sata.4,drive=BaseSystem")
+            # BaseSystem may be attached as a raw image or as a DMG, comment out whichever is active
+            apFileM = re.sub(r'^(-drive id=BaseSystem,|-device ide-hd,bus=sata\.4,drive=BaseSystem)', r'#\1', apFileM, flags=re.MULTILINE)
             apFile.close()
         time.sleep(1)
         with open("./"+apFilePath,"w") as apFile:
@@ -417,29 +418,23 @@ elif detectChoice == "b" and VALID_FILE == 1 or detectChoice == "B" and VALID_FI
         except:
             None
 
-        if os.path.exists("./blobs/user/USR_VFIO_DEVICES.apb"):
-            vfioDevs = open("./blobs/user/USR_VFIO_DEVICES.apb")
-            vfioDevs = vfioDevs.read()
-            subprocess.Popen(["python3","./scripts/drpc.py","--os",macOSVer,"--pt",vfioDevs])
-        else:
-            subprocess.Popen(["python3","./scripts/drpc.py","--os",macOSVer])
     if REQUIRES_SUDO == 1:
         print(color.YELLOW+color.BOLD+"\n   ⚠ "+color.END+color.BOLD+"SUPERUSER PRIVILEGES"+color.END+"\n   This script uses physical device passthrough,\n   and needs superuser privileges to run.\n\n   Press CTRL+C to cancel.\n"+color.END)
         if baseSystemNotifArmed == True:
             baseSystemAlert()
         if discordRPC == 0:
-            os.system("sudo ./"+apFilePath+" -d 0")
+            os.system("sudo ./scripts/launch.py ./"+apFilePath+" -d 0")
         else:
-            os.system("sudo ./"+apFilePath)
+            os.system("sudo ./scripts/launch.py ./"+apFilePath)
         
 
     else:
         if baseSystemNotifArmed == True:
             baseSystemAlert()
         if discordRPC == 0:
-            os.system("./"+apFilePath+" -d 0")
+            os.system("./scripts/launch.py ./"+apFilePath+" -d 0")
         else:
-            os.system("./"+apFilePath)
+            os.system("./scripts/launch.py ./"+apFilePath)
 elif detectChoice == "o" and VALID_FILE_NOPT == 1 or detectChoice == "o" and VALID_FILE_NOUSB == 1 or detectChoice == "O" and VALID_FILE_NOPT == 1 or detectChoice == "O" and VALID_FILE_NOUSB == 1:
     # Spawn boot options menu
     clear()
@@ -508,27 +503,21 @@ elif detectChoice == "o" and VALID_FILE_NOPT == 1 or detectChoice == "o" and VAL
                 RPC = Presence(client_id)
             except:
                 None
-            if os.path.exists("./blobs/user/USR_VFIO_DEVICES.apb"):
-                vfioDevs = open("./blobs/user/USR_VFIO_DEVICES.apb")
-                vfioDevs = vfioDevs.read()
-                subprocess.Popen(["python3","./scripts/drpc.py","--os",macOSVer,"--pt",vfioDevs])
-            else:
-                subprocess.Popen(["python3","./scripts/drpc.py","--os",macOSVer])
         if REQUIRES_SUDO == 1:
             print(color.YELLOW+color.BOLD+"\n   ⚠ "+color.END+color.BOLD+"SUPERUSER PRIVILEGES"+color.END+"\n   This script uses physical device passthrough,\n   and needs superuser privileges to run.\n\n   Press CTRL+C to cancel.\n"+color.END)
             if baseSystemNotifArmed == True:
                 baseSystemAlert()   
             if discordRPC == 0:
-                os.system("sudo ./"+apFilePath+" -d 0")
+                os.system("sudo ./scripts/launch.py ./"+apFilePath+" -d 0")
             else:
-                os.system("sudo ./"+apFilePath)
+                os.system("sudo ./scripts/launch.py ./"+apFilePath)
         else:
             if baseSystemNotifArmed == True:
                 baseSystemAlert()
             if discordRPC == 0:
-                os.system("./"+apFilePath+" -d 0")
+                os.system("./scripts/launch.py ./"+apFilePath+" -d 0")
             else:
-                os.system("./"+apFilePath)
+                os.system("./scripts/launch.py ./"+apFilePath)
     
     if detectChoice3 == "2" and VALID_FILE_NOPT == 1:  # NO PASSTHROUGH BOOT
         clear()
@@ -555,22 +544,21 @@ elif detectChoice == "o" and VALID_FILE_NOPT == 1 or detectChoice == "o" and VAL
                 RPC = Presence(client_id)
             except:
                 None
-            subprocess.Popen(["python3","./scripts/drpc.py","--os",macOSVer])
         if REQUIRES_SUDO == 1:
             print(color.YELLOW+color.BOLD+"\n   ⚠ "+color.END+color.BOLD+"SUPERUSER PRIVILEGES"+color.END+"\n   This script uses physical device passthrough,\n   and needs superuser privileges to run.\n\n   Press CTRL+C to cancel.\n"+color.END)
             if baseSystemNotifArmed == True:
                 baseSystemAlert()
             if discordRPC == 0:
-                os.system("sudo ./"+apFilePathNoPT+" -d 0")
+                os.system("sudo ./scripts/launch.py ./"+apFilePathNoPT+" -d 0")
             else:
-                os.system("sudo ./"+apFilePathNoPT)
+                os.system("sudo ./scripts/launch.py ./"+apFilePathNoPT)
         else:
             if baseSystemNotifArmed == True:
                 baseSystemAlert()
             if discordRPC == 0:
-                os.system("./"+apFilePathNoPT+" -d 0")
+                os.system("./scripts/launch.py ./"+apFilePathNoPT+" -d 0")
             else:
-                os.system("./"+apFilePathNoPT)
+                os.system("./scripts/launch.py ./"+apFilePathNoPT)
     
     if detectChoice3 == "3" and VALID_FILE_NOUSB == 1:  # NO USB BOOT
         clear()
@@ -597,22 +585,21 @@ elif detectChoice == "o" and VALID_FILE_NOPT == 1 or detectChoice == "o" and VAL
                 RPC = Presence(client_id)
             except:
                 None
-            subprocess.Popen(["python3","./scripts/drpc.py","--os",macOSVer])
         if REQUIRES_SUDO == 1:
             print(color.YELLOW+color.BOLD+"\n   ⚠ "+color.END+color.BOLD+"SUPERUSER PRIVILEGES"+color.END+"\n   This script uses physical device passthrough,\n   and needs superuser privileges to run.\n\n   Press CTRL+C to cancel.\n"+color.END)
             if baseSystemNotifArmed == True:
                 baseSystemAlert()
             if discordRPC == 0:
-                os.system("sudo ./"+apFilePathNoUSB+" -d 0")
+                os.system("sudo ./scripts/launch.py ./"+apFilePathNoUSB+" -d 0")
             else:
-                os.system("sudo ./"+apFilePathNoUSB)
+                os.system("sudo ./scripts/launch.py ./"+apFilePathNoUSB)
         else:
             if baseSystemNotifArmed == True:
                 baseSystemAlert()
             if discordRPC == 0:
-                os.system("./"+apFilePathNoUSB+" -d 0")
+                os.system("./scripts/launch.py ./"+apFilePathNoUSB+" -d 0")
             else:
-                os.system("./"+apFilePathNoUSB)
+                os.system("./scripts/launch.py ./"+apFilePathNoUSB)
     
     elif detectChoice3 == "b" or detectChoice3 == "B":
         os.system('./main.py --skip-vm-check')
@@ -135,11 +135,12 @@ fi
 if [ $DISCORD_RPC = 1 ]
 then
 $REPO_PATH/scripts/drpc.py --os "$OS_ID" --pt $VFIO_DEVICES --wd $REPO_PATH &
+DRPC_PID=$!
 fi
 
 qemu-system-x86_64 "${args[@]}"
 
 if [ $DISCORD_RPC = 1 ]
 then
-pkill -f drpc.py
+kill "$DRPC_PID" 2> /dev/null
 fi
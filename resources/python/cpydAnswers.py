@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+Answer files for headless AutoPilot runs. Every USR_* value the wizard
+would normally ask for is read from a JSON (or YAML) document, checked
+up front and filled in with the same defaults the wizard uses, so a run
+either starts with a complete, valid set of answers or not at all.
+"""
+
+import os
+import re
+import json
+import random
+from cpydPrefs import savePrefs, LIVE_DIR
+from cpydStorage import PROFILES, DEFAULT_PROFILE, diskFile
+from cpydMemory import MEMORY_BACKINGS, DEFAULT_BACKING
+from cpydNetwork import NETWORK_MODES, DEFAULT_MODE, defaultInterface, validInterface
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_INVALID_ANSWERS = 2
+
+# USR_TARGET_OS value -> (name, dlosx short name or None if it can't be downloaded)
+TARGET_OS = {
+    107: ("Lion", "lion"),
+    108: ("Mountain Lion", "mountain-lion"),
+    109: ("Mavericks", "mavericks"),
+    1010: ("Yosemite", "yosemite"),
+    1011: ("El Capitan", "el-capitan"),
+    1012: ("Sierra", "sierra"),
+    1013: ("High Sierra", "high-sierra"),
+    1014: ("Mojave", "mojave"),
+    1015: ("Catalina", "catalina"),
+    11: ("Big Sur", "big-sur"),
+    12: ("Monterey", "monterey"),
+    13: ("Ventura", "ventura"),
+    14: ("Sonoma", "sonoma"),
+    15: ("Sequoia", "sequoia"),
+    26: ("Tahoe", "tahoe"),
+}
+
+SCREEN_RESOLUTIONS = ["800x600", "1024x768", "1280x720", "1280x1024", "1440x900", "1920x1080", "2560x1440", "3840x2160"]
+HDD_TYPES = ["HDD", "SSD", "NVMe", "VirtIO"]
+CFG_CONFLICT = ["rename", "overwrite", "fail"]
+HDD_CONFLICT = ["rename", "use", "delete", "fail"]
+CPU_PINNING = ["auto", "off"]
+DEFAULT_MAC = "00:16:cb:00:21:09"
+DEFAULT_FEATURE_ARGS = "+ssse3,+sse4.2,+popcnt,+avx,+aes,+xsave,+xsaveopt,check"
+PHYSICAL_PREFIX = "/dev/disk/by-id/"
+
+KNOWN_KEYS = [
+    "USR_CFG", "USR_TARGET_OS", "USR_CPU_CORES", "USR_CPU_THREADS", "USR_CPU_MODEL",
+    "USR_CPU_FEATURE_ARGS", "USR_ALLOCATED_RAM", "USR_HDD_SIZE", "USR_HDD_PATH", "USR_HDD_TYPE",
+    "USR_NETWORK_DEVICE", "USR_MAC_ADDRESS", "USR_BOOT_FILE", "USR_SCREEN_RES", "USR_CREATE_XML",
+    "USR_EXP_AUDIO", "USR_CFG_CONFLICT", "USR_HDD_CONFLICT", "USR_SMBIOS_SERIAL", "USR_SMBIOS_UUID",
+    "USR_HDD_PROFILE", "USR_CPU_PINNING", "USR_MEMORY_BACKING", "USR_NETWORK_MODE", "USR_NETWORK_IFACE",
+]
+
+
+class AnswerError(Exception):
+    """
+    Raised when an answer file can't be read or fails validation. All
+    problems found are collected in `problems`.
+    """
+
+    def __init__(self, problems):
+        self.problems = problems if isinstance(problems, list) else [problems]
+        super().__init__("; ".join(self.problems))
+
+
+def loadDocument(path):
+    """
+    Read a JSON or YAML mapping, used for answer and batch files alike.
+    """
+    try:
+        with open(path, "r") as answerFile:
+            text = answerFile.read()
+    except OSError as e:
+        raise AnswerError("Can't read "+path+": "+str(e))
+    if path.endswith((".yaml", ".yml")):
+        if yaml is None:
+            raise AnswerError("YAML files need PyYAML, install it or use JSON instead")
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise AnswerError("Invalid YAML in "+path+": "+str(e))
+    else:
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise AnswerError("Invalid JSON in "+path+": "+str(e))
+    if not isinstance(data, dict):
+        raise AnswerError(path+" must contain a single mapping of values")
+    return data
+
+
+def loadAnswers(path):
+    return loadDocument(path)
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ("true", "yes", "1"):
+        return True
+    if str(value).lower() in ("false", "no", "0"):
+        return False
+    raise ValueError
+
+
+def _positiveInt(value):
+    if isinstance(value, bool):
+        raise ValueError
+    value = int(value)
+    if value < 1:
+        raise ValueError
+    return value
+
+
+def validateAnswers(data, workdir=".", resume=False):
+    """
+    Check raw answers and return a complete dict of USR_* values in the
+    same form the wizard stores them. Raises AnswerError listing every
+    problem found, not just the first. A resumed run expects to find the
+    files it made last time, so existing files aren't a conflict then.
+    """
+    problems = []
+    answers = {}
+
+    for key in data:
+        if key not in KNOWN_KEYS:
+            problems.append("Unknown answer "+str(key))
+
+    def take(key, default, convert, message):
+        if key not in data:
+            return default
+        try:
+            return convert(data[key])
+        except (TypeError, ValueError):
+            problems.append(key+" "+message+" (got "+repr(data[key])+")")
+            return default
+
+    answers["USR_CFG"] = take("USR_CFG", "boot.sh", str, "must be a file name")
+    if not answers["USR_CFG"].endswith(".sh") or "/" in answers["USR_CFG"] or answers["USR_CFG"] == ".sh":
+        problems.append("USR_CFG must be a file name ending in .sh (got "+repr(answers["USR_CFG"])+")")
+
+    targetOS = take("USR_TARGET_OS", 12, int, "must be a macOS version number such as 14 or 1015")
+    if targetOS not in TARGET_OS:
+        problems.append("USR_TARGET_OS "+str(targetOS)+" is not supported, use one of "+", ".join(str(x) for x in TARGET_OS))
+        targetOS = 12
+    legacy = 100 <= targetOS <= 1012
+    answers["USR_TARGET_OS"] = targetOS
+    answers["USR_TARGET_OS_NAME"], answers["USR_TARGET_OS_ID"] = TARGET_OS[targetOS]
+
+    answers["USR_CPU_CORES"] = take("USR_CPU_CORES", 2, _positiveInt, "must be a positive whole number")
+    answers["USR_CPU_THREADS"] = take("USR_CPU_THREADS", 2, _positiveInt, "must be a positive whole number")
+    answers["USR_CPU_MODEL"] = take("USR_CPU_MODEL", "Haswell-noTSX" if targetOS >= 1013 or targetOS <= 99 else "Penryn", str, "must be a QEMU CPU model")
+    answers["USR_CPU_FEATURE_ARGS"] = take("USR_CPU_FEATURE_ARGS", DEFAULT_FEATURE_ARGS, str, "must be a string")
+    answers["USR_CPU_PINNING"] = take("USR_CPU_PINNING", "auto", str, "must be auto or off")
+    if answers["USR_CPU_PINNING"] not in CPU_PINNING:
+        problems.append("USR_CPU_PINNING must be one of "+", ".join(CPU_PINNING))
+
+    answers["USR_ALLOCATED_RAM"] = take("USR_ALLOCATED_RAM", "4G", str, "must be a size in GB")
+    if not re.fullmatch(r"[1-9][0-9]*G", answers["USR_ALLOCATED_RAM"]):
+        problems.append("USR_ALLOCATED_RAM must be a whole number of GB such as 8G (got "+repr(answers["USR_ALLOCATED_RAM"])+")")
+    answers["USR_MEMORY_BACKING"] = take("USR_MEMORY_BACKING", DEFAULT_BACKING, str, "must be a memory backing")
+    if answers["USR_MEMORY_BACKING"] not in MEMORY_BACKINGS:
+        problems.append("USR_MEMORY_BACKING must be one of "+", ".join(MEMORY_BACKINGS))
+
+    # A new disk is described by its size, an existing file or physical disk by its path
+    answers["USR_HDD_ISPHYSICAL"] = False
+    answers["USR_HDD_PROFILE"] = take("USR_HDD_PROFILE", DEFAULT_PROFILE, str, "must be a disk profile")
+    if answers["USR_HDD_PROFILE"] not in PROFILES:
+        problems.append("USR_HDD_PROFILE must be one of "+", ".join(PROFILES))
+        answers["USR_HDD_PROFILE"] = DEFAULT_PROFILE
+    if "USR_HDD_PATH" in data:
+        if "USR_HDD_SIZE" in data:
+            problems.append("Give either USR_HDD_SIZE for a new disk or USR_HDD_PATH for an existing one, not both")
+        if "USR_HDD_PROFILE" in data:
+            problems.append("USR_HDD_PROFILE only applies to a new disk, not USR_HDD_PATH")
+        hddPath = str(data["USR_HDD_PATH"]).replace("'", "")
+        answers["USR_HDD_PATH"] = hddPath
+        if hddPath.startswith(PHYSICAL_PREFIX):
+            answers["USR_HDD_SIZE"] = "-2"
+            answers["USR_HDD_ISPHYSICAL"] = True
+            answers["USR_HDD_PATH_F"] = hddPath[len(PHYSICAL_PREFIX):]
+        else:
+            answers["USR_HDD_SIZE"] = "-1"
+        if not os.path.exists(os.path.join(workdir, hddPath)):
+            problems.append("USR_HDD_PATH "+hddPath+" does not exist")
+    else:
+        answers["USR_HDD_PATH"] = "$VM_PATH/"+diskFile(answers["USR_HDD_PROFILE"])
+        answers["USR_HDD_SIZE"] = take("USR_HDD_SIZE", "80G", str, "must be a size in GB")
+        if not re.fullmatch(r"[1-9][0-9]*G", answers["USR_HDD_SIZE"]):
+            problems.append("USR_HDD_SIZE must be a whole number of GB such as 80G (got "+repr(answers["USR_HDD_SIZE"])+")")
+
+    answers["USR_HDD_TYPE"] = take("USR_HDD_TYPE", "HDD", str, "must be a disk type")
+    if answers["USR_HDD_TYPE"] not in HDD_TYPES:
+        problems.append("USR_HDD_TYPE must be one of "+", ".join(HDD_TYPES))
+    elif answers["USR_HDD_TYPE"] == "NVMe" and answers["USR_HDD_ISPHYSICAL"]:
+        problems.append("USR_HDD_TYPE NVMe can't be used with a physical disk")
+    elif answers["USR_HDD_TYPE"] == "VirtIO" and not 11 <= targetOS <= 99:
+        problems.append("USR_HDD_TYPE VirtIO needs macOS 11 or newer, "+answers["USR_TARGET_OS_NAME"]+" has no virtio-blk driver")
+
+    if legacy:
+        defaultNetwork = "e1000-82545em"
+    elif 11 <= targetOS <= 99:
+        defaultNetwork = "virtio-net"
+    else:
+        defaultNetwork = "vmxnet3"
+    answers["USR_NETWORK_DEVICE"] = take("USR_NETWORK_DEVICE", defaultNetwork, str, "must be a QEMU network device")
+
+    # Anything but user mode needs a host interface to attach to
+    answers["USR_NETWORK_MODE"] = take("USR_NETWORK_MODE", DEFAULT_MODE, str, "must be a network mode")
+    if answers["USR_NETWORK_MODE"] not in NETWORK_MODES:
+        problems.append("USR_NETWORK_MODE must be one of "+", ".join(NETWORK_MODES))
+        answers["USR_NETWORK_MODE"] = DEFAULT_MODE
+    answers["USR_NETWORK_IFACE"] = take("USR_NETWORK_IFACE", defaultInterface(answers["USR_NETWORK_MODE"]) or "", str, "must be an interface name")
+    if answers["USR_NETWORK_MODE"] == "user":
+        if "USR_NETWORK_IFACE" in data:
+            problems.append("USR_NETWORK_IFACE only applies to the bridge, tap and macvtap network modes")
+        answers["USR_NETWORK_IFACE"] = ""
+    elif answers["USR_NETWORK_IFACE"] == "":
+        problems.append("USR_NETWORK_IFACE must be given, no "+("bridge" if answers["USR_NETWORK_MODE"] == "bridge" else "default route")+" was found on this host")
+    elif not validInterface(answers["USR_NETWORK_IFACE"]):
+        problems.append("USR_NETWORK_IFACE must be a network interface name (got "+repr(answers["USR_NETWORK_IFACE"])+")")
+
+    answers["USR_MAC_ADDRESS"] = take("USR_MAC_ADDRESS", DEFAULT_MAC, str, "must be a MAC address")
+    if answers["USR_MAC_ADDRESS"] == "random":
+        answers["USR_MAC_ADDRESS"] = "00:16:cb:00:"+str(random.randint(10, 50))+":"+str(random.randint(10, 50))
+    elif not re.fullmatch(r"([0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2}", answers["USR_MAC_ADDRESS"]):
+        problems.append("USR_MAC_ADDRESS must look like 00:16:cb:00:21:09 or be \"random\"")
+
+    # "download" fetches from Apple, "skip" leaves BaseSystem out, anything else is a local image
+    bootFile = take("USR_BOOT_FILE", "download", str, "must be download, skip or a file path")
+    if bootFile in ("download", "-1"):
+        answers["USR_BOOT_FILE"] = "-1"
+        if legacy or targetOS == 26:
+            problems.append("USR_BOOT_FILE can't be downloaded for "+answers["USR_TARGET_OS_NAME"]+", give a local image instead")
+    elif bootFile in ("skip", "-2"):
+        answers["USR_BOOT_FILE"] = "-2"
+    else:
+        answers["USR_BOOT_FILE"] = bootFile
+        if not bootFile.lower().endswith((".img", ".dmg")):
+            problems.append("USR_BOOT_FILE must be an .img or .dmg file (got "+repr(bootFile)+")")
+        elif not os.path.isfile(os.path.join(workdir, bootFile)):
+            problems.append("USR_BOOT_FILE "+bootFile+" does not exist")
+
+    answers["USR_SCREEN_RES"] = take("USR_SCREEN_RES", "1280x720", str, "must be a resolution")
+    if answers["USR_SCREEN_RES"] not in SCREEN_RESOLUTIONS:
+        problems.append("USR_SCREEN_RES must be one of "+", ".join(SCREEN_RESOLUTIONS))
+    elif answers["USR_SCREEN_RES"] != "1280x720" and (legacy or targetOS == 14):
+        problems.append("USR_SCREEN_RES can only be 1280x720 for "+answers["USR_TARGET_OS_NAME"])
+
+    # Only needed when several VMs must not look like the same Mac, left out of the script otherwise
+    answers["USR_SMBIOS_SERIAL"] = take("USR_SMBIOS_SERIAL", "", str, "must be a serial number")
+    if answers["USR_SMBIOS_SERIAL"] != "" and not re.fullmatch(r"[0-9A-Z]{10,17}", answers["USR_SMBIOS_SERIAL"]):
+        problems.append("USR_SMBIOS_SERIAL must be 10 to 17 upper case letters and digits (got "+repr(answers["USR_SMBIOS_SERIAL"])+")")
+    answers["USR_SMBIOS_UUID"] = take("USR_SMBIOS_UUID", "", str, "must be a UUID")
+    if answers["USR_SMBIOS_UUID"] != "" and not re.fullmatch(r"[0-9a-fA-F]{8}-([0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12}", answers["USR_SMBIOS_UUID"]):
+        problems.append("USR_SMBIOS_UUID must be a UUID such as 2f1c6a3e-5d0b-4f6e-9a1e-0c3b7d9e4a21 (got "+repr(answers["USR_SMBIOS_UUID"])+")")
+
+    answers["USR_CREATE_XML"] = "True" if take("USR_CREATE_XML", True, _bool, "must be true or false") else "False"
+    answers["USR_EXP_AUDIO"] = take("USR_EXP_AUDIO", False, _bool, "must be true or false")
+
+    # What to do when a run would clobber an existing file, instead of asking
+    answers["USR_CFG_CONFLICT"] = take("USR_CFG_CONFLICT", "rename", str, "must be a conflict policy")
+    if answers["USR_CFG_CONFLICT"] not in CFG_CONFLICT:
+        problems.append("USR_CFG_CONFLICT must be one of "+", ".join(CFG_CONFLICT))
+    elif answers["USR_CFG_CONFLICT"] == "fail" and not resume and os.path.exists(os.path.join(workdir, answers["USR_CFG"])):
+        problems.append(answers["USR_CFG"]+" already exists and USR_CFG_CONFLICT is fail")
+    answers["USR_HDD_CONFLICT"] = take("USR_HDD_CONFLICT", "rename", str, "must be a conflict policy")
+    if answers["USR_HDD_CONFLICT"] not in HDD_CONFLICT:
+        problems.append("USR_HDD_CONFLICT must be one of "+", ".join(HDD_CONFLICT))
+    elif answers["USR_HDD_CONFLICT"] == "fail" and not resume and answers["USR_HDD_SIZE"] not in ("-1", "-2") and os.path.exists(os.path.join(workdir, diskFile(answers["USR_HDD_PROFILE"]))):
+        problems.append(diskFile(answers["USR_HDD_PROFILE"])+" already exists and USR_HDD_CONFLICT is fail")
+
+    if problems:
+        raise AnswerError(problems)
+    return answers
+
+
+# Answers that the wizard stores in the preference document
+BLOB_KEYS = [
+    "USR_CFG", "USR_TARGET_OS", "USR_TARGET_OS_NAME", "USR_CPU_CORES", "USR_CPU_THREADS",
+    "USR_CPU_MODEL", "USR_CPU_FEATURE_ARGS", "USR_ALLOCATED_RAM", "USR_HDD_PATH", "USR_HDD_SIZE",
+    "USR_HDD_TYPE", "USR_NETWORK_DEVICE", "USR_MAC_ADDRESS", "USR_BOOT_FILE", "USR_SCREEN_RES",
+    "USR_CREATE_XML", "USR_HDD_ISPHYSICAL", "USR_SMBIOS_SERIAL", "USR_SMBIOS_UUID", "USR_HDD_PROFILE",
+    "USR_CPU_PINNING", "USR_MEMORY_BACKING", "USR_NETWORK_MODE", "USR_NETWORK_IFACE",
+]
+
+
+def writeBlobs(answers, blobDir=LIVE_DIR):
+    savePrefs(blobDir, {key: answers[key] for key in BLOB_KEYS})
+    with open(os.path.join(blobDir, ".cdn_control"), "w") as blob:
+        blob.write("fresh_cdn")
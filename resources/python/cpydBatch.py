@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+Batch AutoPilot runs. A batch file points at a base answer file and says
+how many VMs to make from it, as a plain count, a matrix of values to
+combine, or both. Every VM gets its own folder, MAC address, SMBIOS
+serial and UUID, and is generated by its own headless AutoPilot process.
+
+   {
+     "answers": "base.json",
+     "count": 2,
+     "matrix": {"USR_TARGET_OS": [14, 15], "USR_HDD_TYPE": ["SSD", "NVMe"]},
+     "dir": "vms",
+     "name": "{USR_TARGET_OS}-{USR_HDD_TYPE}-{index}"
+   }
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import itertools
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cpydAnswers import loadDocument, validateAnswers, AnswerError
+
+BATCH_KEYS = ["answers", "count", "matrix", "dir", "name"]
+DEFAULT_JOBS = 4
+DEFAULT_DIR = "vms"
+DEFAULT_NAME = "vm{index:02d}"
+ANSWER_FILE = "answers.json"
+OUTPUT_FILE = "autopilot.out"
+MAC_PREFIX = "00:16:cb" # same vendor prefix the wizard uses
+SERIAL_CHARS = "0123456789ABCDEFGHJKLMNPQRSTUVWXYZ" # Apple serials never use I or O
+SERIAL_LENGTH = 12
+
+
+def uniqueMac(used):
+    while True:
+        mac = MAC_PREFIX+":"+":".join("%02x" % random.randint(0, 255) for _ in range(3))
+        if mac not in used:
+            used.add(mac)
+            return mac
+
+
+def randomSerial():
+    return "".join(random.choice(SERIAL_CHARS) for _ in range(SERIAL_LENGTH))
+
+
+def loadBatch(path):
+    """
+    Read a batch file and return one entry per VM:
+    {"name", "dir", "answers"} with the answers already checked. Raises
+    AnswerError listing every problem with the batch or any of its VMs.
+    """
+    spec = loadDocument(path)
+    baseDir = os.path.dirname(os.path.abspath(path))
+    problems = []
+
+    for key in spec:
+        if key not in BATCH_KEYS:
+            problems.append("Unknown batch setting "+str(key))
+
+    base = spec.get("answers")
+    if isinstance(base, str):
+        try:
+            base = loadDocument(os.path.join(baseDir, base))
+        except AnswerError as e:
+            problems.extend(e.problems)
+            base = {}
+    elif not isinstance(base, dict):
+        problems.append("answers must be the path of an answer file or a mapping of USR_* values")
+        base = {}
+    if "USR_HDD_PATH" in base:
+        problems.append("Every VM needs its own disk, give USR_HDD_SIZE instead of USR_HDD_PATH")
+
+    count = spec.get("count", 1)
+    if isinstance(count, bool) or not isinstance(count, int) or count < 1:
+        problems.append("count must be a positive whole number (got "+repr(count)+")")
+        count = 1
+
+    matrix = spec.get("matrix", {})
+    if not isinstance(matrix, dict) or not all(isinstance(values, list) and values for values in matrix.values()):
+        problems.append("matrix must map answer names to non-empty lists of values")
+        matrix = {}
+
+    vmRoot = os.path.join(baseDir, str(spec.get("dir", DEFAULT_DIR)))
+    namePattern = str(spec.get("name", DEFAULT_NAME))
+
+    if problems:
+        raise AnswerError(problems)
+
+    keys = list(matrix)
+    vms = []
+    names = set()
+    macs = set()
+    index = 0
+    for combination in itertools.product(*[matrix[key] for key in keys]):
+        for _ in range(count):
+            index = index + 1
+            values = dict(base)
+            values.update(zip(keys, combination))
+            try:
+                name = namePattern.format(index=index, **values)
+            except (KeyError, IndexError, ValueError) as e:
+                raise AnswerError("name "+repr(namePattern)+" can't be filled in: "+str(e))
+            if name in ("", ".", "..") or "/" in name:
+                problems.append("VM name "+repr(name)+" can't be used as a folder name")
+                continue
+            if name in names:
+                problems.append("VM name "+name+" is used more than once, add {index} to the name")
+                continue
+            names.add(name)
+
+            # Copies of one answer file would otherwise all look like the same Mac on the same network
+            values["USR_MAC_ADDRESS"] = uniqueMac(macs)
+            values["USR_SMBIOS_SERIAL"] = randomSerial()
+            values["USR_SMBIOS_UUID"] = str(uuid.uuid4())
+            bootFile = str(values.get("USR_BOOT_FILE", "download"))
+            if bootFile not in ("download", "-1", "skip", "-2") and not os.path.isabs(bootFile):
+                values["USR_BOOT_FILE"] = os.path.join(baseDir, bootFile)
+
+            vmDir = os.path.join(vmRoot, name)
+            try:
+                validated = validateAnswers(values, vmDir)
+            except AnswerError as e:
+                problems.extend(name+": "+problem for problem in e.problems)
+                continue
+            vms.append({"name": name, "dir": vmDir, "answers": values, "validated": validated})
+
+    if problems:
+        raise AnswerError(problems)
+    return vms
+
+
+def lastSummary(output):
+    # Headless AutoPilot always ends with a one line JSON summary
+    for line in reversed(output.strip().splitlines()):
+        try:
+            summary = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(summary, dict):
+            return summary
+    return {}
+
+
+def runVM(vm, command, cwd):
+    start = time.monotonic()
+    os.makedirs(vm["dir"], exist_ok=True)
+    answerPath = os.path.join(vm["dir"], ANSWER_FILE)
+    with open(answerPath, "w") as answerFile:
+        json.dump(vm["answers"], answerFile, indent=2)
+    process = subprocess.run(command(vm, answerPath), cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, check=False)
+    with open(os.path.join(vm["dir"], OUTPUT_FILE), "w") as outputFile:
+        outputFile.write(process.stdout)
+    summary = lastSummary(process.stdout)
+    result = {
+        "name": vm["name"],
+        "dir": vm["dir"],
+        "status": summary.get("status", "failed"),
+        "exitCode": process.returncode,
+        "config": summary.get("config"),
+        "xml": summary.get("xml"),
+        "mac": vm["answers"]["USR_MAC_ADDRESS"],
+        "serial": vm["answers"]["USR_SMBIOS_SERIAL"],
+        "uuid": vm["answers"]["USR_SMBIOS_UUID"],
+        "time": round(time.monotonic() - start, 3),
+    }
+    if process.returncode != 0:
+        result["error"] = summary.get("error", "AutoPilot exited with status "+str(process.returncode)+", see "+OUTPUT_FILE)
+        result["failedPhase"] = summary.get("failedPhase")
+    return result
+
+
+def runBatch(vms, command, cwd, jobs=DEFAULT_JOBS, onFinish=None):
+    """
+    Generate every VM, at most `jobs` at a time. command(vm, answerPath)
+    returns the argument list that runs AutoPilot for one VM. Results
+    come back in batch order.
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        running = {pool.submit(runVM, vm, command, cwd): vm["name"] for vm in vms}
+        for job in as_completed(running):
+            result = job.result()
+            results[running[job]] = result
+            if onFinish is not None:
+                onFinish(result)
+    return [results[vm["name"]] for vm in vms]
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+AutoPilot checkpoints. Every phase that finishes records the content
+hashes of the files it produced, together with a fingerprint of the
+preferences the run was started with. A resumed run skips the phases
+whose files are still exactly as they were left, and starts again from
+the first one that isn't.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+CHECKPOINT_FILE = "checkpoint.json"
+CHECKPOINT_VERSION = 1
+HASH_LIMIT = 64 * 2 ** 20 # files up to this size are hashed in full
+SAMPLE_SIZE = 2 ** 20
+SAMPLES = 16
+
+
+def fileHash(path):
+    """
+    sha256 of the file. Large files (recovery images, disks) are hashed
+    from evenly spaced samples plus their size, inode and mtime, so a
+    write anywhere in the file, not just in a sample, still counts as a
+    change without reading gigabytes on every resume.
+    """
+    with open(path, "rb") as hashFile:
+        info = os.fstat(hashFile.fileno())
+        size = info.st_size
+        digest = hashlib.sha256()
+        if size <= HASH_LIMIT:
+            for block in iter(lambda: hashFile.read(SAMPLE_SIZE), b""):
+                digest.update(block)
+            return "sha256:"+digest.hexdigest()
+        digest.update("{}:{}:{}".format(size, info.st_ino, info.st_mtime_ns).encode())
+        for index in range(SAMPLES):
+            hashFile.seek((size - SAMPLE_SIZE) * index // (SAMPLES - 1))
+            digest.update(hashFile.read(SAMPLE_SIZE))
+    return "sha256-sampled:"+digest.hexdigest()
+
+
+def fingerprint(values):
+    return hashlib.sha256(json.dumps(values, sort_keys=True, separators=(",", ":"), default=str).encode()).hexdigest()
+
+
+class Checkpoints:
+    """
+    The checkpoints of one workspace. `inputs` is the fingerprint of what
+    the run was asked to do; checkpoints left by a run that was asked for
+    something else are thrown away.
+
+    A phase can consume a file another phase produced (apcApplyPrefs moves
+    the rendered config into place). The file then belongs to the consumer,
+    and the producer only counts as done for as long as the consumer does.
+    """
+
+    def __init__(self, root, path, inputs):
+        self.root = root
+        self.path = path
+        self.inputs = inputs
+        self.phases = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r") as checkpointFile:
+                document = json.load(checkpointFile)
+        except (OSError, ValueError):
+            return
+        if isinstance(document, dict) and document.get("version") == CHECKPOINT_VERSION and document.get("inputs") == inputs and isinstance(document.get("phases"), dict):
+            self.phases = document["phases"]
+
+    def _save(self):
+        document = {
+            "version": CHECKPOINT_VERSION,
+            "inputs": self.inputs,
+            "phases": self.phases,
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp = self.path+".tmp"
+        with open(temp, "w") as checkpointFile:
+            json.dump(document, checkpointFile, indent=2, sort_keys=True)
+            checkpointFile.flush()
+            os.fsync(checkpointFile.fileno())
+        os.replace(temp, self.path)
+
+    def record(self, phase, outputs=(), consumes=()):
+        """
+        Mark phase as done. outputs and consumes are paths relative to the
+        workspace root.
+        """
+        hashes = {name: fileHash(os.path.join(self.root, name)) for name in outputs}
+        with self._lock:
+            for other, entry in self.phases.items():
+                for name in list(entry["outputs"]):
+                    if name in hashes or name in consumes:
+                        # Whoever touched the file last answers for it
+                        del entry["outputs"][name]
+                        if name in consumes and phase not in entry["consumedBy"]:
+                            entry["consumedBy"].append(phase)
+            self.phases[phase] = {"finished": int(time.time()), "outputs": hashes, "consumedBy": []}
+            self._save()
+
+    def isDone(self, phase, checking=()):
+        entry = self.phases.get(phase)
+        if entry is None or phase in checking:
+            return False
+        for name, recorded in entry["outputs"].items():
+            try:
+                if fileHash(os.path.join(self.root, name)) != recorded:
+                    return False
+            except OSError:
+                return False
+        return all(self.isDone(consumer, checking + (phase,)) for consumer in entry["consumedBy"])
+
+    def forget(self, phases):
+        with self._lock:
+            for phase in phases:
+                self.phases.pop(phase, None)
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self.phases = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+Parser for the Apple recovery chunklist (CNKL) that accompanies every
+BaseSystem.dmg. Each entry holds the size and SHA-256 of one chunk of
+the image, so the image can be checked piece by piece while it streams.
+"""
+
+import struct
+import hashlib
+
+CHUNKLIST_MAGIC = b'CNKL'
+CHUNKLIST_HEADER = struct.Struct('<4sIBBBxQQQ')
+CHUNKLIST_ENTRY = struct.Struct('<I32s')
+CHUNK_METHOD_SHA256 = 1
+SIGNATURE_METHOD_RSA = 1
+SIGNATURE_METHOD_DIGEST = 2
+
+
+class ChunklistError(ValueError):
+    pass
+
+
+class Chunk:
+    """
+    A single verifiable range of the image.
+    """
+    def __init__(self, offset, size, digest):
+        self.offset = offset
+        self.size = size
+        self.digest = digest
+
+    @property
+    def end(self):
+        return self.offset + self.size - 1
+
+
+def parseChunklist(data):
+    if len(data) < CHUNKLIST_HEADER.size:
+        raise ChunklistError('Chunklist is too short')
+
+    magic, headerSize, fileVersion, chunkMethod, signatureMethod, chunkCount, chunkOffset, signatureOffset = CHUNKLIST_HEADER.unpack_from(data)
+
+    if magic != CHUNKLIST_MAGIC or headerSize != CHUNKLIST_HEADER.size:
+        raise ChunklistError('Not a chunklist')
+    if fileVersion != 1 or chunkMethod != CHUNK_METHOD_SHA256:
+        raise ChunklistError('Unsupported chunklist version {} / method {}'.format(fileVersion, chunkMethod))
+    if chunkCount == 0 or signatureOffset != chunkOffset + CHUNKLIST_ENTRY.size * chunkCount or len(data) < signatureOffset:
+        raise ChunklistError('Chunklist is truncated or malformed')
+
+    # The trailing signature covers the header and all entries
+    if signatureMethod == SIGNATURE_METHOD_DIGEST:
+        expected = data[signatureOffset:signatureOffset + 32]
+        if hashlib.sha256(data[:signatureOffset]).digest() != expected:
+            raise ChunklistError('Chunklist digest does not match')
+
+    chunks = []
+    offset = 0
+    for index in range(chunkCount):
+        size, digest = CHUNKLIST_ENTRY.unpack_from(data, chunkOffset + index * CHUNKLIST_ENTRY.size)
+        chunks.append(Chunk(offset, size, digest))
+        offset += size
+    return chunks
+
+
+def chunklistLength(chunks):
+    return sum(chunk.size for chunk in chunks)
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+Multi-connection ranged downloader used by the recovery image scripts.
+The file is split into HTTP Range segments which are fetched in parallel
+over a bounded worker pool and written straight to their offsets.
+
+Data is written to a ".part" file next to the target, with a small JSON
+manifest recording the finished segments so an interrupted download can
+be picked up again on the next run.
+
+When a chunklist is supplied, segments follow its chunk boundaries and
+every chunk is hashed as it arrives. A chunk that fails is fetched again
+on its own, so the finished file never has to be read a second time.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from urllib.parse import urlparse
+from cpydHTTP import getPool
+
+DEFAULT_CONNECTIONS = 4
+MAX_CONNECTIONS = 16
+SEGMENT_SIZE = 16 * 2 ** 20
+READ_SIZE = 2 ** 20
+SEGMENT_RETRIES = 3
+PART_SUFFIX = '.part'
+MANIFEST_SUFFIX = '.part.json'
+MANIFEST_VERSION = 1
+
+
+class DownloadError(RuntimeError):
+    pass
+
+
+class VerificationError(DownloadError):
+    pass
+
+
+def preallocate(fd, length):
+    # Reserve the whole file up front so parallel segments don't fragment it
+    try:
+        os.posix_fallocate(fd, 0, length)
+    except (AttributeError, OSError):
+        os.ftruncate(fd, length)
+
+
+class RangedDownload:
+    """
+    Download a single URL into a file using several ranged connections.
+
+    If the server does not honour Range requests, the download falls back
+    to a single sequential stream, exactly like the old behaviour.
+    """
+
+    def __init__(self, url, headers, path, connections=DEFAULT_CONNECTIONS, segmentSize=SEGMENT_SIZE, session=None, chunklist=None):
+        self.url = url
+        self.headers = dict(headers)
+        self.path = path
+        self.partPath = path + PART_SUFFIX
+        self.manifestPath = path + MANIFEST_SUFFIX
+        self.session = session
+        self.chunks = {(chunk.offset, chunk.end): chunk.digest for chunk in chunklist} if chunklist else None
+        self.verified = None
+        self.mismatches = 0
+        self.onSegment = None
+        self.connections = max(1, min(int(connections), MAX_CONNECTIONS))
+        self.segmentSize = segmentSize
+        self.length = 0
+        self.received = 0
+        self.ranged = False
+        self.resumed = 0
+        self.completed = set()
+        self.error = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+
+    def _open(self, start=None, end=None):
+        headers = dict(self.headers)
+        if start is not None:
+            headers['Range'] = 'bytes={}-{}'.format(start, end)
+        return getPool().request('GET', self.url, headers)
+
+    def probe(self):
+        response = self._open(0, 0)
+        try:
+            contentRange = response.headers.get('content-range')
+            if response.status == 206 and contentRange is not None and '/' in contentRange:
+                self.length = int(contentRange.split('/')[-1])
+                self.ranged = self.connections > 1
+            else:
+                self.length = int(response.headers['content-length'])
+                self.ranged = False
+        finally:
+            response.close()
+        return self.length
+
+    def segments(self):
+        if self.chunks is not None:
+            return sorted(self.chunks)
+        return [(start, min(start + self.segmentSize, self.length) - 1)
+                for start in range(0, self.length, self.segmentSize)]
+
+    def loadManifest(self):
+        # Only trust a manifest that describes this exact image and still has its .part file
+        self.completed = set()
+        self.resumed = 0
+        try:
+            with open(self.manifestPath, 'r') as manifestFile:
+                manifest = json.load(manifestFile)
+            if manifest.get('version') != MANIFEST_VERSION:
+                return 0
+            if manifest.get('path') != urlparse(self.url).path or manifest.get('length') != self.length:
+                return 0
+            if manifest.get('verified', False) != (self.chunks is not None):
+                return 0
+            if not os.path.exists(self.partPath) or os.path.getsize(self.partPath) != self.length:
+                return 0
+            completed = set(tuple(segment) for segment in manifest.get('completed', []))
+        except (OSError, ValueError, TypeError):
+            return 0
+        self.completed = completed & set(self.segments())
+        self.resumed = sum(end - start + 1 for start, end in self.completed)
+        self.received = self.resumed
+        return self.resumed
+
+    def saveManifest(self):
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'path': urlparse(self.url).path,
+            'session': self.session,
+            'length': self.length,
+            'segmentSize': self.segmentSize,
+            'verified': self.chunks is not None,
+            'completed': sorted(self.completed)
+        }
+        # Write to a temporary file first so a crash never leaves a half-written manifest
+        tempPath = self.manifestPath + '.tmp'
+        with open(tempPath, 'w') as manifestFile:
+            json.dump(manifest, manifestFile)
+        os.replace(tempPath, self.manifestPath)
+
+    def discardManifest(self):
+        for path in (self.manifestPath, self.manifestPath + '.tmp'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _markComplete(self, start, end):
+        with self._lock:
+            self.completed.add((start, end))
+            self.saveManifest()
+        if self.onSegment is not None:
+            self.onSegment(start, end)
+
+    def readRange(self, start, end):
+        response = self._open(start, end)
+        try:
+            if response.status != 206:
+                raise DownloadError('Server ignored range request for bytes {}-{}'.format(start, end))
+            return response.read()
+        finally:
+            response.close()
+
+    def _advance(self, count):
+        with self._lock:
+            self.received += count
+
+    def _fetchSegment(self, fd, start, end):
+        attempt = 0
+        digest = self.chunks.get((start, end)) if self.chunks is not None else None
+        while True:
+            offset = start
+            hasher = hashlib.sha256() if digest is not None else None
+            try:
+                response = self._open(start, end)
+                try:
+                    if response.status != 206:
+                        raise DownloadError('Server ignored range request for bytes {}-{}'.format(start, end))
+                    while offset <= end:
+                        chunk = response.read(min(READ_SIZE, end - offset + 1))
+                        if not chunk:
+                            break
+                        if hasher is not None:
+                            hasher.update(chunk)
+                        os.pwrite(fd, chunk, offset)
+                        offset += len(chunk)
+                        self._advance(len(chunk))
+                finally:
+                    response.close()
+                if offset <= end:
+                    raise DownloadError('Segment {}-{} ended early at {}'.format(start, end, offset))
+                if hasher is not None and hasher.digest() != digest:
+                    with self._lock:
+                        self.mismatches += 1
+                    raise VerificationError('Chunk {}-{} failed verification'.format(start, end))
+                self._markComplete(start, end)
+                return
+            except Exception:
+                # Roll back the progress of this attempt before retrying the segment
+                self._advance(start - offset)
+                attempt += 1
+                if attempt >= SEGMENT_RETRIES:
+                    raise
+
+    def _fetchStream(self, fd):
+        # Without Range support a bad chunk can't be fetched again on its own,
+        # so chunks are still hashed in order but a mismatch fails the download
+        pending = [(start, end, self.chunks[(start, end)]) for start, end in self.segments()] if self.chunks is not None else []
+        hasher = hashlib.sha256()
+        response = self._open()
+        try:
+            offset = 0
+            while True:
+                chunk = response.read(READ_SIZE)
+                if not chunk:
+                    break
+                os.pwrite(fd, chunk, offset)
+                base = offset
+                offset += len(chunk)
+                self._advance(len(chunk))
+                position = base
+                while pending and position < offset:
+                    start, end, digest = pending[0]
+                    take = min(offset, end + 1) - position
+                    hasher.update(chunk[position - base:position - base + take])
+                    position += take
+                    if position > end:
+                        if hasher.digest() != digest:
+                            self.mismatches += 1
+                            raise VerificationError('Chunk {}-{} failed verification'.format(start, end))
+                        pending.pop(0)
+                        hasher = hashlib.sha256()
+        finally:
+            response.close()
+        if pending:
+            raise DownloadError('Download ended early at {}'.format(offset))
+
+    def _run(self):
+        fd = None
+        try:
+            if not self.ranged:
+                # A plain stream can't be resumed, so start over
+                self.discardManifest()
+            flags = os.O_RDWR | os.O_CREAT
+            if not self.completed:
+                flags |= os.O_TRUNC
+            fd = os.open(self.partPath, flags, 0o644)
+            preallocate(fd, self.length)
+            if self.ranged:
+                if not self.completed:
+                    self.saveManifest()
+                pending = [segment for segment in self.segments() if segment not in self.completed]
+                pool = ThreadPoolExecutor(max_workers=self.connections)
+                try:
+                    jobs = [pool.submit(self._fetchSegment, fd, start, end) for start, end in pending]
+                    for job in as_completed(jobs):
+                        job.result()
+                finally:
+                    # The first failure drops the queued segments; running ones still write to fd, so wait for them
+                    pool.shutdown(wait=True, cancel_futures=True)
+            else:
+                self._fetchStream(fd)
+            os.close(fd)
+            fd = None
+            if self.chunks is not None:
+                self.verified = True
+            os.replace(self.partPath, self.path)
+            self.discardManifest()
+        except Exception as e:
+            if isinstance(e, VerificationError):
+                self.verified = False
+            self.error = e
+        finally:
+            if fd is not None:
+                os.close(fd)
+            self._done.set()
+
+    def start(self):
+        if self.length == 0:
+            self.probe()
+        if self.chunks is not None and sum(end - start + 1 for start, end in self.chunks) != self.length:
+            raise VerificationError('Chunklist covers a different size than the image')
+        if self.ranged:
+            self.loadManifest()
+            if self.onSegment is not None:
+                for start, end in sorted(self.completed):
+                    self.onSegment(start, end)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def close(self):
+        if self._thread is not None:
+            self._thread.join()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+Small pooled HTTP client used for all osrecovery traffic. Connections are
+kept alive and handed back to a per-host pool once a response has been
+read, so repeated queries don't pay for a new handshake every time.
+Failed requests are retried with exponential backoff.
+"""
+
+import time
+import threading
+import http.client
+from urllib.parse import urlparse, urljoin
+from urllib.error import HTTPError
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+MAX_IDLE = 16
+MAX_REDIRECTS = 5
+RETRY_STATUS = (500, 502, 503, 504)
+REDIRECT_STATUS = (301, 302, 303, 307, 308)
+
+
+class PooledResponse:
+    """
+    Wraps an http.client response so the connection goes back to the pool
+    once the body has been read in full, and is dropped otherwise.
+    """
+
+    def __init__(self, pool, key, conn, response, url):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def info(self):
+        return self.headers
+
+    def getcode(self):
+        return self.status
+
+    def read(self, amt=None):
+        data = self._response.read(amt)
+        if self._response.isclosed():
+            self._release()
+        return data
+
+    def _release(self):
+        if self._conn is not None:
+            if self._response.will_close:
+                self._conn.close()
+            else:
+                self._pool._put(self._key, self._conn)
+            self._conn = None
+
+    def close(self):
+        if self._conn is None:
+            return
+        if self._response.isclosed():
+            self._release()
+        else:
+            # Unread body left on the socket, so it can't be reused
+            self._response.close()
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of keep-alive connections keyed by scheme, host and port.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, maxIdle=MAX_IDLE):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.maxIdle = maxIdle
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        scheme, host, port = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout), False
+        return http.client.HTTPConnection(host, port, timeout=self.timeout), False
+
+    def _put(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxIdle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def _send(self, method, url, headers, body):
+        purl = urlparse(url)
+        key = (purl.scheme, purl.hostname, purl.port or (443 if purl.scheme == 'https' else 80))
+        path = purl.path or '/'
+        if purl.query:
+            path += '?' + purl.query
+
+        attempt = 0
+        while True:
+            conn, reused = self._get(key)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                # A kept-alive socket may have been closed by the server while idle
+                if reused:
+                    continue
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+                continue
+
+            if response.status in RETRY_STATUS and attempt < self.retries:
+                response.read()
+                conn.close()
+                attempt += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+                continue
+            return PooledResponse(self, key, conn, response, url)
+
+    def request(self, method, url, headers=None, body=None):
+        headers = dict(headers or {})
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._send(method, url, headers, body)
+            if response.status not in REDIRECT_STATUS or response.headers.get('location') is None:
+                break
+            location = urljoin(url, response.headers['location'])
+            response.read()
+            response.close()
+            if urlparse(location).hostname != urlparse(url).hostname:
+                headers = {name: value for name, value in headers.items() if name.lower() != 'host'}
+            if response.status == 303:
+                method, body = 'GET', None
+            url = location
+
+        if response.status >= 400:
+            message = response.reason
+            response.read()
+            response.close()
+            raise HTTPError(url, response.status, message, response.headers, None)
+        return response
+
+
+_sharedPool = None
+_sharedLock = threading.Lock()
+
+
+def getPool():
+    global _sharedPool
+    with _sharedLock:
+        if _sharedPool is None:
+            _sharedPool = ConnectionPool()
+        return _sharedPool
+
+
+def configure(timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    pool = getPool()
+    pool.timeout = timeout
+    pool.retries = retries
+    pool.backoff = backoff
+    return pool
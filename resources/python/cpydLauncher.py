@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+Boots a VM from its generated boot script without running the script.
+The header variables and the args array are read from the script, QEMU
+is started in a process group of its own, and its vCPU threads are
+pinned once they exist. Only the processes and devices the launcher
+started itself are stopped again, so any number of VMs can be started
+and stopped side by side.
+"""
+
+import os
+import re
+import sys
+import time
+import shlex
+import signal
+import threading
+import subprocess
+from cpydTopology import parseCpuList
+from cpydMemory import PAGE_SIZES, readHugepages, sizeKiB
+
+QEMU = "qemu-system-x86_64"
+PIN_TIMEOUT = 30 # seconds for QEMU to start its vCPU threads
+STOP_TIMEOUT = 15 # seconds for QEMU to shut down before it is killed
+VARIABLE = re.compile(r"\$(?:\{([A-Za-z_][A-Za-z0-9_]*)\}|([A-Za-z_][A-Za-z0-9_]*))")
+VCPU_THREAD = re.compile(r"^CPU ([0-9]+)/KVM$")
+
+
+class LaunchError(RuntimeError):
+    pass
+
+
+def expandVariables(text, values):
+    # Unset variables are empty, as in bash
+    return VARIABLE.sub(lambda match: values.get(match.group(1) or match.group(2), os.environ.get(match.group(1) or match.group(2), "")), text)
+
+
+def loadBootScript(path):
+    """
+    The header variables and QEMU arguments of a boot script, {"vars",
+    "args"}. The arguments are split the way bash splits them, with
+    variables left to expandArgs.
+    """
+    try:
+        with open(path, "r") as scriptFile:
+            lines = scriptFile.read().splitlines()
+    except OSError as e:
+        raise LaunchError("Can't read "+path+": "+str(e)) from e
+
+    values = {}
+    argLines = None
+    for line in lines:
+        if argLines is not None:
+            if line.strip() == ")":
+                break
+            argLines.append(line)
+        elif line.strip() == "args=(":
+            argLines = []
+        else:
+            assignment = re.match(r"^([A-Za-z_][A-Za-z0-9_]*)=(.*)$", line)
+            if assignment is None:
+                continue
+            try:
+                words = shlex.split(assignment.group(2), comments=True)
+            except ValueError:
+                continue
+            values[assignment.group(1)] = expandVariables(words[0], values) if words else ""
+    else:
+        raise LaunchError(path+" has no args array, it wasn't made by AutoPilot")
+
+    try:
+        args = shlex.split("\n".join(argLines), comments=True)
+    except ValueError as e:
+        raise LaunchError("Can't read the args array of "+path+": "+str(e)) from e
+    return {"vars": values, "args": args}
+
+
+def expandArgs(args, values):
+    return [expandVariables(arg, values) for arg in args]
+
+
+def missingHugepages(values):
+    """
+    How many more free hugepages the VM needs than the host has now, 0 if
+    it doesn't use hugepages.
+    """
+    pageSize = PAGE_SIZES.get(values.get("MEMORY_BACKING", ""))
+    if pageSize is None:
+        return 0
+    try:
+        needed = -(-sizeKiB(values.get("ALLOCATED_RAM", "")) // pageSize)
+    except ValueError:
+        return 0
+    return max(0, needed - readHugepages().get(pageSize, {}).get("free", 0))
+
+
+def qemuThreads(pid):
+    """
+    {thread id: name} of a running process, empty once it has exited.
+    """
+    threads = {}
+    try:
+        tids = os.listdir("/proc/"+str(pid)+"/task")
+    except OSError:
+        return {}
+    for tid in tids:
+        try:
+            with open("/proc/"+str(pid)+"/task/"+tid+"/comm", "r") as commFile:
+                threads[int(tid)] = commFile.read().strip()
+        except (OSError, ValueError):
+            continue
+    return threads
+
+
+def pinThreads(pid, vcpuPins, emulatorPins, timeout=PIN_TIMEOUT):
+    """
+    Once QEMU has started every vCPU thread ("CPU <n>/KVM", named because of
+    debug-threads=on), give each one its host CPU and every other thread
+    (the main loop, I/O threads, workers) the emulator CPUs. Returns the
+    number of vCPU threads pinned.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        threads = qemuThreads(pid)
+        vcpus = {}
+        for tid, name in threads.items():
+            match = VCPU_THREAD.match(name)
+            if match is not None:
+                vcpus[tid] = int(match.group(1))
+        if len(vcpus) >= len(vcpuPins) or not threads or time.monotonic() > deadline:
+            break
+        time.sleep(0.1)
+
+    pinned = 0
+    for tid in threads:
+        if tid in vcpus and vcpus[tid] < len(vcpuPins):
+            cpus = {vcpuPins[vcpus[tid]]}
+        elif emulatorPins:
+            cpus = set(emulatorPins)
+        else:
+            continue
+        try:
+            os.sched_setaffinity(tid, cpus)
+        except OSError:
+            # The thread is gone, or the CPU is offline
+            continue
+        if tid in vcpus:
+            pinned += 1
+    return pinned
+
+
+class Launcher:
+    """
+    One VM, booted from its boot script. QEMU runs in a process group of
+    its own, so a Ctrl+C or a signal meant for the launcher reaches it only
+    as an orderly shutdown, and the launcher never stops processes (or
+    removes devices) that belong to another VM.
+    """
+
+    def __init__(self, path, discordRPC=True):
+        self.path = path
+        script = loadBootScript(path)
+        self.values = script["vars"]
+        self.args = script["args"]
+        self.discordRPC = discordRPC and self.values.get("DISCORD_RPC") == "1"
+        self.helpers = []
+        self.fds = []
+        self.macvtap = None
+        self.qemu = None
+        self.pinned = None
+        self.stopping = None
+
+    def command(self):
+        args = expandArgs(self.args, self.values)
+        if self.values.get("VCPU_PINS") and not any("debug-threads=on" in arg for arg in args):
+            args += ["-name", self.values.get("OS_ID", "macOS")+",debug-threads=on"]
+        return [QEMU] + args
+
+    def _prepareNetwork(self):
+        # The guest's macvtap device, opened once for every queue
+        if self.values.get("NETWORK_MODE") != "macvtap":
+            return
+        name = self.values.get("MACVTAP", "")
+        try:
+            if not os.path.exists("/sys/class/net/"+name):
+                subprocess.run(["ip", "link", "add", "link", self.values.get("NETWORK_IFACE", ""), "name", name, "address", self.values.get("MAC_ADDRESS", ""), "type", "macvtap", "mode", "bridge"], check=True)
+                self.macvtap = name
+            subprocess.run(["ip", "link", "set", name, "up"], check=True)
+            with open("/sys/class/net/"+name+"/ifindex", "r") as indexFile:
+                tapPath = "/dev/tap"+indexFile.read().strip()
+            for _ in range(int(self.values.get("NETWORK_QUEUES") or 1)):
+                self.fds.append(os.open(tapPath, os.O_RDWR))
+        except (OSError, ValueError, subprocess.CalledProcessError) as e:
+            raise LaunchError("Can't set up macvtap device "+name+": "+str(e)) from e
+        self.values["MACVTAP_FDS"] = ":".join(str(fd) for fd in self.fds)
+
+    def _startHelpers(self):
+        if self.discordRPC:
+            repoPath = self.values.get("REPO_PATH", ".")
+            try:
+                self.helpers.append(subprocess.Popen([sys.executable, os.path.join(repoPath, "scripts", "drpc.py"), "--os", self.values.get("OS_ID", ""), "--pt", self.values.get("VFIO_DEVICES", "0"), "--wd", repoPath, "--show", self.values.get("DISCORD_RPC_IMG", "default")]))
+            except OSError:
+                # Rich presence is a nicety, the VM boots without it
+                pass
+
+    def _pin(self):
+        vcpuPins = [int(cpu) for cpu in self.values.get("VCPU_PINS", "").split()]
+        emulatorPins = parseCpuList(self.values.get("EMULATOR_PINS", ""))
+        self.pinned = pinThreads(self.qemu.pid, vcpuPins, emulatorPins)
+
+    def stop(self, *_):
+        """
+        Ask QEMU to shut down. Safe to call from a signal handler.
+        """
+        if self.qemu is not None and self.qemu.returncode is None:
+            if self.stopping is None:
+                self.stopping = time.monotonic()
+            try:
+                os.killpg(self.qemu.pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    def run(self):
+        """
+        Boot the VM and wait for QEMU to exit. Returns QEMU's exit code.
+        """
+        try:
+            self._prepareNetwork()
+            self._startHelpers()
+            try:
+                self.qemu = subprocess.Popen(self.command(), pass_fds=self.fds, start_new_session=True)
+            except OSError as e:
+                raise LaunchError("Can't start "+QEMU+": "+str(e)) from e
+            # QEMU has its own copies now
+            for fd in self.fds:
+                os.close(fd)
+            self.fds = []
+            if self.values.get("VCPU_PINS"):
+                threading.Thread(target=self._pin, daemon=True).start()
+
+            while True:
+                try:
+                    return self.qemu.wait(timeout=1)
+                except subprocess.TimeoutExpired:
+                    if self.stopping is not None and time.monotonic() - self.stopping > STOP_TIMEOUT:
+                        try:
+                            os.killpg(self.qemu.pid, signal.SIGKILL)
+                        except OSError:
+                            pass
+        finally:
+            self.cleanup()
+
+    def cleanup(self):
+        """
+        Stop this VM's own helpers and remove the devices made for it.
+        """
+        for helper in self.helpers:
+            if helper.poll() is None:
+                helper.terminate()
+                try:
+                    helper.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    helper.kill()
+        self.helpers = []
+        for fd in self.fds:
+            os.close(fd)
+        self.fds = []
+        if self.macvtap is not None:
+            subprocess.run(["ip", "link", "delete", self.macvtap], check=False)
+            self.macvtap = None
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+Guest memory backing. Backing the guest's RAM with 2M or 1G hugepages
+cuts the TLB misses and page faults a macOS guest otherwise takes on
+every new page, but only pages the host has reserved ahead of time can
+be used. The host's reservations are read from /proc/meminfo and
+/sys/kernel/mm/hugepages.
+
+   off        ordinary memory, faulted in as the guest touches it
+   prealloc   ordinary memory, all of it allocated when QEMU starts
+   2M, 1G     hugepages of that size, allocated when QEMU starts
+   auto       the largest hugepages the host has enough of, else off
+
+Each VM's pages are kept in a host registry, so the number of pages the
+whole fleet needs (nr_hugepages) can be worked out.
+"""
+
+import os
+import time
+from cpydStorage import unescapeMount
+from cpydWorkspace import HostRegistry
+
+MEMORY_BACKINGS = ["auto", "off", "prealloc", "2M", "1G"]
+DEFAULT_BACKING = "auto"
+PAGE_SIZES = {"1G": 1048576, "2M": 2048} # KiB, largest first
+HUGEPAGES_DIR = "/sys/kernel/mm/hugepages"
+REGISTRY_FILE = "hugepages.json"
+UNITS = {"K": 1, "M": 1024, "G": 1048576}
+
+
+def readMeminfo(path="/proc/meminfo"):
+    """
+    /proc/meminfo as {name: value}, values in KiB (page counts for the
+    HugePages_ lines). Empty if it can't be read.
+    """
+    info = {}
+    try:
+        with open(path, "r") as meminfo:
+            for line in meminfo:
+                name, _, value = line.partition(":")
+                fields = value.split()
+                if fields and fields[0].isdigit():
+                    info[name.strip()] = int(fields[0])
+    except OSError:
+        return {}
+    return info
+
+
+def readHugepages(root=HUGEPAGES_DIR):
+    """
+    Hugepage pools of the host, {page size in KiB: {"total", "free",
+    "reserved", "surplus"}}. A size the host supports but hasn't reserved
+    any of has a total of 0.
+    """
+    pools = {}
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return {}
+    for name in names:
+        if not (name.startswith("hugepages-") and name.endswith("kB") and name[10:-2].isdigit()):
+            continue
+        counts = {}
+        for key, fileName in (("total", "nr_hugepages"), ("free", "free_hugepages"), ("reserved", "resv_hugepages"), ("surplus", "surplus_hugepages")):
+            try:
+                with open(os.path.join(root, name, fileName), "r") as countFile:
+                    counts[key] = int(countFile.read().strip())
+            except (OSError, ValueError):
+                counts[key] = 0
+        pools[int(name[10:-2])] = counts
+    return pools
+
+
+def pageLabel(pageSize):
+    for label, size in PAGE_SIZES.items():
+        if size == pageSize:
+            return label
+    return str(pageSize)+"K"
+
+
+def sizeKiB(text):
+    """
+    "8G" -> 8388608
+    """
+    text = str(text).strip().upper().rstrip("B")
+    if text[-1:] in UNITS:
+        return int(text[:-1]) * UNITS[text[-1]]
+    return int(text) // 1024
+
+
+def hugetlbfsMount(pageSize, defaultPageSize=None):
+    """
+    Where a hugetlbfs of pageSize KiB pages is mounted, or None. A mount
+    without a pagesize option uses the default hugepage size.
+    """
+    if defaultPageSize is None:
+        defaultPageSize = readMeminfo().get("Hugepagesize")
+    try:
+        with open("/proc/mounts", "r") as mounts:
+            for line in mounts:
+                fields = line.split()
+                if len(fields) < 4 or fields[2] != "hugetlbfs":
+                    continue
+                size = defaultPageSize
+                for option in fields[3].split(","):
+                    if option.startswith("pagesize="):
+                        try:
+                            size = sizeKiB(option[9:])
+                        except ValueError:
+                            size = None
+                if size == pageSize:
+                    return unescapeMount(fields[1])
+    except OSError:
+        return None
+    return None
+
+
+def reserveCommand(pageSize, pages):
+    return "echo "+str(pages)+" | sudo tee "+HUGEPAGES_DIR+"/hugepages-"+str(pageSize)+"kB/nr_hugepages"
+
+
+def planMemory(ramKiB, backing, pools, fleet=None):
+    """
+    How to back ramKiB of guest memory. pools is readHugepages(), fleet the
+    pages of each size other VMs on the host already count on. Returns
+    {"backing" ("hugepages", "prealloc" or ""), "pageSize", "pages",
+    "needed" (by the whole fleet, this VM included), "enough", "reason"}.
+    """
+    fleet = fleet or {}
+    plan = {"backing": "", "pageSize": None, "pages": 0, "needed": 0, "enough": True, "reason": "ordinary memory"}
+    if backing == "prealloc":
+        plan.update(backing="prealloc", reason="ordinary memory, allocated up front")
+        return plan
+    if backing == "off":
+        return plan
+
+    def fits(pageSize):
+        pool = pools[pageSize]
+        pages = -(-ramKiB // pageSize)
+        needed = fleet.get(pageSize, 0) + pages
+        return pages, needed, pool["free"] - pool["reserved"] >= pages and pool["total"] >= needed
+
+    if backing == "auto":
+        for label, pageSize in PAGE_SIZES.items():
+            if pageSize in pools and ramKiB % pageSize == 0:
+                pages, needed, enough = fits(pageSize)
+                if enough:
+                    plan.update(backing="hugepages", pageSize=pageSize, pages=pages, needed=needed, reason=str(pages)+" "+label+" hugepages, enough are reserved")
+                    return plan
+        if any(pool["total"] > 0 for pool in pools.values()):
+            plan["reason"] = "ordinary memory, not enough hugepages are left for it"
+        return plan
+
+    pageSize = PAGE_SIZES[backing]
+    if pageSize not in pools:
+        plan["reason"] = "ordinary memory, the host doesn't support "+backing+" hugepages"
+        plan["enough"] = False
+        return plan
+    pages, needed, enough = fits(pageSize)
+    plan.update(backing="hugepages", pageSize=pageSize, pages=pages, needed=needed, enough=enough)
+    if enough:
+        plan["reason"] = str(pages)+" "+backing+" hugepages, enough are reserved"
+    else:
+        plan["reason"] = str(pages)+" "+backing+" hugepages, but only "+str(max(0, pools[pageSize]["free"] - pools[pageSize]["reserved"]))+" are free and "+str(pools[pageSize]["total"])+" reserved for the "+str(needed)+" the host's VMs need"
+    return plan
+
+
+def fleetNeeds(entries):
+    needs = {}
+    for entry in entries.values():
+        needs[entry["pageSize"]] = needs.get(entry["pageSize"], 0) + entry["pages"]
+    return needs
+
+
+def fleetPlan(entries, pools):
+    """
+    The nr_hugepages every page size needs for all registered VMs to run
+    at once: {label: {"pageSize", "vms", "needed", "reserved", "missing",
+    "command"}}.
+    """
+    plan = {}
+    for pageSize, needed in sorted(fleetNeeds(entries).items()):
+        reserved = pools.get(pageSize, {}).get("total", 0)
+        plan[pageLabel(pageSize)] = {
+            "pageSize": pageSize,
+            "vms": sorted(key for key, entry in entries.items() if entry["pageSize"] == pageSize),
+            "needed": needed,
+            "reserved": reserved,
+            "missing": max(0, needed - reserved),
+            "command": reserveCommand(pageSize, needed),
+        }
+    return plan
+
+
+class HugepageRegistry(HostRegistry):
+    """
+    The hugepages each VM on the host is generated to use, keyed by its
+    boot script.
+    """
+
+    def __init__(self, folder):
+        super().__init__(folder, REGISTRY_FILE)
+
+    def reserve(self, key, ramKiB, backing, pools):
+        """
+        Plan the VM's memory against what the rest of the fleet already
+        counts on, and record its hugepages if it uses any.
+        """
+        with self.edit() as entries:
+            entries.pop(key, None)
+            plan = planMemory(ramKiB, backing, pools, fleetNeeds(entries))
+            if plan["backing"] == "hugepages":
+                entries[key] = {"pageSize": plan["pageSize"], "pages": plan["pages"], "pid": os.getpid(), "created": int(time.time())}
+        return plan
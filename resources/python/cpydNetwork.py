@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+Guest networking. User mode networking (slirp) works anywhere without
+setup, but every packet goes through QEMU's own TCP/IP stack. The other
+modes put the guest straight onto a host interface through a tap device,
+with the kernel's vhost-net moving the packets for virtio-net guests, and
+one queue per vCPU so several connections don't share one.
+
+   user      slirp, no setup, slowest
+   bridge    a tap on an existing host bridge, made by qemu-bridge-helper
+   tap       an existing (persistent, multi_queue) tap device
+   macvtap   a macvtap device on a host NIC, made when the VM starts
+"""
+
+import os
+import re
+
+NETWORK_MODES = ["user", "bridge", "tap", "macvtap"]
+DEFAULT_MODE = "user"
+DEFAULT_TAP = "tap0"
+PREFERRED_BRIDGES = ("br0", "virbr0")
+VIRTIO_DEVICES = ("virtio-net", "virtio-net-pci")
+SYSFS_NET = "/sys/class/net"
+BRIDGE_HELPERS = ("/usr/lib/qemu/qemu-bridge-helper", "/usr/libexec/qemu-bridge-helper", "/usr/lib/qemu-bridge-helper")
+BRIDGE_CONF = "/etc/qemu/bridge.conf"
+MAX_QUEUES = 256 # tap devices can't have more
+
+
+def validInterface(name):
+    return re.fullmatch(r"[A-Za-z0-9_.:-]{1,15}", name) is not None
+
+
+def interfaceExists(name):
+    return os.path.exists(os.path.join(SYSFS_NET, name))
+
+
+def isBridge(name):
+    return os.path.isdir(os.path.join(SYSFS_NET, name, "bridge"))
+
+
+def hostBridges():
+    try:
+        names = sorted(os.listdir(SYSFS_NET))
+    except OSError:
+        return []
+    bridges = [name for name in names if isBridge(name)]
+    return sorted(bridges, key=lambda name: PREFERRED_BRIDGES.index(name) if name in PREFERRED_BRIDGES else len(PREFERRED_BRIDGES))
+
+
+def defaultRouteInterface():
+    """
+    The host NIC the default route goes out of, or None.
+    """
+    try:
+        with open("/proc/net/route", "r") as routes:
+            next(routes, None)
+            for line in routes:
+                fields = line.split()
+                if len(fields) > 1 and fields[1] == "00000000":
+                    return fields[0]
+    except OSError:
+        return None
+    return None
+
+
+def defaultInterface(mode):
+    """
+    What USR_NETWORK_IFACE is when it isn't given, or None if the host has
+    nothing suitable.
+    """
+    if mode == "bridge":
+        bridges = hostBridges()
+        return bridges[0] if bridges else None
+    if mode == "tap":
+        return DEFAULT_TAP
+    if mode == "macvtap":
+        return defaultRouteInterface()
+    return ""
+
+
+def bridgeHelper():
+    for helper in BRIDGE_HELPERS:
+        if os.path.isfile(helper):
+            return helper
+    return None
+
+
+def bridgeAllowed(bridge):
+    """
+    Whether qemu-bridge-helper may use bridge, None if its config can't be
+    read (it usually belongs to root).
+    """
+    try:
+        with open(BRIDGE_CONF, "r") as conf:
+            lines = [line.split("#", 1)[0].split() for line in conf]
+    except OSError:
+        return None
+    return any(len(line) == 2 and line[0] == "allow" and line[1] in (bridge, "all") for line in lines)
+
+
+def macvtapName(mac):
+    # Unique per guest, and at 15 characters just fits
+    return "mvt"+mac.replace(":", "").lower()
+
+
+def planNetwork(mode, device, vcpus, interface):
+    """
+    How the guest's network is connected. Returns {"mode", "interface",
+    "vhost", "queues", "vectors", "warnings", "reason"}.
+    """
+    plan = {"mode": mode, "interface": interface, "vhost": False, "queues": 1, "vectors": 0, "warnings": [], "reason": "user mode networking"}
+    if mode == "user":
+        return plan
+    virtio = device in VIRTIO_DEVICES
+    # vhost-net and extra queues only help virtio-net, older guests keep their emulated NIC
+    plan["vhost"] = virtio and os.path.exists("/dev/vhost-net")
+    if virtio and mode != "bridge":
+        plan["queues"] = max(1, min(vcpus, MAX_QUEUES))
+    if plan["queues"] > 1:
+        plan["vectors"] = 2 * plan["queues"] + 2
+    plan["reason"] = mode+" on "+interface+", "+device+(" with vhost-net" if plan["vhost"] else " without vhost-net")+", "+str(plan["queues"])+(" queues" if plan["queues"] > 1 else " queue")
+
+    if virtio and not plan["vhost"]:
+        plan["warnings"].append("/dev/vhost-net is missing, load the vhost_net module for the fastest network")
+    if mode == "bridge":
+        if not isBridge(interface):
+            plan["warnings"].append(interface+" is not a bridge on this host")
+        if bridgeAllowed(interface) == False:
+            plan["warnings"].append("qemu-bridge-helper isn't allowed to use "+interface+", add \"allow "+interface+"\" to "+BRIDGE_CONF)
+        if virtio and vcpus > 1:
+            plan["warnings"].append("qemu-bridge-helper can't make multiqueue taps, use tap mode for one queue per vCPU")
+    elif not interfaceExists(interface):
+        plan["warnings"].append(interface+" doesn't exist on this host"+(", create it with: sudo ip tuntap add dev "+interface+" mode tap multi_queue user $USER" if mode == "tap" else ""))
+    return plan
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+Bounded, rate limited fan-out of independent network queries. Results
+are handed back as they complete and the remaining work can be dropped
+as soon as the caller has what it needs.
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DEFAULT_WORKERS = 8
+DEFAULT_RATE = 10 # requests per second
+
+
+class RateLimiter:
+    """
+    Spaces out calls so no more than `rate` start in any one second.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if self.interval == 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def fanOut(func, items, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE, stop=None):
+    """
+    Run func(item) for every item over a thread pool, yielding
+    (item, result, error) in completion order. If stop(item, result)
+    returns True, queued work is cancelled and the generator ends.
+    """
+    limiter = RateLimiter(rate)
+    halted = threading.Event()
+
+    def call(item):
+        if halted.is_set():
+            return None
+        limiter.wait()
+        return func(item)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        jobs = {pool.submit(call, item): item for item in items}
+        for job in as_completed(jobs):
+            if job.cancelled():
+                continue
+            item = jobs[job]
+            try:
+                result, error = job.result(), None
+            except Exception as e:
+                result, error = None, e
+            yield item, result, error
+            if error is None and stop is not None and stop(item, result):
+                halted.set()
+                break
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def gather(calls, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE):
+    """
+    Run a dict of name -> zero-argument callables in parallel and return
+    name -> result. The first error is raised once everything has finished.
+    """
+    results = {}
+    firstError = None
+    for name, result, error in fanOut(lambda name: calls[name](), list(calls), workers, rate):
+        if error is not None and firstError is None:
+            firstError = error
+        results[name] = result
+    if firstError is not None:
+        raise firstError
+    return results
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+Runs AutoPilot phases as a dependency graph. A phase starts as soon as
+everything it depends on has finished, so independent work (disk
+creation, config templating, the recovery download) overlaps instead of
+queueing behind the slowest step.
+"""
+
+import timeit
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+DEFAULT_WORKERS = 4
+
+
+class PhaseError(Exception):
+    """
+    Raised by a phase to stop the run. `phase` is filled in with the name
+    of the phase that failed.
+    """
+
+    def __init__(self, message, phase=None):
+        super().__init__(message)
+        self.phase = phase
+
+
+class PhaseGraph:
+    """
+    Phases are added with the names of the phases they must run after.
+    Dependencies on phases that were never added are ignored, so optional
+    phases can simply be left out.
+    """
+
+    def __init__(self):
+        self.phases = {}
+
+    def add(self, name, func, after=()):
+        self.phases[name] = (func, list(after))
+
+    def dependencies(self, name):
+        return [dep for dep in self.phases[name][1] if dep in self.phases]
+
+    def order(self):
+        # Topological order, used to check for cycles and to run without threads
+        ordered = []
+        remaining = list(self.phases)
+        while remaining:
+            ready = [name for name in remaining if all(dep in ordered for dep in self.dependencies(name))]
+            if not ready:
+                raise ValueError("Phase dependencies form a cycle: "+", ".join(remaining))
+            ordered.extend(ready)
+            remaining = [name for name in remaining if name not in ready]
+        return ordered
+
+    def remove(self, name):
+        # Phases depending on it simply stop waiting for it
+        self.phases.pop(name, None)
+
+    def run(self, workers=DEFAULT_WORKERS, onStart=None, onFinish=None, onDone=None):
+        """
+        Run every phase, at most `workers` at a time. Returns name -> wall
+        time in seconds. onFinish is called after every phase, onDone only
+        after those that didn't raise. If a phase raises, nothing new is
+        started, the phases already running are allowed to finish and the
+        first error is raised as a PhaseError.
+        """
+        self.order()
+        times = {}
+        failure = None
+
+        def call(name):
+            if onStart is not None:
+                onStart(name)
+            start = timeit.default_timer()
+            try:
+                self.phases[name][0]()
+                if onDone is not None:
+                    onDone(name)
+            finally:
+                times[name] = round(timeit.default_timer() - start, 3)
+                if onFinish is not None:
+                    onFinish(name, times[name])
+
+        pending = list(self.phases)
+        running = {}
+        done = set()
+        pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        try:
+            while pending or running:
+                if failure is None:
+                    for name in [name for name in pending if all(dep in done for dep in self.dependencies(name))]:
+                        if len(running) >= max(1, workers):
+                            break
+                        pending.remove(name)
+                        running[pool.submit(call, name)] = name
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for job in finished:
+                    name = running.pop(job)
+                    error = job.exception()
+                    if error is None:
+                        done.add(name)
+                    elif failure is None:
+                        failure = (name, error)
+        finally:
+            pool.shutdown(wait=True)
+
+        if failure is not None:
+            name, error = failure
+            if isinstance(error, PhaseError):
+                error.phase = name
+                raise error
+            if not isinstance(error, Exception):
+                # SystemExit and friends still need to reach the main thread
+                raise error
+            raise PhaseError(str(error), name) from error
+        return times
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+AutoPilot preferences, kept as one document per blob folder
+(./blobs, ./blobs/user, ./blobs/stale) instead of one .apb file per
+answer. The document is versioned and checksummed, and is always
+replaced in one rename so a half-written file is never read back.
+Folders still holding .apb files from older versions are read as-is.
+"""
+
+import os
+import json
+import time
+import hashlib
+
+PREFS_FILE = "prefs.json"
+PREFS_VERSION = 1
+LEGACY_SUFFIX = ".apb"
+
+LIVE_DIR = "./blobs"
+USER_DIR = "./blobs/user"
+STALE_DIR = "./blobs/stale"
+
+
+class PrefsError(Exception):
+    """
+    The preference document exists but can't be trusted.
+    """
+
+
+def prefsPath(blobDir):
+    return os.path.join(blobDir, PREFS_FILE)
+
+
+def checksum(values):
+    return hashlib.sha256(json.dumps(values, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def legacyPrefs(blobDir):
+    values = {}
+    if not os.path.isdir(blobDir):
+        return values
+    for name in os.listdir(blobDir):
+        if name.endswith(LEGACY_SUFFIX):
+            with open(os.path.join(blobDir, name), "r") as blob:
+                values[name[:-len(LEGACY_SUFFIX)]] = blob.read()
+    return values
+
+
+def hasPrefs(blobDir):
+    if os.path.isfile(prefsPath(blobDir)):
+        return True
+    return os.path.isdir(blobDir) and any(name.endswith(LEGACY_SUFFIX) for name in os.listdir(blobDir))
+
+
+def loadPrefs(blobDir):
+    """
+    Return every preference in blobDir as a dict of strings. Raises
+    PrefsError if the document is damaged or from a newer version.
+    """
+    try:
+        with open(prefsPath(blobDir), "r") as prefsFile:
+            document = json.load(prefsFile)
+    except FileNotFoundError:
+        return legacyPrefs(blobDir)
+    except ValueError as e:
+        raise PrefsError("Preference file "+prefsPath(blobDir)+" is not valid JSON: "+str(e)) from e
+
+    if not isinstance(document, dict) or not isinstance(document.get("values"), dict):
+        raise PrefsError("Preference file "+prefsPath(blobDir)+" is malformed")
+    if document.get("version", 0) > PREFS_VERSION:
+        raise PrefsError("Preference file "+prefsPath(blobDir)+" was written by a newer version (v"+str(document.get("version"))+")")
+    if document.get("checksum") != checksum(document["values"]):
+        raise PrefsError("Preference file "+prefsPath(blobDir)+" failed its checksum")
+    return document["values"]
+
+
+def getPref(blobDir, key, default=None):
+    try:
+        return loadPrefs(blobDir).get(key, default)
+    except PrefsError:
+        return default
+
+
+def savePrefs(blobDir, values):
+    """
+    Replace the document in blobDir with values. Written to a temporary
+    file, synced and renamed over the old one.
+    """
+    values = {key: str(value) for key, value in values.items()}
+    document = {
+        "version": PREFS_VERSION,
+        "saved": int(time.time()),
+        "checksum": checksum(values),
+        "values": values,
+    }
+    os.makedirs(blobDir, exist_ok=True)
+    temp = prefsPath(blobDir)+".tmp"
+    with open(temp, "w") as prefsFile:
+        json.dump(document, prefsFile, indent=2, sort_keys=True)
+        prefsFile.flush()
+        os.fsync(prefsFile.fileno())
+    os.replace(temp, prefsPath(blobDir))
+    # Once the document exists the old per-answer files are just clutter
+    for name in os.listdir(blobDir):
+        if name.endswith(LEGACY_SUFFIX):
+            os.remove(os.path.join(blobDir, name))
+
+
+def setPrefs(blobDir, **values):
+    try:
+        current = loadPrefs(blobDir)
+    except PrefsError:
+        current = {}
+    current.update(values)
+    savePrefs(blobDir, current)
+
+
+def setPref(blobDir, key, value):
+    setPrefs(blobDir, **{key: value})
+
+
+def clearPrefs(blobDir):
+    if os.path.exists(prefsPath(blobDir)):
+        os.remove(prefsPath(blobDir))
+    if os.path.isdir(blobDir):
+        for name in os.listdir(blobDir):
+            if name.endswith(LEGACY_SUFFIX):
+                os.remove(os.path.join(blobDir, name))
+
+
+def copyPrefs(src, dest):
+    """
+    Copy the preferences in src over those in dest, keeping anything only
+    dest has (e.g. USR_VFIO_DEVICES). Returns False if src has none.
+    """
+    if not hasPrefs(src):
+        return False
+    setPrefs(dest, **loadPrefs(src))
+    return True
+
+
+def movePrefs(src, dest):
+    """
+    Like copyPrefs, but src is emptied afterwards. A damaged document in
+    src is dropped rather than carried over.
+    """
+    try:
+        moved = copyPrefs(src, dest)
+    except PrefsError:
+        moved = False
+    clearPrefs(src)
+    return moved
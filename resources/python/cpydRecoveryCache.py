@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+Local cache of converted recovery images. Entries are keyed by the
+recovery product (AP) and image hash (AH), so the same BaseSystem is only
+downloaded once. Least recently used entries are evicted once the cache
+grows past its size cap. Several downloads may share one cache, so
+every change is made under an exclusive lock and every read under a
+shared one.
+"""
+
+import os
+import re
+import json
+import time
+import fcntl
+from cpydSparse import copySparse
+from cpydWorkspace import fileLock
+
+DEFAULT_CACHE_SIZE = 20 # in GB
+ALIAS_MAX_AGE = 7 * 24 * 60 * 60
+ENTRY_SUFFIX = '.img'
+ALIAS_FILE = 'aliases.json'
+LOCK_FILE = '.lock'
+FICLONE = 0x40049409
+
+
+def defaultCacheDir(repoDir):
+    return os.environ.get('ULTMOS_CACHE_DIR', os.path.join(repoDir, 'resources', 'cache', 'recovery'))
+
+
+def cacheKey(product, imageHash):
+    return re.sub(r'[^A-Za-z0-9._-]', '_', product + '-' + imageHash)
+
+
+def reflink(src, dest):
+    with open(src, 'rb') as srcFile, open(dest, 'wb') as destFile:
+        fcntl.ioctl(destFile.fileno(), FICLONE, srcFile.fileno())
+
+
+def placeFile(src, dest):
+    """
+    Put a copy of src at dest as cheaply as the filesystem allows.
+    Returns the method that was used. Never a hard link: the VM opens its
+    BaseSystem writable, and QEMU locks images per inode.
+    """
+    if os.path.exists(dest):
+        os.remove(dest)
+    try:
+        reflink(src, dest)
+        return 'reflink'
+    except OSError:
+        if os.path.exists(dest):
+            os.remove(dest)
+    copySparse(src, dest)
+    return 'copy'
+
+
+class RecoveryCache:
+    """
+    A directory of <product>-<hash>.img files. The mtime of each entry is
+    bumped whenever it is used and drives LRU eviction.
+    """
+
+    def __init__(self, path, maxSize=DEFAULT_CACHE_SIZE * 2 ** 30):
+        self.path = path
+        self.maxSize = maxSize
+        os.makedirs(self.path, exist_ok=True)
+
+    def lock(self, shared=False):
+        return fileLock(os.path.join(self.path, LOCK_FILE), shared)
+
+    def entryPath(self, key):
+        return os.path.join(self.path, key + ENTRY_SUFFIX)
+
+    def entries(self):
+        found = []
+        for name in os.listdir(self.path):
+            if name.endswith(ENTRY_SUFFIX):
+                entry = os.path.join(self.path, name)
+                stat = os.stat(entry)
+                found.append((stat.st_mtime, stat.st_size, entry))
+        return sorted(found)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def lookup(self, key):
+        entry = self.entryPath(key)
+        if os.path.isfile(entry):
+            os.utime(entry)
+            return entry
+        return None
+
+    def place(self, key, dest):
+        # Shared, so an eviction can't remove the entry half way through a copy
+        with self.lock(shared=True):
+            entry = self.lookup(key)
+            if entry is None:
+                return None
+            return placeFile(entry, dest)
+
+    def insert(self, src, key, alias=None):
+        with self.lock():
+            entry = self.entryPath(key)
+            temp = entry + '.tmp'
+            placeFile(src, temp)
+            os.replace(temp, entry)
+            os.utime(entry)
+            if alias is not None:
+                self._setAlias(alias, key)
+            self._evict(keep=entry)
+            return entry
+
+    def evict(self, keep=None):
+        with self.lock():
+            self._evict(keep)
+
+    def _evict(self, keep=None):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.maxSize:
+                break
+            if entry == keep:
+                continue
+            os.remove(entry)
+            total -= size
+
+    def _aliases(self):
+        try:
+            with open(os.path.join(self.path, ALIAS_FILE), 'r') as aliasFile:
+                return json.load(aliasFile)
+        except (OSError, ValueError):
+            return {}
+
+    def setAlias(self, alias, key):
+        with self.lock():
+            self._setAlias(alias, key)
+
+    def _setAlias(self, alias, key):
+        aliases = self._aliases()
+        aliases[alias] = {'key': key, 'time': int(time.time())}
+        temp = os.path.join(self.path, ALIAS_FILE + '.tmp')
+        with open(temp, 'w') as aliasFile:
+            json.dump(aliases, aliasFile, indent=2)
+        os.replace(temp, os.path.join(self.path, ALIAS_FILE))
+
+    def lookupAlias(self, alias, maxAge=ALIAS_MAX_AGE):
+        """
+        Resolve a short OS name (e.g. "sonoma") to a cached entry without
+        asking the recovery server. Old aliases are ignored so newer
+        builds from Apple still get picked up.
+        """
+        with self.lock(shared=True):
+            record = self._aliases().get(alias)
+            if record is None or time.time() - record.get('time', 0) > maxAge:
+                return None
+            if self.lookup(record['key']) is None:
+                return None
+            return record['key']
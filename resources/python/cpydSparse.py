@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+Sparse file helpers. All-zero blocks are never written, so they stay as
+holes in the output and take no disk space. Copies skip the holes of the
+source as well as any zero blocks inside its data.
+"""
+
+import os
+import errno
+import ctypes
+import ctypes.util
+
+BLOCK_SIZE = 4096
+COPY_SIZE = 2 ** 20
+ZERO_BLOCK = bytes(BLOCK_SIZE)
+FALLOC_FL_KEEP_SIZE = 0x01
+FALLOC_FL_PUNCH_HOLE = 0x02
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _fallocate = _libc.fallocate
+    _fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+except (OSError, AttributeError, TypeError):
+    _fallocate = None
+
+
+def writeSparse(fd, data, offset):
+    """
+    pwrite data at offset, skipping every block that is entirely zero.
+    The file must already read as zeros there (new or truncated). Returns
+    the number of bytes actually written.
+    """
+    view = memoryview(data)
+    written = 0
+    runStart = None
+    # Work in blocks aligned to the file, not to the buffer
+    position = 0
+    first = BLOCK_SIZE - (offset % BLOCK_SIZE)
+    while position < len(view):
+        end = min(len(view), position + (first if position == 0 else BLOCK_SIZE))
+        block = view[position:end]
+        if block == ZERO_BLOCK[:len(block)]:
+            if runStart is not None:
+                written += os.pwrite(fd, view[runStart:position], offset + runStart)
+                runStart = None
+        elif runStart is None:
+            runStart = position
+        position = end
+    if runStart is not None:
+        written += os.pwrite(fd, view[runStart:], offset + runStart)
+    return written
+
+
+def punchHole(fd, offset, length):
+    if _fallocate is None:
+        return False
+    return _fallocate(fd, FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE, offset, length) == 0
+
+
+def sparsify(path):
+    """
+    Turn zero blocks of an existing file into holes in place, e.g. for
+    images written densely by an external tool. Returns bytes freed.
+    """
+    if _fallocate is None:
+        return 0
+    freed = 0
+    fd = os.open(path, os.O_RDWR)
+    try:
+        for start, end in dataRanges(fd, os.fstat(fd).st_size):
+            offset = start
+            while offset < end:
+                data = os.pread(fd, min(COPY_SIZE, end - offset), offset)
+                if not data:
+                    break
+                for blockStart in range(0, len(data) - BLOCK_SIZE + 1, BLOCK_SIZE):
+                    if data[blockStart:blockStart + BLOCK_SIZE] == ZERO_BLOCK and punchHole(fd, offset + blockStart, BLOCK_SIZE):
+                        freed += BLOCK_SIZE
+                offset += len(data)
+    finally:
+        os.close(fd)
+    return freed
+
+
+def dataRanges(fd, size):
+    # Use SEEK_DATA/SEEK_HOLE where the filesystem supports it, otherwise treat it all as data
+    if not hasattr(os, 'SEEK_DATA'):
+        return [(0, size)]
+    ranges = []
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                break
+            return [(0, size)]
+        end = os.lseek(fd, start, os.SEEK_HOLE)
+        ranges.append((start, end))
+        offset = end
+    return ranges
+
+
+def copySparse(src, dest):
+    """
+    Copy src to dest, keeping holes and leaving zero blocks unwritten.
+    Returns (logical size, bytes written).
+    """
+    srcFd = os.open(src, os.O_RDONLY)
+    try:
+        size = os.fstat(srcFd).st_size
+        destFd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        written = 0
+        try:
+            os.ftruncate(destFd, size)
+            for start, end in dataRanges(srcFd, size):
+                offset = start
+                while offset < end:
+                    data = os.pread(srcFd, min(COPY_SIZE, end - offset), offset)
+                    if not data:
+                        break
+                    written += writeSparse(destFd, data, offset)
+                    offset += len(data)
+        finally:
+            os.close(destFd)
+    finally:
+        os.close(srcFd)
+    return size, written
+
+
+def moveSparse(src, dest):
+    """
+    Rename when possible, otherwise sparse-copy across filesystems.
+    """
+    try:
+        os.replace(src, dest)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        copySparse(src, dest)
+        os.remove(src)
+
+
+def allocatedSize(path):
+    return os.stat(path).st_blocks * 512
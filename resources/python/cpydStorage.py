@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+Virtual disk profiles. A profile decides how the VM's disk file is laid
+out on the host: its format, how much of it is allocated up front and,
+for qcow2, the cluster size and metadata options. "auto" picks one from
+the filesystem the disk will live on and how big it is.
+
+The host's storage also decides how QEMU opens the disk: cache mode, aio
+engine, whether guest TRIM and zero writes are passed down, and how much
+of a qcow2 disk's L2 table QEMU keeps in memory.
+
+   compact      qcow2, nothing preallocated. Smallest file, but every first
+                write to a cluster also has to allocate its metadata.
+   balanced     qcow2, metadata preallocated, 4K subclusters (extended_l2)
+                and lazy refcounts. Small file without the allocation stalls.
+   performance  qcow2, the whole disk reserved with fallocate, so the guest
+                never waits for the host filesystem to find space.
+   raw          raw image reserved with fallocate. No qcow2 features such
+                as snapshots, but nothing between the guest and the file.
+"""
+
+import os
+import re
+import stat
+import shutil
+import struct
+import subprocess
+
+PROFILES = ["auto", "compact", "balanced", "performance", "raw"]
+DEFAULT_PROFILE = "auto"
+QCOW2_MAGIC = b"QFI\xfb"
+
+# Every write on these lands somewhere new, reserving space up front buys nothing
+COW_FILESYSTEMS = ("btrfs", "zfs", "bcachefs")
+# Known to support fallocate, so preallocation=falloc is cheap
+FALLOCATE_FILESYSTEMS = ("ext4", "xfs", "f2fs", "btrfs", "ocfs2", "gfs2", "bcachefs")
+# Reserving space here would fill memory rather than disk
+MEMORY_FILESYSTEMS = ("tmpfs", "ramfs")
+FREE_SPACE_MARGIN = 1.1 # keep a tenth spare after reserving the whole disk
+FULL_PREALLOCATION_LIMIT = 64 * 10 ** 9 # writing zeros takes too long beyond this
+# O_DIRECT isn't available (or, for ZFS before 2.3, is silently buffered anyway)
+NO_DIRECT_FILESYSTEMS = ("tmpfs", "ramfs", "zfs")
+
+# Bigger disks get bigger clusters so their L2 tables stay small enough to cache
+CLUSTER_SIZES = ((128 * 10 ** 9, "128k"), (512 * 10 ** 9, "256k"), (2 * 10 ** 12, "512k"))
+LARGEST_CLUSTER = "1M"
+
+IO_URING_KERNEL = (5, 1)
+QEMU_BINARY = "qemu-system-x86_64"
+
+helpCache = {}
+ioUringCache = []
+
+
+def unescapeMount(field):
+    # /proc/mounts writes spaces and friends as octal escapes
+    return re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), field)
+
+
+def mountFor(path):
+    """
+    (mount point, filesystem type, device) of the filesystem holding path,
+    or None if /proc/mounts can't be read.
+    """
+    path = os.path.realpath(path)
+    best = None
+    try:
+        with open("/proc/mounts", "r") as mounts:
+            for line in mounts:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                device, mountPoint, fsType = unescapeMount(fields[0]), unescapeMount(fields[1]), fields[2]
+                if path == mountPoint or path.startswith(mountPoint.rstrip("/")+"/"):
+                    if best is None or len(mountPoint) >= len(best[0]):
+                        best = (mountPoint, fsType, device)
+    except OSError:
+        return None
+    return best
+
+
+def filesystemType(path):
+    mount = mountFor(path)
+    return mount[1] if mount is not None else "unknown"
+
+
+def sysfsNode(path):
+    """
+    sysfs folder of the whole block device holding path, or of path itself
+    if it is a block device. None for network and virtual filesystems.
+    """
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    device = info.st_rdev if stat.S_ISBLK(info.st_mode) else info.st_dev
+    node = "/sys/dev/block/%d:%d" % (os.major(device), os.minor(device))
+    if not os.path.exists(node):
+        # btrfs and friends report an anonymous device number, go by what is mounted
+        mount = mountFor(path)
+        if mount is None or not mount[2].startswith("/dev/"):
+            return None
+        node = "/sys/class/block/"+os.path.basename(os.path.realpath(mount[2]))
+        if not os.path.exists(node):
+            return None
+    node = os.path.realpath(node)
+    if os.path.exists(os.path.join(node, "partition")):
+        node = os.path.dirname(node) # queue settings live on the whole disk
+    return node
+
+
+def readQueue(node, name):
+    try:
+        with open(os.path.join(node, "queue", name), "r") as queueFile:
+            return queueFile.read().strip()
+    except OSError:
+        return None
+
+
+def hostStorage(path):
+    """
+    What is behind path: {"filesystem", "device", "isBlock", "rotational",
+    "discard"}. device, rotational and discard are None when unknown.
+    """
+    try:
+        isBlock = stat.S_ISBLK(os.stat(path).st_mode)
+    except OSError:
+        isBlock = False
+    node = sysfsNode(path)
+    rotational = readQueue(node, "rotational") if node is not None else None
+    discard = readQueue(node, "discard_max_bytes") if node is not None else None
+    return {
+        "filesystem": "block" if isBlock else filesystemType(path),
+        "device": os.path.basename(node) if node is not None else None,
+        "isBlock": isBlock,
+        "rotational": None if rotational is None else rotational == "1",
+        "discard": None if discard is None else discard.isdigit() and int(discard) > 0,
+    }
+
+
+def ioUringSupported():
+    """
+    Whether the kernel allows io_uring and the installed QEMU was built
+    with it (liburing is linked in).
+    """
+    if not ioUringCache:
+        supported = False
+        release = re.match(r"(\d+)\.(\d+)", os.uname().release)
+        disabled = None
+        try:
+            with open("/proc/sys/kernel/io_uring_disabled", "r") as sysctl:
+                disabled = sysctl.read().strip()
+        except OSError:
+            pass
+        qemu = shutil.which(QEMU_BINARY)
+        if release is not None and (int(release.group(1)), int(release.group(2))) >= IO_URING_KERNEL and disabled in (None, "0") and qemu is not None:
+            try:
+                libraries = subprocess.run(["ldd", qemu], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=False).stdout
+                supported = "liburing" in libraries
+            except OSError:
+                supported = False
+        ioUringCache.append(supported)
+    return ioUringCache[0]
+
+
+def ioOptions(path, preallocated=False):
+    """
+    How QEMU should open the disk at path (a disk file's folder, or a
+    block device): cache, aio, discard and detect-zeroes values plus the
+    storage they were picked for.
+    """
+    storage = hostStorage(path)
+    # Bypassing the host page cache avoids caching everything twice, but needs O_DIRECT
+    direct = storage["isBlock"] or (storage["device"] is not None and storage["filesystem"] not in NO_DIRECT_FILESYSTEMS)
+    if storage["isBlock"]:
+        # TRIM only reaches a physical disk that accepts it
+        unmap = storage["discard"] == True
+    else:
+        # In a file, TRIM punches holes, unless the disk was reserved on purpose
+        unmap = not preallocated
+    return {
+        "cache": "none" if direct else "writeback",
+        "aio": ("io_uring" if ioUringSupported() else "native") if direct else "threads",
+        "discard": "unmap" if unmap else "ignore",
+        "detectZeroes": "unmap" if unmap else "off",
+        "storage": storage,
+    }
+
+
+def describeStorage(storage):
+    if storage["rotational"] is None:
+        kind = "unknown storage"
+    else:
+        kind = "a spinning disk" if storage["rotational"] else "an SSD"
+    text = kind+" ("+storage["filesystem"]
+    if storage["device"] is not None:
+        text = text+" on "+storage["device"]+(", TRIM supported" if storage["discard"] else ", no TRIM")
+    return text+")"
+
+
+def freeSpace(path):
+    try:
+        stat = os.statvfs(path)
+    except OSError:
+        return None
+    return stat.f_bavail * stat.f_frsize
+
+
+def diskFile(profile):
+    return "HDD.img" if profile == "raw" else "HDD.qcow2"
+
+
+def diskFormat(profile):
+    return "raw" if profile == "raw" else "qcow2"
+
+
+def imageFormat(path):
+    """
+    Format of an existing disk image, read from its header, or None if it
+    can't be read.
+    """
+    try:
+        with open(path, "rb") as image:
+            magic = image.read(4)
+    except OSError:
+        return None
+    return "qcow2" if magic == QCOW2_MAGIC else "raw"
+
+
+def qcow2Geometry(path):
+    """
+    {"size", "clusterSize", "extendedL2"} of an existing qcow2 image, read
+    from its header, or None if it isn't one.
+    """
+    try:
+        with open(path, "rb") as image:
+            header = image.read(80)
+    except OSError:
+        return None
+    if len(header) < 32 or header[:4] != QCOW2_MAGIC:
+        return None
+    version, = struct.unpack(">I", header[4:8])
+    clusterBits, = struct.unpack(">I", header[20:24])
+    size, = struct.unpack(">Q", header[24:32])
+    extendedL2 = False
+    if version >= 3 and len(header) >= 80:
+        incompatible, = struct.unpack(">Q", header[72:80])
+        extendedL2 = bool(incompatible & 0x10)
+    return {"size": size, "clusterSize": 1 << clusterBits, "extendedL2": extendedL2}
+
+
+def planGeometry(plan, size):
+    """
+    What qcow2Geometry will say about a disk created from plan, or None for
+    raw disks.
+    """
+    if plan["format"] != "qcow2":
+        return None
+    cluster = plan["options"].get("cluster_size", "64k")
+    return {"size": size, "clusterSize": int(cluster[:-1]) * {"k": 1024, "M": 1024 ** 2}[cluster[-1]], "extendedL2": plan["options"].get("extended_l2") == "on"}
+
+
+def l2CacheSize(geometry):
+    """
+    Bytes of L2 cache that hold every L2 table of the disk, so no guest read
+    ever has to wait for QEMU to fetch metadata from the image first.
+    """
+    entries = -(-geometry["size"] // geometry["clusterSize"])
+    cache = entries * (16 if geometry["extendedL2"] else 8)
+    return -(-cache // geometry["clusterSize"]) * geometry["clusterSize"]
+
+
+def clusterSize(size):
+    for limit, cluster in CLUSTER_SIZES:
+        if size <= limit:
+            return cluster
+    return LARGEST_CLUSTER
+
+
+def profileOptions(profile, size, fsType, canReserve):
+    """
+    qemu-img -o options for a profile. canReserve says whether the
+    filesystem can fallocate the whole disk right now.
+    """
+    if profile == "raw":
+        return {"preallocation": "falloc" if canReserve else "off"}
+    if profile == "compact":
+        return {"preallocation": "off", "cluster_size": "64k"}
+    options = {"cluster_size": clusterSize(size), "lazy_refcounts": "on"}
+    if profile == "balanced":
+        options["preallocation"] = "metadata"
+        options["extended_l2"] = "on"
+    elif canReserve:
+        options["preallocation"] = "falloc"
+    elif fsType not in MEMORY_FILESYSTEMS and size <= FULL_PREALLOCATION_LIMIT:
+        options["preallocation"] = "full"
+    else:
+        options["preallocation"] = "metadata"
+        options["extended_l2"] = "on"
+    if fsType == "btrfs":
+        options["nocow"] = "on" # stops btrfs fragmenting the image on every guest write
+    return options
+
+
+def planDisk(folder, size, profile=DEFAULT_PROFILE):
+    """
+    Work out how to create a disk of `size` bytes in folder. Returns a dict
+    with the profile actually used, format, file name, qemu-img options
+    and a short reason for the log.
+    """
+    fsType = filesystemType(folder)
+    free = freeSpace(folder)
+    roomy = free is not None and free >= size * FREE_SPACE_MARGIN
+    canReserve = roomy and fsType in FALLOCATE_FILESYSTEMS
+
+    if profile == "auto":
+        if fsType in COW_FILESYSTEMS:
+            chosen, reason = "balanced", fsType+" is copy-on-write, only metadata is preallocated"
+        elif fsType in MEMORY_FILESYSTEMS:
+            chosen, reason = "compact", fsType+" is backed by memory, nothing is preallocated"
+        elif canReserve:
+            chosen, reason = "performance", fsType+" has room to reserve the whole disk"
+        elif fsType in FALLOCATE_FILESYSTEMS:
+            chosen, reason = "balanced", "not enough free space on "+fsType+" to reserve the whole disk"
+        else:
+            chosen, reason = "balanced", fsType+" may not support fallocate, only metadata is preallocated"
+    else:
+        chosen, reason = profile, "requested"
+        if profile in ("performance", "raw") and not canReserve:
+            reason = reason+", but "+fsType+(" lacks the free space" if fsType in FALLOCATE_FILESYSTEMS else " can't fallocate")+" to reserve the whole disk"
+
+    return {
+        "profile": chosen,
+        "format": diskFormat(chosen),
+        "file": diskFile(chosen),
+        "options": profileOptions(chosen, size, fsType, canReserve),
+        "filesystem": fsType,
+        "reason": reason,
+    }
+
+
+def supportedOptions(fileFormat):
+    """
+    Creation options qemu-img knows for a format, so options newer than the
+    installed QEMU (extended_l2 needs 5.2) can be left out. None if qemu-img
+    can't be asked.
+    """
+    if fileFormat not in helpCache:
+        try:
+            result = subprocess.run(["qemu-img", "create", "-f", fileFormat, "-o", "help"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=False)
+        except OSError:
+            return None
+        names = set()
+        for line in result.stdout.splitlines():
+            # Options are the indented lines, "  name=<type>  - description"
+            if line[:1].isspace() and line.strip():
+                names.add(line.split()[0].split("=")[0])
+        helpCache[fileFormat] = names or None
+    return helpCache[fileFormat]
+
+
+def createCommand(plan, path, size):
+    """
+    qemu-img arguments that create the planned disk at path. Returns the
+    argument list and the options that had to be dropped.
+    """
+    supported = supportedOptions(plan["format"])
+    options = dict(plan["options"])
+    dropped = []
+    if supported is not None:
+        dropped = [name for name in options if name not in supported]
+        for name in dropped:
+            del options[name]
+    command = ["qemu-img", "create", "-f", plan["format"]]
+    if options:
+        command.extend(["-o", ",".join(name+"="+value for name, value in options.items())])
+    command.extend([path, str(size)+"B"])
+    return command, dropped
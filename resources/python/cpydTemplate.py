@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+Small template engine for baseConfig and baseDomain. A template is parsed
+once into a tree of text, placeholders and conditional sections, and each
+render is a single pass over that tree.
+
+   {{NAME}}                 value of NAME
+   {%if NAME%}              section shown when NAME is set (not empty, 0 or False)
+   {%if NAME == value%}     ... when NAME equals value (also !=, and "not NAME")
+   {%elif ...%} {%else%}    alternatives
+   {%end%}                  closes the section
+   {%# text %}              comment, never rendered
+
+A tag alone on its line takes the whole line with it, so sections don't
+leave blank lines behind. Anything else, like bash's $VM_PATH, is left as
+it is.
+"""
+
+import os
+import re
+
+# A tag ends at the first %}; only comments may span lines
+TAG_BODY = r"#(?:[^%]|%(?!\}))*|(?:[^%\n]|%(?!\}))*"
+TOKEN = re.compile(r"^[ \t]*\{%(?P<lineTag>"+TAG_BODY+r")%\}[ \t]*(?:\n|\Z)|\{\{\s*(?P<var>\w+)\s*\}\}|\{%(?P<tag>"+TAG_BODY+r")%\}", re.MULTILINE)
+CONDITION = re.compile(r"^(?:(?P<negate>not)\s+)?(?P<name>\w+)(?:\s*(?P<op>==|!=)\s*(?P<value>.*?))?$")
+FALSE_VALUES = (None, False, 0, "", "0", "False", "false")
+
+templateCache = {}
+
+
+class TemplateError(Exception):
+    """
+    The template can't be parsed, or a placeholder has no value.
+    """
+
+
+def isSet(value):
+    return value not in FALSE_VALUES
+
+
+def parseCondition(text, source):
+    match = CONDITION.match(text.strip())
+    if match is None:
+        raise TemplateError(source+": can't understand condition '"+text.strip()+"'")
+    value = match.group("value")
+    if value is not None:
+        value = value.strip().strip("\"'")
+    return (match.group("negate") is not None, match.group("name"), match.group("op"), value)
+
+
+def testCondition(condition, values, source):
+    negate, name, op, expected = condition
+    if name not in values:
+        raise TemplateError(source+": no value for '"+name+"'")
+    value = values[name]
+    if op is None:
+        result = isSet(value)
+    elif op == "==":
+        result = str(value) == expected
+    else:
+        result = str(value) != expected
+    return result != negate
+
+
+class Template:
+    """
+    A compiled template. Nodes are plain strings, ("var", name) or
+    ("if", [(condition, nodes), ...], elseNodes).
+    """
+
+    def __init__(self, text, source="<template>"):
+        self.source = source
+        self.names = set()
+        self.nodes = self._compile(text)
+
+    def _compile(self, text):
+        root = []
+        stack = [] # open sections: (branches, elseNodes or None, parent)
+        current = root
+        position = 0
+        for match in TOKEN.finditer(text):
+            if match.start() > position:
+                current.append(text[position:match.start()])
+            position = match.end()
+
+            if match.group("var") is not None:
+                self.names.add(match.group("var"))
+                current.append(("var", match.group("var")))
+                continue
+
+            tag = (match.group("lineTag") if match.group("lineTag") is not None else match.group("tag")).strip()
+            if tag.startswith("#"):
+                continue
+            keyword, _, rest = tag.partition(" ")
+            if keyword == "if":
+                condition = parseCondition(rest, self.source)
+                self.names.add(condition[1])
+                section = {"branches": [(condition, [])], "else": None, "parent": current}
+                stack.append(section)
+                current = section["branches"][0][1]
+            elif keyword in ("elif", "else", "end"):
+                if not stack:
+                    raise TemplateError(self.source+": {%"+keyword+"%} without {%if%}")
+                section = stack[-1]
+                if section["else"] is not None and keyword != "end":
+                    raise TemplateError(self.source+": {%"+keyword+"%} after {%else%}")
+                if keyword == "elif":
+                    condition = parseCondition(rest, self.source)
+                    self.names.add(condition[1])
+                    section["branches"].append((condition, []))
+                    current = section["branches"][-1][1]
+                elif keyword == "else":
+                    section["else"] = []
+                    current = section["else"]
+                else:
+                    stack.pop()
+                    current = section["parent"]
+                    current.append(("if", section["branches"], section["else"] or []))
+            else:
+                raise TemplateError(self.source+": unknown tag {%"+tag+"%}")
+
+        if stack:
+            raise TemplateError(self.source+": {%if%} is never closed with {%end%}")
+        if position < len(text):
+            current.append(text[position:])
+        return root
+
+    def render(self, values):
+        out = []
+        self._render(self.nodes, values, out)
+        return "".join(out)
+
+    def _render(self, nodes, values, out):
+        for node in nodes:
+            if isinstance(node, str):
+                out.append(node)
+            elif node[0] == "var":
+                if node[1] not in values:
+                    raise TemplateError(self.source+": no value for '"+node[1]+"'")
+                out.append(str(values[node[1]]))
+            else:
+                for condition, branch in node[1]:
+                    if testCondition(condition, values, self.source):
+                        self._render(branch, values, out)
+                        break
+                else:
+                    self._render(node[2], values, out)
+
+
+def loadTemplate(path):
+    """
+    Compile the template at path, reusing the compiled copy until the
+    file changes.
+    """
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    cached = templateCache.get(key)
+    if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+        return cached[1]
+    with open(path, "r") as templateFile:
+        template = Template(templateFile.read(), os.path.basename(path))
+    templateCache[key] = ((stat.st_mtime_ns, stat.st_size), template)
+    return template
+
+
+def renderTemplate(path, values):
+    return loadTemplate(path).render(values)
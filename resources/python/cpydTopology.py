@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+vCPU pinning. The host's topology is read from sysfs (physical cores and
+their SMT siblings, last level caches, NUMA nodes) and each VM is given
+whole physical cores of its own, so two busy VMs never share a core or
+its sibling threads. Where it can, a VM's cores share one cache and one
+node. The first core of every node is left to the host and to QEMU's
+own threads.
+
+Every allocation is kept in one registry per host, so VMs generated at
+different times, or at the same time in a batch, never overlap.
+"""
+
+import os
+import time
+from cpydWorkspace import HostRegistry
+
+SYSFS_CPU = "/sys/devices/system/cpu"
+REGISTRY_FILE = "cpu-pinning.json"
+HOUSEKEEPING_CORES = 1 # per NUMA node
+
+
+def parseCpuList(text):
+    """
+    "0-3,8,10-11" -> [0, 1, 2, 3, 8, 10, 11]
+    """
+    cpus = []
+    for part in text.strip().split(","):
+        if part == "":
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return sorted(set(cpus))
+
+
+def formatCpuList(cpus):
+    """
+    [0, 1, 2, 3, 8] -> "0-3,8"
+    """
+    ranges = []
+    for cpu in sorted(set(cpus)):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(first) if first == last else str(first)+"-"+str(last) for first, last in ranges)
+
+
+def readValue(path, default=None):
+    try:
+        with open(path, "r") as valueFile:
+            return valueFile.read().strip()
+    except OSError:
+        return default
+
+
+def lastLevelCache(cpuDir):
+    # The highest level data or unified cache; its id (or who shares it) identifies it
+    best = None
+    cacheDir = os.path.join(cpuDir, "cache")
+    if os.path.isdir(cacheDir):
+        for index in os.listdir(cacheDir):
+            if not index.startswith("index"):
+                continue
+            level = readValue(os.path.join(cacheDir, index, "level"))
+            if level is None or readValue(os.path.join(cacheDir, index, "type")) == "Instruction":
+                continue
+            identity = readValue(os.path.join(cacheDir, index, "id")) or readValue(os.path.join(cacheDir, index, "shared_cpu_list"))
+            if best is None or int(level) > best[0]:
+                best = (int(level), identity)
+    return best[1] if best is not None else None
+
+
+def readTopology(root=SYSFS_CPU):
+    """
+    Physical cores of the host, ordered by their first CPU. Each is a dict
+    of "cpus" (the core's online SMT siblings), "package", "cache" and
+    "node". Empty if sysfs can't be read.
+    """
+    online = readValue(os.path.join(root, "online"))
+    if online is None:
+        return []
+    online = parseCpuList(online)
+    cores = {}
+    for cpu in online:
+        cpuDir = os.path.join(root, "cpu"+str(cpu))
+        siblings = readValue(os.path.join(cpuDir, "topology", "thread_siblings_list"), str(cpu))
+        siblings = tuple(sibling for sibling in parseCpuList(siblings) if sibling in online) or (cpu,)
+        if siblings in cores:
+            continue
+        node = 0
+        if os.path.isdir(cpuDir):
+            for name in os.listdir(cpuDir):
+                if name.startswith("node") and name[4:].isdigit():
+                    node = int(name[4:])
+        package = readValue(os.path.join(cpuDir, "topology", "physical_package_id"), "0")
+        cores[siblings] = {
+            "cpus": list(siblings),
+            "package": int(package) if package.lstrip("-").isdigit() else 0,
+            "cache": str(package)+"/"+str(lastLevelCache(cpuDir)),
+            "node": node,
+        }
+    return sorted(cores.values(), key=lambda core: core["cpus"][0])
+
+
+def housekeepingCores(topology, count=HOUSEKEEPING_CORES):
+    kept = []
+    for node in sorted(set(core["node"] for core in topology)):
+        kept.extend([core for core in topology if core["node"] == node][:count])
+    return kept
+
+
+def planPinning(topology, vcpus, threadsPerCore, taken=(), housekeeping=HOUSEKEEPING_CORES):
+    """
+    Pick host CPUs for a VM with `vcpus` vCPUs, `threadsPerCore` to a core.
+    Guest cores land on whole host cores, and guest SMT siblings on host
+    SMT siblings when the host has them. Returns {"vcpus": host CPU for
+    each vCPU in order, "emulator", "cpus" (everything reserved), "nodes",
+    "reason"}, or None if there aren't enough free cores.
+    """
+    if not topology or vcpus < 1:
+        return None
+    smt = min(len(core["cpus"]) for core in topology)
+    perCore = threadsPerCore if 1 <= threadsPerCore <= smt else 1
+    needed = -(-vcpus // perCore)
+    taken = set(taken)
+    kept = housekeepingCores(topology, housekeeping)
+    free = [core for core in topology if core not in kept and not taken.intersection(core["cpus"])]
+    if len(free) < needed:
+        return None
+
+    # Smallest cache, then node, the VM fits in, so larger groups stay whole for larger VMs
+    chosen = None
+    for key, scope in (("cache", "one shared cache"), ("node", "one NUMA node")):
+        groups = {}
+        for core in free:
+            groups.setdefault(core[key], []).append(core)
+        fitting = [group for group in groups.values() if len(group) >= needed]
+        if fitting:
+            chosen = min(fitting, key=len)[:needed]
+            reason = str(needed)+" cores in "+scope
+            break
+    if chosen is None:
+        # Spread over as few nodes as possible
+        byNode = {}
+        for core in free:
+            byNode.setdefault(core["node"], []).append(core)
+        chosen = [core for group in sorted(byNode.values(), key=len, reverse=True) for core in group][:needed]
+        reason = str(needed)+" cores across NUMA nodes"
+
+    pins = [chosen[index // perCore]["cpus"][index % perCore] for index in range(vcpus)]
+    nodes = sorted(set(core["node"] for core in chosen))
+    emulator = [cpu for core in kept if core["node"] in nodes for cpu in core["cpus"]] or [cpu for core in kept for cpu in core["cpus"]]
+    return {
+        "vcpus": pins,
+        "emulator": sorted(emulator),
+        "cpus": sorted(cpu for core in chosen for cpu in core["cpus"]),
+        "nodes": nodes,
+        "reason": reason,
+    }
+
+
+class PinningRegistry(HostRegistry):
+    """
+    The host's CPU allocations, keyed by the boot script each one belongs
+    to.
+    """
+
+    def __init__(self, folder):
+        super().__init__(folder, REGISTRY_FILE)
+
+    def allocate(self, key, topology, vcpus, threadsPerCore):
+        """
+        Reserve CPUs for the VM whose boot script is `key`. A VM that is
+        generated again keeps its CPUs if nobody else has them since.
+        """
+        with self.edit() as entries:
+            own = entries.pop(key, None)
+            taken = set(cpu for entry in entries.values() for cpu in entry["cpus"])
+            if own is not None and len(own["vcpus"]) == vcpus and not taken.intersection(own["cpus"]):
+                plan = {name: own[name] for name in ("vcpus", "emulator", "cpus", "nodes")}
+                plan["reason"] = "kept from the last time this VM was generated"
+            else:
+                plan = planPinning(topology, vcpus, threadsPerCore, taken)
+            if plan is not None:
+                entries[key] = dict(plan, pid=os.getpid(), created=int(time.time()))
+        return plan
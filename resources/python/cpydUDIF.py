@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+Apple UDIF (.dmg) reader and raw image converter. The koly trailer and
+blkx tables are parsed directly, and the independently compressed chunks
+are decoded across a process pool and written straight to their offsets
+in the output image, replacing the old dmg2img handoff.
+
+StreamConverter does the same while the .dmg is still downloading,
+decoding each chunk as soon as the bytes it needs are on disk.
+"""
+
+import os
+import bz2
+import zlib
+import lzma
+import struct
+import plistlib
+import bisect
+import threading
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from cpydSparse import writeSparse, sparsify
+
+try:
+    import lzfse
+    lzfseDecompress = lzfse.decompress
+except ImportError:
+    try:
+        import liblzfse
+        lzfseDecompress = liblzfse.decompress
+    except ImportError:
+        lzfseDecompress = None
+
+SECTOR_SIZE = 512
+KOLY_SIZE = 512
+KOLY_MAGIC = b'koly'
+MISH_MAGIC = b'mish'
+KOLY_HEADER = struct.Struct('>4sIIIQQQQQ')
+KOLY_XML = struct.Struct('>QQ')
+KOLY_XML_OFFSET = 216
+KOLY_SECTORS = struct.Struct('>Q')
+KOLY_SECTORS_OFFSET = 492
+MISH_HEADER = struct.Struct('>4sIQQQII')
+MISH_CHUNK_COUNT_OFFSET = 200
+MISH_CHUNKS_OFFSET = 204
+MISH_CHUNK = struct.Struct('>IIQQQQ')
+
+CHUNK_ZERO = 0x00000000
+CHUNK_RAW = 0x00000001
+CHUNK_IGNORE = 0x00000002
+CHUNK_ADC = 0x80000004
+CHUNK_ZLIB = 0x80000005
+CHUNK_BZIP2 = 0x80000006
+CHUNK_LZFSE = 0x80000007
+CHUNK_LZMA = 0x80000008
+CHUNK_COMMENT = 0x7FFFFFFE
+CHUNK_TERMINATOR = 0xFFFFFFFF
+
+CHUNK_NAMES = {
+    CHUNK_RAW: 'raw',
+    CHUNK_ADC: 'ADC',
+    CHUNK_ZLIB: 'zlib',
+    CHUNK_BZIP2: 'bzip2',
+    CHUNK_LZFSE: 'LZFSE',
+    CHUNK_LZMA: 'LZMA',
+}
+SKIPPED_CHUNKS = (CHUNK_ZERO, CHUNK_IGNORE, CHUNK_COMMENT, CHUNK_TERMINATOR)
+
+# Small chunks are grouped so each task sent to a worker is worth the overhead
+BATCH_SIZE = 8 * 2 ** 20
+
+
+class UDIFError(ValueError):
+    pass
+
+
+class UnsupportedChunkError(UDIFError):
+    pass
+
+
+def adcDecompress(data, size):
+    out = bytearray()
+    i = 0
+    while i < len(data) and len(out) < size:
+        op = data[i]
+        if op & 0x80:
+            # Literal run
+            count = (op & 0x7F) + 1
+            out += data[i + 1:i + 1 + count]
+            i += 1 + count
+            continue
+        if op & 0x40:
+            count = (op & 0x3F) + 4
+            distance = (data[i + 1] << 8) | data[i + 2]
+            i += 3
+        else:
+            count = ((op & 0x3C) >> 2) + 3
+            distance = ((op & 0x03) << 8) | data[i + 1]
+            i += 2
+        start = len(out) - distance - 1
+        if start < 0:
+            raise UDIFError('Invalid ADC back-reference')
+        for index in range(count):
+            out.append(out[start + index])
+    return bytes(out)
+
+
+def decompressChunk(kind, data, size):
+    """
+    A damaged chunk raises UDIFError whatever the decoder, so callers can
+    fall back to dmg2img.
+    """
+    try:
+        if kind == CHUNK_RAW:
+            return data
+        if kind == CHUNK_ZLIB:
+            return zlib.decompress(data)
+        if kind == CHUNK_BZIP2:
+            return bz2.decompress(data)
+        if kind == CHUNK_ADC:
+            return adcDecompress(data, size)
+        if kind == CHUNK_LZMA:
+            return lzma.decompress(data)
+        if kind == CHUNK_LZFSE and lzfseDecompress is not None:
+            return lzfseDecompress(data)
+    except UDIFError:
+        raise
+    except Exception as e:
+        # zlib.error, lzma.LZMAError, OSError from bz2, IndexError from a truncated ADC run, whatever lzfse raises
+        raise UDIFError('Damaged chunk of type 0x{:08X}: {}'.format(kind, e)) from e
+    raise UnsupportedChunkError('Unsupported chunk type 0x{:08X}'.format(kind))
+
+
+class Chunk:
+    """
+    One compressed run of the DMG and where it lands in the raw image.
+    """
+    def __init__(self, kind, inOffset, inLength, outOffset, outLength):
+        self.kind = kind
+        self.inOffset = inOffset
+        self.inLength = inLength
+        self.outOffset = outOffset
+        self.outLength = outLength
+
+
+def parseBlkx(data, dataForkOffset):
+    magic, version, firstSector, sectorCount, dataOffset, buffersNeeded, descriptors = MISH_HEADER.unpack_from(data)
+    if magic != MISH_MAGIC:
+        raise UDIFError('Bad blkx table')
+    count = struct.unpack_from('>I', data, MISH_CHUNK_COUNT_OFFSET)[0]
+    chunks = []
+    for index in range(count):
+        kind, comment, sector, sectors, inOffset, inLength = MISH_CHUNK.unpack_from(data, MISH_CHUNKS_OFFSET + index * MISH_CHUNK.size)
+        if kind == CHUNK_TERMINATOR:
+            break
+        if kind == CHUNK_COMMENT:
+            continue
+        chunks.append(Chunk(kind, dataForkOffset + dataOffset + inOffset, inLength,
+                            (firstSector + sector) * SECTOR_SIZE, sectors * SECTOR_SIZE))
+    return chunks
+
+
+class UDIFImage:
+    """
+    A parsed .dmg. `chunks` lists every data run in output order and
+    `size` is the length of the raw image it expands to.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        if path is not None:
+            with open(path, 'rb') as dmg:
+                dmg.seek(0, os.SEEK_END)
+                length = dmg.tell()
+                self._load(lambda start, end: os.pread(dmg.fileno(), end - start + 1, start), length)
+
+    @classmethod
+    def fromReader(cls, read, length):
+        # read(start, end) returns the inclusive byte range, e.g. over HTTP
+        image = cls()
+        image._load(read, length)
+        return image
+
+    def _load(self, read, length):
+        if length < KOLY_SIZE:
+            raise UDIFError('File is too small to be a DMG')
+        self._parseKoly(read(length - KOLY_SIZE, length - 1))
+        self._parsePlist(read(self.xmlOffset, self.xmlOffset + self.xmlLength - 1))
+
+    def _parseKoly(self, koly):
+        magic, version, headerSize, flags, runningOffset, dataForkOffset, dataForkLength, rsrcOffset, rsrcLength = KOLY_HEADER.unpack_from(koly)
+        if magic != KOLY_MAGIC:
+            raise UDIFError('Missing koly trailer, not a UDIF image')
+        self.dataForkOffset = dataForkOffset
+        self.xmlOffset, self.xmlLength = KOLY_XML.unpack_from(koly, KOLY_XML_OFFSET)
+        self.sectorCount = KOLY_SECTORS.unpack_from(koly, KOLY_SECTORS_OFFSET)[0]
+        if self.xmlLength == 0:
+            raise UDIFError('DMG has no property list')
+
+    def _parsePlist(self, data):
+        try:
+            plist = plistlib.loads(data)
+            blkx = plist['resource-fork']['blkx']
+        except (KeyError, ValueError, plistlib.InvalidFileException) as e:
+            raise UDIFError('Unreadable blkx property list') from e
+        self.partitions = [entry.get('Name', entry.get('CFName', '')) for entry in blkx]
+        self.chunks = []
+        for entry in blkx:
+            self.chunks.extend(parseBlkx(entry['Data'], self.dataForkOffset))
+        self.chunks.sort(key=lambda chunk: chunk.outOffset)
+        end = max((chunk.outOffset + chunk.outLength for chunk in self.chunks), default=0)
+        self.size = max(end, self.sectorCount * SECTOR_SIZE)
+
+    def dataChunks(self):
+        return [chunk for chunk in self.chunks if chunk.kind not in SKIPPED_CHUNKS]
+
+    def unsupported(self):
+        kinds = set(chunk.kind for chunk in self.dataChunks())
+        return sorted(kind for kind in kinds if kind not in CHUNK_NAMES or (kind == CHUNK_LZFSE and lzfseDecompress is None))
+
+    def batches(self):
+        batch = []
+        batchSize = 0
+        for chunk in self.dataChunks():
+            batch.append((chunk.kind, chunk.inOffset, chunk.inLength, chunk.outOffset, chunk.outLength))
+            batchSize += chunk.outLength
+            if batchSize >= BATCH_SIZE:
+                yield batch
+                batch = []
+                batchSize = 0
+        if batch:
+            yield batch
+
+
+_workerFiles = None
+
+
+def _openWorker(src, dest):
+    global _workerFiles
+    # A streamed source may be renamed from its .part name while workers start up
+    for path in ([src] if isinstance(src, str) else src):
+        try:
+            srcFd = os.open(path, os.O_RDONLY)
+            break
+        except FileNotFoundError:
+            srcFd = None
+    if srcFd is None:
+        raise FileNotFoundError(src)
+    _workerFiles = (srcFd, os.open(dest, os.O_WRONLY))
+
+
+def _decodeBatch(batch):
+    srcFd, destFd = _workerFiles
+    written = 0
+    for kind, inOffset, inLength, outOffset, outLength in batch:
+        data = decompressChunk(kind, os.pread(srcFd, inLength, inOffset), outLength)
+        if len(data) != outLength:
+            raise UDIFError('Chunk at {} expanded to {} bytes, expected {}'.format(outOffset, len(data), outLength))
+        # The output starts out as one big hole, so zero blocks are simply skipped
+        writeSparse(destFd, data, outOffset)
+        written += outLength
+    return written
+
+
+def convert(src, dest, workers=None, progress=None):
+    """
+    Expand a .dmg into a raw disk image. `progress` is called with
+    (bytesDone, bytesTotal) as batches complete. Raises
+    UnsupportedChunkError before writing anything if the image uses a
+    compression this build can't decode.
+    """
+    image = UDIFImage(src)
+    unsupported = image.unsupported()
+    if unsupported:
+        raise UnsupportedChunkError('DMG uses unsupported compression: ' + ', '.join('0x{:08X}'.format(kind) for kind in unsupported))
+
+    total = sum(chunk.outLength for chunk in image.dataChunks())
+    temp = dest + '.tmp'
+    with open(temp, 'wb') as out:
+        out.truncate(image.size)
+
+    done = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_openWorker, initargs=(src, temp)) as pool:
+            for written in pool.map(_decodeBatch, image.batches()):
+                done += written
+                if progress is not None:
+                    progress(done, total)
+    except BaseException:
+        os.remove(temp)
+        raise
+    os.replace(temp, dest)
+    return image
+
+
+def convertImage(src, dest, dmg2img=None, workers=None, progress=None):
+    """
+    Convert with the in-process decoder, handing off to the bundled
+    dmg2img binary only for images it can't decode (e.g. LZFSE without
+    the optional lzfse module). Returns the converter that was used, and
+    raises UDIFError if neither produced an image.
+    """
+    try:
+        convert(src, dest, workers, progress)
+        return 'udif'
+    except UDIFError:
+        if dmg2img is None:
+            raise
+    try:
+        result = subprocess.run([dmg2img, src, dest], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+    except OSError as e:
+        raise UDIFError('dmg2img could not be run: ' + str(e)) from e
+    if result.returncode != 0 or not os.path.exists(dest):
+        if os.path.exists(dest):
+            os.remove(dest)
+        raise UDIFError('dmg2img could not convert {} (exit status {})'.format(src, result.returncode))
+    # dmg2img writes every block, so give the zero runs back afterwards
+    sparsify(dest)
+    return 'dmg2img'
+
+
+class StreamConverter:
+    """
+    Decodes a .dmg into a raw image while it is being downloaded. The
+    download reports each finished byte range through segmentDone(), and
+    any chunk whose compressed bytes are now fully on disk is handed to
+    the process pool straight away.
+    """
+
+    def __init__(self, image, sources, dest, segments, workers=None):
+        unsupported = image.unsupported()
+        if unsupported:
+            raise UnsupportedChunkError('DMG uses unsupported compression: ' + ', '.join('0x{:08X}'.format(kind) for kind in unsupported))
+        self.image = image
+        self.source = sources[-1]
+        self.dest = dest
+        self.temp = dest + '.tmp'
+        self.total = sum(chunk.outLength for chunk in image.dataChunks())
+        self.done = 0
+        self.error = None
+        self._lock = threading.Lock()
+        self._jobs = []
+
+        # Work out which download segments each chunk depends on
+        self._segments = sorted(segments)
+        starts = [start for start, _ in self._segments]
+        self._waiting = {}
+        self._dependants = {}
+        for chunk in image.dataChunks():
+            first = bisect.bisect_right(starts, chunk.inOffset) - 1
+            last = bisect.bisect_right(starts, chunk.inOffset + max(chunk.inLength, 1) - 1) - 1
+            needed = set(self._segments[first:last + 1])
+            self._waiting[id(chunk)] = [chunk, len(needed)]
+            for segment in needed:
+                self._dependants.setdefault(segment, []).append(id(chunk))
+
+        with open(self.temp, 'wb') as out:
+            out.truncate(image.size)
+        self._pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_openWorker, initargs=(list(sources), self.temp))
+
+    @classmethod
+    def forDownload(cls, download, dest, workers=None):
+        # Only the trailer and blkx plist are fetched up front, the rest arrives with the download
+        image = UDIFImage.fromReader(download.readRange, download.length)
+        converter = cls(image, [download.partPath, download.path], dest, download.segments(), workers)
+        download.onSegment = converter.segmentDone
+        return converter
+
+    def segmentDone(self, start, end):
+        ready = []
+        with self._lock:
+            for key in self._dependants.pop((start, end), []):
+                entry = self._waiting.get(key)
+                if entry is None:
+                    continue
+                entry[1] -= 1
+                if entry[1] == 0:
+                    chunk = self._waiting.pop(key)[0]
+                    ready.append((chunk.kind, chunk.inOffset, chunk.inLength, chunk.outOffset, chunk.outLength))
+        if ready:
+            job = self._pool.submit(_decodeBatch, ready)
+            with self._lock:
+                self._jobs.append(job)
+            # Outside the lock, as a batch that has already finished runs _batchDone right here
+            job.add_done_callback(self._batchDone)
+
+    def _batchDone(self, job):
+        with self._lock:
+            if job.exception() is not None:
+                if self.error is None:
+                    self.error = job.exception()
+            else:
+                self.done += job.result()
+
+    def finish(self):
+        """
+        Wait for the remaining chunks and move the image into place.
+        Raises if the download left chunks undecoded or a worker failed.
+        """
+        try:
+            with self._lock:
+                pending = len(self._waiting)
+                jobs = list(self._jobs)
+            if pending:
+                raise UDIFError('{} chunks were never downloaded'.format(pending))
+            for job in jobs:
+                job.result()
+        except BaseException:
+            self.abort()
+            raise
+        self._pool.shutdown()
+        os.replace(self.temp, self.dest)
+        return self.image
+
+    def abort(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        if os.path.exists(self.temp):
+            os.remove(self.temp)
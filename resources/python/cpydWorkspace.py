@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+AutoPilot workspaces. A workspace is the folder one VM lives in (boot
+script, disk, NVRAM, preferences and logs), next to a repository that is
+only ever read from. A run holds a lock on its workspace for as long as
+it lives, and shared caches take a lock around every change, so several
+runs can provision VMs on one host at the same time.
+
+What VMs share out between them on one host (CPU cores, hugepages) is
+kept in host registries next to the repository.
+"""
+
+import os
+import json
+import fcntl
+from contextlib import contextmanager
+
+LOCK_FILE = ".autopilot.lock"
+LAYOUT = ("boot", "blobs", "blobs/user", "blobs/stale", "ovmf", "ovmf/user_store", "roms", "resources", "logs")
+
+
+def defaultStateDir(repoDir):
+    return os.environ.get("ULTMOS_STATE_DIR", os.path.join(repoDir, "resources", "state"))
+
+
+class WorkspaceBusy(Exception):
+    """
+    Another run already holds the workspace.
+    """
+
+
+@contextmanager
+def fileLock(path, shared=False):
+    """
+    Hold an flock on path, created if needed, for the length of the block.
+    Shared locks can be held by many processes at once, exclusive by one.
+    """
+    with open(path, "a") as lockFile:
+        fcntl.flock(lockFile.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lockFile.fileno(), fcntl.LOCK_UN)
+
+
+class Workspace:
+    """
+    A VM root plus the repository it is generated from.
+    """
+
+    def __init__(self, root, repoDir):
+        self.root = os.path.realpath(root)
+        self.repoDir = os.path.realpath(repoDir)
+        self._lockFile = None
+
+    @property
+    def isRepo(self):
+        return self.root == self.repoDir
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def repo(self, *parts):
+        return os.path.join(self.repoDir, *parts)
+
+    def prepare(self):
+        for folder in LAYOUT:
+            os.makedirs(self.path(folder), exist_ok=True)
+
+    def acquire(self):
+        """
+        Claim the workspace for this process. The lock goes away with the
+        process, so a crashed run never leaves the workspace stuck.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        lockFile = open(self.path(LOCK_FILE), "a")
+        try:
+            fcntl.flock(lockFile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lockFile.close()
+            raise WorkspaceBusy("Another AutoPilot run is already using "+self.root)
+        self._lockFile = lockFile
+
+    def release(self):
+        if self._lockFile is not None:
+            fcntl.flock(self._lockFile.fileno(), fcntl.LOCK_UN)
+            self._lockFile.close()
+            self._lockFile = None
+
+
+def processAlive(pid):
+    if not isinstance(pid, int) or pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class HostRegistry:
+    """
+    A JSON file of what each VM on the host holds, keyed by the boot script
+    it belongs to. Entries whose script is gone, and whose run has ended,
+    are dropped the next time the registry is read.
+    """
+
+    def __init__(self, folder, fileName):
+        self.folder = folder
+        self.path = os.path.join(folder, fileName)
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as registryFile:
+                entries = json.load(registryFile)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(entries, dict):
+            return {}
+        return {key: entry for key, entry in entries.items() if os.path.exists(key) or processAlive(entry.get("pid", 0))}
+
+    def _save(self, entries):
+        temp = self.path+".tmp"
+        with open(temp, "w") as registryFile:
+            json.dump(entries, registryFile, indent=2, sort_keys=True)
+        os.replace(temp, self.path)
+
+    @contextmanager
+    def edit(self):
+        """
+        The entries, locked against every other run until the block ends,
+        then saved.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        with fileLock(self.path+".lock"):
+            entries = self._load()
+            yield entries
+            self._save(entries)
+
+    def release(self, key):
+        if not os.path.exists(self.path):
+            return
+        with self.edit() as entries:
+            entries.pop(key, None)
+
+    def allocations(self):
+        os.makedirs(self.folder, exist_ok=True)
+        with fileLock(self.path+".lock", shared=True):
+            return self._load()
@@ -28,8 +28,24 @@ import timeit
 import random
 import uuid
 import platform
+import shlex
+import threading
 sys.path.append('./resources/python')
 from cpydColours import color
+from cpydRecoveryCache import RecoveryCache, defaultCacheDir, DEFAULT_CACHE_SIZE
+from cpydUDIF import convertImage
+from cpydSparse import copySparse, moveSparse, allocatedSize
+from cpydPhases import PhaseGraph, PhaseError, DEFAULT_WORKERS
+from cpydPrefs import loadPrefs, setPref, copyPrefs, movePrefs, PrefsError, LIVE_DIR, USER_DIR, STALE_DIR
+from cpydTemplate import loadTemplate, renderTemplate, TemplateError
+from cpydAnswers import loadAnswers, validateAnswers, writeBlobs, AnswerError, EXIT_OK, EXIT_FAILED, EXIT_INVALID_ANSWERS
+from cpydBatch import loadBatch, runBatch, DEFAULT_JOBS
+from cpydWorkspace import Workspace, WorkspaceBusy, defaultStateDir
+from cpydCheckpoint import Checkpoints, CHECKPOINT_FILE, fingerprint
+from cpydStorage import planDisk, createCommand, diskFile, imageFormat, ioOptions, hostStorage, describeStorage, qcow2Geometry, planGeometry, l2CacheSize, DEFAULT_PROFILE
+from cpydTopology import PinningRegistry, readTopology, formatCpuList
+from cpydMemory import HugepageRegistry, readHugepages, planMemory, fleetPlan, hugetlbfsMount, reserveCommand, pageLabel, sizeKiB, DEFAULT_BACKING
+from cpydNetwork import planNetwork, defaultInterface, validInterface, bridgeHelper, macvtapName, BRIDGE_HELPERS, DEFAULT_MODE
 try:
     from pypresence import Presence
 except:
@@ -54,6 +70,18 @@ parser.add_argument("--skip-summary", dest="skipSummary", help="Starts the AutoP
 parser.add_argument("--skip-notices", dest="skipNotices", help="Don't download and load notices",action="store_true")
 parser.add_argument("--no-auto-download", dest="customDownload", help="Asks the user what to download during run",action="store_true")
 parser.add_argument("--no-cleanup", dest="disableCleanup", help="Doesn't clean blob files after run",action="store_true")
+parser.add_argument("--connections", dest="dlConnections", help="Number of parallel connections used to download the recovery image",type=int,default=4)
+parser.add_argument("--cache-dir", dest="cacheDir", help="Directory used to cache downloaded recovery images",type=str,default="")
+parser.add_argument("--cache-size", dest="cacheSize", help="Maximum size of the recovery image cache in GB",type=float,default=DEFAULT_CACHE_SIZE)
+parser.add_argument("--no-cache", dest="disableCache", help="Always download the recovery image, bypassing the cache",action="store_true")
+parser.add_argument("--boot-dmg", dest="bootDmg", help="Attach the recovery DMG directly instead of converting it to a raw image",action="store_true")
+parser.add_argument("--phase-workers", dest="phaseWorkers", help="Number of AutoPilot steps allowed to run at the same time (1 runs them in order)",type=int,default=DEFAULT_WORKERS)
+parser.add_argument("--answers", dest="answers", help="Run headless using the answers in a JSON or YAML file",type=str,default="")
+parser.add_argument("--vm-dir", dest="vmDir", help="Create the VM in this folder instead of the repository",type=str,default="")
+parser.add_argument("--resume", dest="resume", help="Skip the steps a failed run already finished, as long as their files are unchanged",action="store_true")
+parser.add_argument("--batch", dest="batch", help="Generate every VM described in a batch file, each in its own folder",type=str,default="")
+parser.add_argument("--hugepage-plan", dest="hugepagePlan", help="Show how many hugepages every VM generated on this host needs, then exit",action="store_true")
+parser.add_argument("--batch-jobs", dest="batchJobs", help="Number of VMs generated at the same time in batch mode",type=int,default=DEFAULT_JOBS)
 parser.add_argument("--use-local-notices", dest="useLocalNotices", help="Don't fetch online notices, use local only (DEBUG ONLY)",action="store_true")
 
 repoDir = os.path.abspath(os.curdir)
@@ -76,6 +104,8 @@ enableBlobCheck = True
 enableProgress = True
 customDownload = False
 showSummary = True
+minDisplayTime = 0.4 # seconds a status update stays on screen before the next one
+lastDraw = 0
 
 
 
@@ -117,24 +147,32 @@ if args.disablePercentage == True:
 else:
    enablePercentage = True
 
+if args.answers != "" or args.batch != "":
+   enableProgress = False
+   showSummary = False
+
 version = open(repoDir+"/.version")
 version = version.read()
 
+# Paths given on the command line are relative to where AutoPilot was started, not the VM folder
+launchDir = os.path.realpath(os.curdir)
+if args.answers != "":
+   args.answers = os.path.abspath(args.answers)
+if args.cacheDir != "":
+   args.cacheDir = os.path.abspath(args.cacheDir)
+
 dirMode = 1
-nrsDir = os.path.realpath(os.curdir) # PREPARE FOR NRS INTEGRATION
+nrsDir = launchDir # PREPARE FOR NRS INTEGRATION
+if args.vmDir != "" and args.batch == "":
+   nrsDir = os.path.realpath(args.vmDir)
+   dirMode = 2
+   os.makedirs(nrsDir, exist_ok=True)
 os.chdir(nrsDir)
 
+# Everything this run writes lives in the workspace, the repository is only read
+workspace = Workspace(nrsDir, repoDir)
 if dirMode == 2:
-   try:
-      os.mkdir("./boot")
-      os.mkdir("./blobs")
-      os.mkdir("./blobs/user")
-      os.mkdir("./blobs/stale")
-      os.mkdir("./ovmf")
-      os.mkdir("./ovmf/user_store")
-      os.mkdir("./roms")
-   except:
-      None
+   workspace.prepare()
 
 global logTime
 logTime = str(datetime.today().strftime('%d-%m-%Y_%H-%M-%S'))
@@ -183,6 +221,161 @@ cpydLog("info",("Vendor     : "+scriptVendor))
 cpydLog("info",(" "))
 cpydLog("info",("Logging to ./logs/APC_RUN_"+logTime+".log"))
 
+def recoveryCacheDir():
+   return args.cacheDir if args.cacheDir != "" else defaultCacheDir(repoDir)
+
+def dlosxArgs(keepDmg):
+   dlArgs = " --connections "+str(args.dlConnections)
+   if args.disableCache == True:
+      dlArgs = dlArgs+" --no-cache"
+   else:
+      dlArgs = dlArgs+" --cache-dir \""+recoveryCacheDir()+"\" --cache-size "+str(args.cacheSize)
+   if keepDmg == True:
+      dlArgs = dlArgs+" --keep-dmg"
+   return dlArgs
+
+def prefetchRecovery(vms):
+   # Each recovery image is fetched once, through the cache, and handed to every VM
+   # as a local file, so the VMs never download or share the repo's working image
+   keepDmg = args.bootDmg == True
+   imageName = "BaseSystem.dmg" if keepDmg else "BaseSystem.img"
+   targets = {}
+   for vm in vms:
+      if vm["validated"]["USR_BOOT_FILE"] == "-1":
+         targets.setdefault(vm["validated"]["USR_TARGET_OS_ID"], []).append(vm)
+
+   for osID, osVMs in targets.items():
+      imagePath = os.path.join(os.path.dirname(osVMs[0]["dir"]), ".recovery", osID, imageName)
+      os.makedirs(os.path.dirname(imagePath), exist_ok=True)
+      cachedKey = None
+      if keepDmg == False and args.disableCache == False:
+         try:
+            recoveryCache = RecoveryCache(recoveryCacheDir(), args.cacheSize * 2 ** 30)
+            cachedKey = recoveryCache.lookupAlias(osID)
+         except OSError as e:
+            cpydLog("warn",("Recovery cache is unavailable: "+str(e)))
+      method = None
+      if cachedKey is not None:
+         try:
+            method = recoveryCache.place(cachedKey, imagePath)
+         except OSError as e:
+            cpydLog("warn",("Cached "+osID+" recovery image could not be placed: "+str(e)))
+         if method is not None:
+            cpydLog("ok",("Placed cached "+osID+" recovery image using "+method))
+         else:
+            cpydLog("warn",("Cached "+osID+" recovery image "+cachedKey+" is gone, downloading it instead"))
+      if method is None:
+         cpydLog("info",("Downloading the "+osID+" recovery image for "+str(len(osVMs))+" VMs"))
+         dlStatus = subprocess.call(repoDir+"/scripts/dlosx-arg.py -s "+osID+" --disable-progress --image-dir \""+os.path.dirname(imagePath)+"\""+dlosxArgs(keepDmg), shell=True, cwd=repoDir)
+         if dlStatus not in (0, 3) or not os.path.exists(imagePath):
+            return "The "+osID+" recovery image could not be downloaded (status "+str(dlStatus)+")"
+         if dlStatus == 3:
+            cpydLog("warn",("Chunklist could not be loaded, the "+osID+" image was not verified"))
+      for vm in osVMs:
+         vm["answers"]["USR_BOOT_FILE"] = imagePath
+   return None
+
+def batchMode():
+   batchStart = timeit.default_timer()
+   cpydLog("info",("Loading batch from "+args.batch))
+   try:
+      vms = loadBatch(args.batch)
+   except AnswerError as e:
+      for problem in e.problems:
+         cpydLog("error",(problem))
+      print(json.dumps({"status": "invalid", "exitCode": EXIT_INVALID_ANSWERS, "errors": e.problems}))
+      sys.exit(EXIT_INVALID_ANSWERS)
+   cpydLog("ok",("Batch validated, generating "+str(len(vms))+" VMs, "+str(max(1, args.batchJobs))+" at a time"))
+
+   error = prefetchRecovery(vms)
+   if error is not None:
+      cpydLog("error",(error))
+      print(json.dumps({"status": "failed", "exitCode": EXIT_FAILED, "error": error}))
+      sys.exit(EXIT_FAILED)
+
+   def vmCommand(vm, answerPath):
+      command = [sys.executable, repoDir+"/scripts/autopilot.py", "--answers", answerPath, "--vm-dir", vm["dir"], "--disable-rpc", "--phase-workers", str(args.phaseWorkers)]
+      if args.bootDmg == True:
+         command.append("--boot-dmg")
+      if enableLog == False:
+         command.append("--disable-logging")
+      if enableClean == False:
+         command.append("--no-cleanup")
+      return command
+
+   def vmFinished(result):
+      if result["exitCode"] == 0:
+         cpydLog("ok",(result["name"]+" generated in "+str(result["time"])+"s"))
+      else:
+         cpydLog("error",(result["name"]+" failed: "+str(result["error"])))
+
+   results = runBatch(vms, vmCommand, repoDir, args.batchJobs, onFinish=vmFinished)
+   failed = [result["name"] for result in results if result["exitCode"] != 0]
+   summary = {
+      "status": "failed" if failed else "ok",
+      "exitCode": EXIT_FAILED if failed else EXIT_OK,
+      "totalTime": round(timeit.default_timer() - batchStart, 3),
+      "vms": results,
+   }
+   hugepages = fleetPlan(HugepageRegistry(defaultStateDir(repoDir)).allocations(), readHugepages())
+   if hugepages:
+      summary["hugepages"] = hugepages
+   with open(os.path.join(os.path.dirname(vms[0]["dir"]), "batch.json"), "w") as batchFile:
+      json.dump(summary, batchFile, indent=2)
+   cpydLog("info",("Batch finished, "+str(len(results) - len(failed))+" of "+str(len(results))+" VMs generated"))
+   print(json.dumps(summary))
+   sys.exit(summary["exitCode"])
+
+def hugepagePlan():
+   # Every VM generated on this host, running at once
+   plan = fleetPlan(HugepageRegistry(defaultStateDir(repoDir)).allocations(), readHugepages())
+   if not plan:
+      print("\n   No VMs on this host are set up to use hugepages.\n")
+   for label, size in plan.items():
+      print("\n   "+color.BOLD+label+" hugepages"+color.END+": "+str(len(size["vms"]))+" VMs need "+str(size["needed"])+", "+str(size["reserved"])+" are reserved")
+      if size["missing"] > 0:
+         print("   Reserve the rest with: "+size["command"])
+   print()
+   print(json.dumps({"status": "ok", "exitCode": EXIT_OK, "hugepages": plan}))
+   sys.exit(EXIT_OK)
+
+if args.hugepagePlan == True:
+   hugepagePlan()
+
+if args.batch != "":
+   batchMode()
+
+answers = None
+if args.answers != "":
+   cpydLog("info",("Loading answers from "+args.answers))
+   try:
+      answerData = loadAnswers(args.answers)
+      # Local files named in the answers are relative to the launch folder too, as in cpydBatch
+      bootFile = str(answerData.get("USR_BOOT_FILE", "download"))
+      if bootFile not in ("download", "-1", "skip", "-2") and not os.path.isabs(bootFile):
+         answerData["USR_BOOT_FILE"] = os.path.join(launchDir, bootFile)
+      if "USR_HDD_PATH" in answerData:
+         hddPath = str(answerData["USR_HDD_PATH"])
+         if not hddPath.startswith("$") and not os.path.isabs(hddPath):
+            answerData["USR_HDD_PATH"] = os.path.join(launchDir, hddPath)
+      answers = validateAnswers(answerData, resume=args.resume)
+   except AnswerError as e:
+      for problem in e.problems:
+         cpydLog("error",(problem))
+      print(json.dumps({"status": "invalid", "exitCode": EXIT_INVALID_ANSWERS, "errors": e.problems}))
+      sys.exit(EXIT_INVALID_ANSWERS)
+   cpydLog("ok",("Answers validated, running headless"))
+
+try:
+   workspace.acquire()
+except WorkspaceBusy as e:
+   cpydLog("fatal",(str(e)))
+   if answers is not None:
+      print(json.dumps({"status": "failed", "exitCode": EXIT_FAILED, "error": str(e)}))
+   else:
+      print("\n   "+color.BOLD+color.RED+"UNABLE TO CONTINUE"+color.END+"\n   "+str(e)+"\n")
+   sys.exit(EXIT_FAILED)
+
 try:
     RPC = Presence(client_id)
 except:
@@ -322,11 +515,18 @@ def startup():
    #print(color.END+"      Q. Exit\n")
    #detectChoice = str(input(color.BOLD+"Select> "+color.END))
 
-def clear(): print("\n" * 150)
+def clear():
+   if answers is None:
+      print("\n" * 150)
 
-clear()
-startup()
-clear()
+if answers is None:
+   clear()
+   startup()
+   clear()
+else:
+   # Headless runs skip the menu and notices entirely
+   detectChoice = "1"
+   sparkTime = int(time.time())
 
 def showNotice():
    global noticeGoBackAction
@@ -416,11 +616,20 @@ def autopilot():
    global USR_HDD_PATH
    global USR_HDD_TYPE
    global USR_BOOT_FILE
+   global USR_BOOT_FORMAT
    global USR_MAC_ADDRESS
    global USR_SCREEN_RES
    global USR_TARGET_OS_NAME
    global FEATURE_LEVEL
    global USR_CREATE_XML
+   global USR_SMBIOS_SERIAL
+   global USR_SMBIOS_UUID
+   global USR_HDD_PROFILE
+   global USR_HDD_FORMAT
+   global USR_CPU_PINNING
+   global USR_MEMORY_BACKING
+   global USR_NETWORK_MODE
+   global USR_NETWORK_IFACE
    global startTime
 
    USR_CPU_SOCKS = 1
@@ -439,9 +648,18 @@ def autopilot():
    USR_HDD_PATH = "$VM_PATH"
    USR_HDD_TYPE = "HDD"
    USR_BOOT_FILE = "BaseSystem.img"
+   USR_BOOT_FORMAT = "raw"
    USR_MAC_ADDRESS = "00:16:cb:00:21:09"
    USR_SCREEN_RES = "1280x720"
    USR_TARGET_OS_NAME = "Catalina"
+   USR_SMBIOS_SERIAL = ""
+   USR_SMBIOS_UUID = ""
+   USR_HDD_PROFILE = DEFAULT_PROFILE
+   USR_HDD_FORMAT = "qcow2"
+   USR_CPU_PINNING = "auto"
+   USR_MEMORY_BACKING = DEFAULT_BACKING
+   USR_NETWORK_MODE = DEFAULT_MODE
+   USR_NETWORK_IFACE = ""
 
    global currentStage
    currentStage = 1
@@ -459,9 +677,30 @@ def autopilot():
    cpydLog("info",("FEATURE LEVEL "+str(FEATURE_LEVEL)))
    
 
+   # Steps can run side by side, only one of them may draw at a time
+   uiLock = threading.RLock()
+   runningPhases = []
+
+   def pace(seconds):
+      # Work moves on as soon as it's done, this only holds a screen long enough to read
+      if answers is not None:
+         return
+      wait = min(seconds, lastDraw + minDisplayTime - timeit.default_timer())
+      if wait > 0:
+         time.sleep(wait)
+
    def progressUpdate(progressVal,*args):
+      if progressVal >= 0 and len(runningPhases) > 1:
+         # A single bar can't describe several steps at once
+         return
+      with uiLock:
+         drawProgress(progressVal)
+
+   def drawProgress(progressVal):
       global progress
       global progressGUI
+      global lastDraw
+      lastDraw = timeit.default_timer()
       #print('   ─────────────────────────────────────────────────────────────────── \n')
       
       if enableProgress == True:
@@ -645,10 +884,12 @@ def autopilot():
          elif USR_HDD_SIZE == "-2":
             print("   "+color.BOLD+color.CYAN+"DISK    ",color.END+USR_HDD_PATH_F+color.END)
          else:
-            print("   "+color.BOLD+color.CYAN+"DISK    ",color.END+USR_HDD_SIZE_F+" GB (dynamic)"+color.END)
+            print("   "+color.BOLD+color.CYAN+"DISK    ",color.END+USR_HDD_SIZE_F+" GB ("+USR_HDD_PROFILE+" profile)"+color.END)
 
 
-         if USR_MAC_ADDRESS != "00:16:cb:00:21:09":
+         if USR_NETWORK_MODE != "user":
+            print("   "+color.BOLD+color.CYAN+"NETWORK ",color.END+USR_NETWORK_DEVICE+color.END+" ("+USR_NETWORK_MODE+" on "+USR_NETWORK_IFACE+")")
+         elif USR_MAC_ADDRESS != "00:16:cb:00:21:09":
             print("   "+color.BOLD+color.CYAN+"NETWORK ",color.END+USR_NETWORK_DEVICE+color.END+" ("+USR_MAC_ADDRESS+")")
          else:
             print("   "+color.BOLD+color.CYAN+"NETWORK ",color.END+USR_NETWORK_DEVICE+color.END+"")
@@ -804,18 +1045,14 @@ def autopilot():
       if stageSelect == "1":
          cpydLog("ok",str("Using default value of "+str(defaultValue)))
          USR_CREATE_XML = "True"
-         blob = open("./blobs/USR_CREATE_XML.apb","w")
-         blob.write(USR_CREATE_XML)
-         blob.close()
+         setPref(LIVE_DIR, "USR_CREATE_XML", USR_CREATE_XML)
          currentStage = currentStage + 1
          experimentalAudio()
 
       elif stageSelect == "2":
          cpydLog("ok",str("XML generation will be skipped from AP flow"))
          USR_CREATE_XML = "False"
-         blob = open("./blobs/USR_CREATE_XML.apb","w")
-         blob.write(USR_CREATE_XML)
-         blob.close()
+         setPref(LIVE_DIR, "USR_CREATE_XML", USR_CREATE_XML)
          customValue = 1
          experimentalAudio()
 
@@ -888,9 +1125,7 @@ def autopilot():
       if USR_TARGET_OS >= 100 and USR_TARGET_OS <= 1012: 
          cpydLog("warn",str("Custom resolution unsupported on legacy OS, using default value of "+str(defaultValue)))
          USR_SCREEN_RES = "1280x720"
-         blob = open("./blobs/USR_SCREEN_RES.apb","w")
-         blob.write(USR_SCREEN_RES)
-         blob.close()
+         setPref(LIVE_DIR, "USR_SCREEN_RES", USR_SCREEN_RES)
          blob = open("./blobs/.cdn_control","w")
          blob.write("fresh_cdn")
          blob.close()
@@ -899,9 +1134,7 @@ def autopilot():
       if USR_TARGET_OS >= 14 and USR_TARGET_OS <= 14: 
          cpydLog("warn",str("Custom resolution unsupported with Sonoma patching, using default value of "+str(defaultValue)))
          USR_SCREEN_RES = "1280x720"
-         blob = open("./blobs/USR_SCREEN_RES.apb","w")
-         blob.write(USR_SCREEN_RES)
-         blob.close()
+         setPref(LIVE_DIR, "USR_SCREEN_RES", USR_SCREEN_RES)
          blob = open("./blobs/.cdn_control","w")
          blob.write("fresh_cdn")
          blob.close()
@@ -949,9 +1182,7 @@ def autopilot():
             cpydLog("ok",str("Custom value was set to "+str(customInput)))               #+".sh" #<--- change required prefix/suffix
             currentStage = currentStage + 1
             customValue = 0
-            blob = open("./blobs/USR_SCREEN_RES.apb","w")
-            blob.write(USR_SCREEN_RES)
-            blob.close()
+            setPref(LIVE_DIR, "USR_SCREEN_RES", USR_SCREEN_RES)
             stage14()
          else:
             print(color.BOLD+"\n      1. 1280x720")
@@ -972,9 +1203,7 @@ def autopilot():
             if stageSelect == "1":
                cpydLog("ok",str("Using default value of "+str(defaultValue)))
                USR_SCREEN_RES = "1280x720"
-               blob = open("./blobs/USR_SCREEN_RES.apb","w")
-               blob.write(USR_SCREEN_RES)
-               blob.close()
+               setPref(LIVE_DIR, "USR_SCREEN_RES", USR_SCREEN_RES)
                blob = open("./blobs/.cdn_control","w")
                blob.write("fresh_cdn")
                blob.close()
@@ -1079,9 +1308,7 @@ def autopilot():
          cpydLog("ok",str("Custom value was set to "+str(customInput)))               #+".sh" #<--- change required prefix/suffix
          currentStage = currentStage + 1
          customValue = 0
-         blob = open("./blobs/USR_BOOT_FILE.apb","w")
-         blob.write(USR_BOOT_FILE)
-         blob.close()
+         setPref(LIVE_DIR, "USR_BOOT_FILE", USR_BOOT_FILE)
          stage13()
       else:
          if USR_TARGET_OS >= 26 and USR_TARGET_OS <= 1012:
@@ -1109,10 +1336,7 @@ def autopilot():
          elif stageSelect == "1":
             cpydLog("info","Arming download mechanism")
             USR_BOOT_FILE = "-1"
-            blob = open("./blobs/USR_BOOT_FILE.apb","w")
-            blob.write(USR_BOOT_FILE)
-            
-            blob.close()
+            setPref(LIVE_DIR, "USR_BOOT_FILE", USR_BOOT_FILE)
             cpydLog("ok","Downloader armed, will be triggered by AP flow")
             blob = open("./blobs/.cdn_control","w")
             blob.write("fresh_cdn")
@@ -1128,9 +1352,7 @@ def autopilot():
          elif stageSelect == "3":
             cpydLog("warn","No system image will be used in this session")
             USR_BOOT_FILE = "-2"
-            blob = open("./blobs/USR_BOOT_FILE.apb","w")
-            blob.write(USR_BOOT_FILE)
-            blob.close()
+            setPref(LIVE_DIR, "USR_BOOT_FILE", USR_BOOT_FILE)
             blob = open("./blobs/.cdn_control","w")
             blob.write("fresh_cdn")
             blob.close()
@@ -1217,9 +1439,7 @@ def autopilot():
          cpydLog("ok",str("Custom value was set to "+str(customInput)))               #+".sh" #<--- change required prefix/suffix
          currentStage = currentStage + 1
          customValue = 0
-         blob = open("./blobs/USR_MAC_ADDRESS.apb","w")
-         blob.write(USR_MAC_ADDRESS)
-         blob.close()
+         setPref(LIVE_DIR, "USR_MAC_ADDRESS", USR_MAC_ADDRESS)
          stage12()
       else:
          print(color.BOLD+"\n      1. Use default value")
@@ -1241,9 +1461,7 @@ def autopilot():
          if stageSelect == "1":
             cpydLog("ok",str("Using default value of "+str(defaultValue)))
             USR_MAC_ADDRESS = "00:16:cb:00:21:09"
-            blob = open("./blobs/USR_MAC_ADDRESS.apb","w")
-            blob.write(USR_MAC_ADDRESS)
-            blob.close()
+            setPref(LIVE_DIR, "USR_MAC_ADDRESS", USR_MAC_ADDRESS)
             blob = open("./blobs/.cdn_control","w")
             blob.write("fresh_cdn")
             blob.close()
@@ -1261,9 +1479,7 @@ def autopilot():
             USR_MAC_ADDRESS = str("00:16:cb:00:"+macp1+":"+macp2)
             cpydLog("ok",str("Generated MAC address with value "+USR_MAC_ADDRESS))
             cpydLog("info",str("Setting generated MAC address as live variable"))
-            blob = open("./blobs/USR_MAC_ADDRESS.apb","w")
-            blob.write(USR_MAC_ADDRESS)
-            blob.close()
+            setPref(LIVE_DIR, "USR_MAC_ADDRESS", USR_MAC_ADDRESS)
             blob = open("./blobs/.cdn_control","w")
             blob.write("fresh_cdn")
             blob.close()
@@ -1293,6 +1509,8 @@ def autopilot():
 
    def stage10():
       global USR_NETWORK_DEVICE
+      global USR_NETWORK_MODE
+      global USR_NETWORK_IFACE
       global customValue
       global currentStage
       global USR_TARGET_OS
@@ -1356,16 +1574,54 @@ def autopilot():
          customInput = str(input(color.BOLD+"Value> "+color.END))
          cpydLog("ok",("User input received"))
          USR_NETWORK_DEVICE = customInput
+         USR_NETWORK_MODE = "user"
+         USR_NETWORK_IFACE = ""
          cpydLog("ok",str("Custom value was set to "+str(customInput)))               #+".sh" #<--- change required prefix/suffix
          currentStage = currentStage + 1
          customValue = 0
-         blob = open("./blobs/USR_NETWORK_DEVICE.apb","w")
-         blob.write(USR_NETWORK_DEVICE)
-         blob.close()
+         setPref(LIVE_DIR, "USR_NETWORK_DEVICE", USR_NETWORK_DEVICE)
+         setPref(LIVE_DIR, "USR_NETWORK_MODE", USR_NETWORK_MODE)
+         setPref(LIVE_DIR, "USR_NETWORK_IFACE", USR_NETWORK_IFACE)
          stage11()
+      elif customValue == 2:
+         cpydLog("info",str("Host networking requested, setting up"))
+         modes = {"1": "bridge", "2": "tap", "3": "macvtap"}
+         print("\n   Connect the guest straight to the host's network. "+defaultValue+" guests\n   also get vhost-net and, except on a bridge, one queue per vCPU.")
+         print(color.BOLD+"\n      1. Bridge"+color.END+" (on "+(defaultInterface("bridge") or "an existing bridge")+")")
+         print(color.END+"      2. Tap device (on "+defaultInterface("tap")+", set up beforehand)")
+         print(color.END+"      3. Macvtap (on "+(defaultInterface("macvtap") or "a host NIC")+", needs superuser)")
+         print(color.END+"\n      B. Back\n   ")
+         stageSelect = str(input(color.BOLD+"Select> "+color.END))
+
+         if stageSelect in modes:
+            defaultIface = defaultInterface(modes[stageSelect]) or ""
+            print(color.BOLD+color.PURPLE+"\n   FORMAT:"+color.YELLOW+""+color.END+color.BOLD,"<interface name>"+color.YELLOW+""+color.END+"\n   Enter the host interface"+(", or leave it empty for "+defaultIface if defaultIface != "" else "")+".\n   \n   ")
+            cpydLog("wait",("Waiting for user input"))
+            customInput = str(input(color.BOLD+"Interface> "+color.END)).strip() or defaultIface
+            cpydLog("ok",("User input received"))
+            if not validInterface(customInput):
+               cpydLog("warn",str("Interface name "+customInput+" is not valid"))
+               stage10()
+            else:
+               USR_NETWORK_DEVICE = defaultValue
+               USR_NETWORK_MODE = modes[stageSelect]
+               USR_NETWORK_IFACE = customInput
+               cpydLog("ok",str("Using "+USR_NETWORK_MODE+" networking on "+USR_NETWORK_IFACE+" with "+USR_NETWORK_DEVICE))
+               currentStage = currentStage + 1
+               customValue = 0
+               setPref(LIVE_DIR, "USR_NETWORK_DEVICE", USR_NETWORK_DEVICE)
+               setPref(LIVE_DIR, "USR_NETWORK_MODE", USR_NETWORK_MODE)
+               setPref(LIVE_DIR, "USR_NETWORK_IFACE", USR_NETWORK_IFACE)
+               stage11()
+         elif stageSelect == "b" or stageSelect == "B":
+            customValue = 0
+            stage10()
+         else:
+            stage10()
       else:
          print(color.BOLD+"\n      1. Use default value")
          print(color.END+"      2. Custom value...")
+         print(color.END+"      3. Host networking (bridge, tap or macvtap)...")
          print(color.END+"\n      B. Back")
          print(color.END+"      ?. Help")
          print(color.END+"      Q. Exit\n   ")
@@ -1382,9 +1638,11 @@ def autopilot():
          if stageSelect == "1":
             cpydLog("ok",str("Using default value of "+str(defaultValue)))
             USR_NETWORK_DEVICE = defaultValue
-            blob = open("./blobs/USR_NETWORK_DEVICE.apb","w")
-            blob.write(USR_NETWORK_DEVICE)
-            blob.close()
+            USR_NETWORK_MODE = "user"
+            USR_NETWORK_IFACE = ""
+            setPref(LIVE_DIR, "USR_NETWORK_DEVICE", USR_NETWORK_DEVICE)
+            setPref(LIVE_DIR, "USR_NETWORK_MODE", USR_NETWORK_MODE)
+            setPref(LIVE_DIR, "USR_NETWORK_IFACE", USR_NETWORK_IFACE)
             currentStage = currentStage + 1
             stage11()
 
@@ -1392,6 +1650,10 @@ def autopilot():
             customValue = 1
             stage10()
 
+         elif stageSelect == "3":
+            customValue = 2
+            stage10()
+
          elif stageSelect == "b" or stageSelect == "B":
             currentStage = 1
             stage9()
@@ -1470,11 +1732,20 @@ def autopilot():
          #print("   Step 9")
          print("   Select what type of storage your physical disk is. \n   This affects SSD-based features, such as TRIM."+color.END)
          print("\n   "+color.BOLD+color.GREEN+"YOUR DISK:",color.END+color.BOLD+USR_HDD_PATH_F+color.END)
+      hostDisk = hostStorage(USR_HDD_PATH if USR_HDD_ISPHYSICAL == True else nrsDir)
+      if hostDisk["rotational"] is not None:
+         cpydLog("info",str("Disk storage detected as "+describeStorage(hostDisk)))
+         print("   "+color.BOLD+color.CYAN+"DETECTED:",color.END+color.BOLD+("HDD" if hostDisk["rotational"] else "SSD")+color.END+" ("+describeStorage(hostDisk)+")")
+      hostIO = ioOptions(USR_HDD_PATH if USR_HDD_ISPHYSICAL == True else nrsDir)
+      print("   "+color.BOLD+color.CYAN+"I/O:",color.END+color.BOLD+"cache="+hostIO["cache"]+", aio="+hostIO["aio"]+color.END)
+      virtioAllowed = 11 <= USR_TARGET_OS <= 99
       
       print(color.BOLD+"\n      1. Hard disk drive (HDD)")
       print(color.END+"      2. Solid state drive (SSD)")
       if USR_HDD_ISPHYSICAL != True:
          print(color.END+"      3. NVM express (NVMe)")
+      if virtioAllowed:
+         print(color.END+"      4. VirtIO block, with its own I/O thread (fastest)")
       print(color.END+"\n      B. Back")
       print(color.END+"      ?. Help")
       print(color.END+"      Q. Exit\n   ")
@@ -1492,27 +1763,28 @@ def autopilot():
          cpydLog("ok",str("Using default value of "+str(defaultValue)))
          cpydLog("ok",str("Will set disk up as an HDD"))
          USR_HDD_TYPE = defaultValue
-         blob = open("./blobs/USR_HDD_TYPE.apb","w")
-         blob.write(USR_HDD_TYPE)
-         blob.close()
+         setPref(LIVE_DIR, "USR_HDD_TYPE", USR_HDD_TYPE)
          currentStage = currentStage + 1
          stage10()
 
       elif stageSelect == "2":
          cpydLog("ok",str("Will set disk up as an SSD"))
          USR_HDD_TYPE = "SSD"
-         blob = open("./blobs/USR_HDD_TYPE.apb","w")
-         blob.write(USR_HDD_TYPE)
-         blob.close()
+         setPref(LIVE_DIR, "USR_HDD_TYPE", USR_HDD_TYPE)
          currentStage = currentStage + 1
          stage10()
 
       elif stageSelect == "3" and USR_HDD_ISPHYSICAL != True:
          cpydLog("ok",str("Will set disk up as NVMe"))
          USR_HDD_TYPE = "NVMe"
-         blob = open("./blobs/USR_HDD_TYPE.apb","w")
-         blob.write(USR_HDD_TYPE)
-         blob.close()
+         setPref(LIVE_DIR, "USR_HDD_TYPE", USR_HDD_TYPE)
+         currentStage = currentStage + 1
+         stage10()
+
+      elif stageSelect == "4" and virtioAllowed:
+         cpydLog("ok",str("Will set disk up as VirtIO with an I/O thread"))
+         USR_HDD_TYPE = "VirtIO"
+         setPref(LIVE_DIR, "USR_HDD_TYPE", USR_HDD_TYPE)
          currentStage = currentStage + 1
          stage10()
 
@@ -1540,6 +1812,7 @@ def autopilot():
    def stage8():
       global USR_HDD_SIZE
       global USR_HDD_PATH
+      global USR_HDD_PROFILE
       global USR_HDD_PATH_F
       global USR_HDD_ISPHYSICAL
       global customValue
@@ -1594,8 +1867,9 @@ def autopilot():
       #print("   Step 8")
       if customValue != 3:
          print("   Set the maximum virtual hard disk size (capacity). \n   You can also select an existing qcow2 HDD file, or\n   even use a physical disk."+color.END)
-         print("\n   "+color.BOLD+color.CYAN+"NOTE:",color.END+color.BOLD+"The disk file will grow dynamically\n         and is not allocated in full."+color.END)
+         print("\n   "+color.BOLD+color.CYAN+"NOTE:",color.END+color.BOLD+"The disk profile decides how much of\n         the disk file is allocated up front."+color.END)
          print("\n   "+color.BOLD+color.CYAN+"DEFAULT:",color.END+color.BOLD+defaultValue+color.END)
+         print("   "+color.BOLD+color.CYAN+"PROFILE:",color.END+color.BOLD+USR_HDD_PROFILE+color.END)
       elif customValue == 3:
          print("   Instead of a virtual disk, you can use a physical disk\n   attached to your host. Before using a physical disk,\n   you should understand the following:"+color.END)
          print("\n    • The entire disk and its contents are exposed to the guest")
@@ -1610,17 +1884,13 @@ def autopilot():
          cpydLog("wait",("Waiting for user input"))
          customInput = str(input(color.BOLD+"Value> "+color.END))
          cpydLog("ok",("User input received"))
-         USR_HDD_PATH = "$VM_PATH/HDD.qcow2"
+         USR_HDD_PATH = "$VM_PATH/"+diskFile(USR_HDD_PROFILE)
          USR_HDD_SIZE = customInput
          cpydLog("ok",str("Custom value was set to "+str(customInput)))               #+".sh" #<--- change required prefix/suffix
          currentStage = currentStage + 1
          customValue = 0
-         blob = open("./blobs/USR_HDD_PATH.apb","w")
-         blob.write(USR_HDD_PATH)
-         blob.close()
-         blob = open("./blobs/USR_HDD_SIZE.apb","w")
-         blob.write(USR_HDD_SIZE)
-         blob.close()
+         setPref(LIVE_DIR, "USR_HDD_PATH", USR_HDD_PATH)
+         setPref(LIVE_DIR, "USR_HDD_SIZE", USR_HDD_SIZE)
          stage9()
       elif customValue == 2:
          cpydLog("info",str("Custom value requested, setting up"))
@@ -1636,14 +1906,9 @@ def autopilot():
          cpydLog("ok",str("Custom disk file set to "+str(customInput)))               #+".sh" #<--- change required prefix/suffix
          currentStage = currentStage + 1
          customValue = 0
-         blob = open("./blobs/USR_HDD_PATH.apb","w")
-         blob.write(USR_HDD_PATH)
-         blob.close()
-         blob = open("./blobs/USR_HDD_SIZE.apb","w")
-         blob.write("-1")
-         blob = open("./blobs/USR_HDD_ISPHYSICAL.apb","w")
-         blob.write("False")
-         blob.close()
+         setPref(LIVE_DIR, "USR_HDD_PATH", USR_HDD_PATH)
+         setPref(LIVE_DIR, "USR_HDD_SIZE", "-1")
+         setPref(LIVE_DIR, "USR_HDD_ISPHYSICAL", "False")
          stage9()
       elif customValue == 3:
          cpydLog("info",str("Custom value requested, setting up"))
@@ -1661,20 +1926,33 @@ def autopilot():
          cpydLog("ok",str("Physical disk set to "+str(customInput)))               #+".sh" #<--- change required prefix/suffix
          currentStage = currentStage + 1
          customValue = 0
-         blob = open("./blobs/USR_HDD_PATH.apb","w")
-         blob.write(USR_HDD_PATH)
-         blob.close()
-         blob = open("./blobs/USR_HDD_SIZE.apb","w")
-         blob.write("-2")
-         blob = open("./blobs/USR_HDD_ISPHYSICAL.apb","w")
-         blob.write("True")
-         blob.close()
+         setPref(LIVE_DIR, "USR_HDD_PATH", USR_HDD_PATH)
+         setPref(LIVE_DIR, "USR_HDD_SIZE", "-2")
+         setPref(LIVE_DIR, "USR_HDD_ISPHYSICAL", "True")
          stage9()
+      elif customValue == 4:
+         cpydLog("info",str("Disk profile change requested, setting up"))
+         print(color.BOLD+"\n      1. Auto, picked from the host filesystem")
+         print(color.END+"      2. Compact, qcow2 with nothing reserved")
+         print(color.END+"      3. Balanced, qcow2 with its metadata reserved")
+         print(color.END+"      4. Performance, qcow2 with the whole disk reserved")
+         print(color.END+"      5. Raw, raw image reserved with fallocate\n   ")
+         cpydLog("wait",("Waiting for user input"))
+         customInput = str(input(color.BOLD+"Select> "+color.END))
+         cpydLog("ok",("User input received"))
+         profiles = {"1": "auto", "2": "compact", "3": "balanced", "4": "performance", "5": "raw"}
+         if customInput in profiles:
+            USR_HDD_PROFILE = profiles[customInput]
+            cpydLog("ok",str("Disk profile set to "+USR_HDD_PROFILE))
+            setPref(LIVE_DIR, "USR_HDD_PROFILE", USR_HDD_PROFILE)
+         customValue = 0
+         stage8()
       else:
          print(color.BOLD+"\n      1. Use default value")
          print(color.END+"      2. Change capacity...")
          print(color.END+"      3. Use existing...")
          print(color.END+"      4. Switch to physical...")
+         print(color.END+"      5. Change disk profile...")
          print(color.END+"\n      B. Back")
          print(color.END+"      ?. Help")
          print(color.END+"      Q. Exit\n   ")
@@ -1691,15 +1969,10 @@ def autopilot():
          if stageSelect == "1":
             cpydLog("ok",str("Using default value of "+str(defaultValue)))
             USR_HDD_SIZE = defaultValue
-            USR_HDD_PATH = "$VM_PATH/HDD.qcow2"
-            blob = open("./blobs/USR_HDD_PATH.apb","w")
-            blob.write(USR_HDD_PATH)
-            blob.close()
-            blob = open("./blobs/USR_HDD_SIZE.apb","w")
-            blob.write(USR_HDD_SIZE)
-            blob = open("./blobs/USR_HDD_ISPHYSICAL.apb","w")
-            blob.write("False")
-            blob.close()
+            USR_HDD_PATH = "$VM_PATH/"+diskFile(USR_HDD_PROFILE)
+            setPref(LIVE_DIR, "USR_HDD_PATH", USR_HDD_PATH)
+            setPref(LIVE_DIR, "USR_HDD_SIZE", USR_HDD_SIZE)
+            setPref(LIVE_DIR, "USR_HDD_ISPHYSICAL", "False")
             currentStage = currentStage + 1
             stage9()
 
@@ -1715,6 +1988,10 @@ def autopilot():
             customValue = 3
             stage8()
 
+         elif stageSelect == "5":
+            customValue = 4
+            stage8()
+
          elif stageSelect == "b" or stageSelect == "B":
             currentStage = 1
             stage7()
@@ -1786,6 +2063,11 @@ def autopilot():
       #print("   Step 7")
       print("   Choose how much memory the guest can use. \n   As a general rule and for max performance, use no\n   more than half of your total host memory."+color.END)
       print("\n   "+color.BOLD+color.CYAN+"DEFAULT:",color.END+color.BOLD+defaultValue+color.END)
+      hugepagePools = readHugepages()
+      reservedPages = [str(pool["free"])+" of "+str(pool["total"])+" "+pageLabel(pageSize)+" free" for pageSize, pool in sorted(hugepagePools.items()) if pool["total"] > 0]
+      if reservedPages:
+         cpydLog("info",str("Hugepages reserved on host: "+", ".join(reservedPages)))
+         print("   "+color.BOLD+color.CYAN+"HUGEPAGES:",color.END+color.BOLD+", ".join(reservedPages)+color.END+" (used if there are enough)")
       if customValue == 1:
          cpydLog("info",str("Custom value requested, setting up"))
       #   print(color.BOLD+color.PURPLE+"\n   FORMAT:"+color.YELLOW+""+color.END+color.BOLD,"<>"+color.YELLOW+""+color.END+"\n   Enter a custom value.\n   \n   ")
@@ -1797,9 +2079,7 @@ def autopilot():
          cpydLog("ok",str("Custom value was set to "+str(customInput)))              #+".sh" #<--- change required prefix/suffix
          currentStage = currentStage + 1
          customValue = 0
-         blob = open("./blobs/USR_ALLOCATED_RAM.apb","w")
-         blob.write(USR_ALLOCATED_RAM)
-         blob.close()
+         setPref(LIVE_DIR, "USR_ALLOCATED_RAM", USR_ALLOCATED_RAM)
          stage8()
       else:
          print(color.BOLD+"\n      1. Use default value")
@@ -1820,9 +2100,7 @@ def autopilot():
          if stageSelect == "1":
             cpydLog("ok",str("Using default value of "+str(defaultValue)))
             USR_ALLOCATED_RAM = defaultValue
-            blob = open("./blobs/USR_ALLOCATED_RAM.apb","w")
-            blob.write(USR_ALLOCATED_RAM)
-            blob.close()
+            setPref(LIVE_DIR, "USR_ALLOCATED_RAM", USR_ALLOCATED_RAM)
             currentStage = currentStage + 1
             stage8()
 
@@ -1912,9 +2190,7 @@ def autopilot():
          cpydLog("ok",str("Custom value was set to "+str(customInput)))               #+".sh" #<--- change required prefix/suffix
          currentStage = currentStage + 1
          customValue = 0
-         blob = open("./blobs/USR_CPU_FEATURE_ARGS.apb","w")
-         blob.write(USR_CPU_FEATURE_ARGS)
-         blob.close()
+         setPref(LIVE_DIR, "USR_CPU_FEATURE_ARGS", USR_CPU_FEATURE_ARGS)
          stage7()
       else:
          print(color.BOLD+"\n      1. Use default value")
@@ -1935,9 +2211,7 @@ def autopilot():
          if stageSelect == "1":
             cpydLog("ok",str("Using default value of "+str(defaultValue)))
             USR_CPU_FEATURE_ARGS = defaultValue
-            blob = open("./blobs/USR_CPU_FEATURE_ARGS.apb","w")
-            blob.write(USR_CPU_FEATURE_ARGS)
-            blob.close()
+            setPref(LIVE_DIR, "USR_CPU_FEATURE_ARGS", USR_CPU_FEATURE_ARGS)
             currentStage = currentStage + 1
             stage7()
 
@@ -2031,9 +2305,7 @@ def autopilot():
          cpydLog("ok",str("Custom value was set to "+str(customInput)))               #+".sh" #<--- change required prefix/suffix
          currentStage = currentStage + 1
          customValue = 0
-         blob = open("./blobs/USR_CPU_MODEL.apb","w")
-         blob.write(USR_CPU_MODEL)
-         blob.close()
+         setPref(LIVE_DIR, "USR_CPU_MODEL", USR_CPU_MODEL)
          stage6()
       else:
          print(color.BOLD+"\n      1. Use default value")
@@ -2054,9 +2326,7 @@ def autopilot():
          if stageSelect == "1":
             cpydLog("ok",str("Using default value of "+str(defaultValue)))
             USR_CPU_MODEL = defaultValue
-            blob = open("./blobs/USR_CPU_MODEL.apb","w")
-            blob.write(USR_CPU_MODEL)
-            blob.close()
+            setPref(LIVE_DIR, "USR_CPU_MODEL", USR_CPU_MODEL)
             currentStage = currentStage + 1
             stage6()
 
@@ -2144,9 +2414,7 @@ def autopilot():
          cpydLog("ok",str("Custom value was set to "+str(customInput)))               #+".sh" #<--- change required prefix/suffix
          currentStage = currentStage + 1
          customValue = 0
-         blob = open("./blobs/USR_CPU_THREADS.apb","w")
-         blob.write(str(USR_CPU_THREADS))
-         blob.close()
+         setPref(LIVE_DIR, "USR_CPU_THREADS", str(USR_CPU_THREADS))
          stage5()
       else:
          print(color.BOLD+"\n      1. Use default value")
@@ -2167,9 +2435,7 @@ def autopilot():
          if stageSelect == "1":
             cpydLog("ok",str("Using default value of "+str(defaultValue)))
             USR_CPU_THREADS = defaultValue
-            blob = open("./blobs/USR_CPU_THREADS.apb","w")
-            blob.write(str(USR_CPU_THREADS))
-            blob.close()
+            setPref(LIVE_DIR, "USR_CPU_THREADS", str(USR_CPU_THREADS))
             currentStage = currentStage + 1
             stage5()
 
@@ -2299,9 +2565,7 @@ def autopilot():
       except:
          None
 
-      blob = open("./blobs/USR_TARGET_OS_NAME.apb","w")
-      blob.write(str(USR_TARGET_OS_NAME))
-      blob.close()
+      setPref(LIVE_DIR, "USR_TARGET_OS_NAME", str(USR_TARGET_OS_NAME))
 
       if USR_TARGET_OS == 26:
          USR_TARGET_OS_ID = "tahoe"
@@ -2350,9 +2614,7 @@ def autopilot():
          cpydLog("ok",str("Custom value was set to "+str(customInput)))               #+".sh" #<--- change required prefix/suffix
          currentStage = currentStage + 1
          customValue = 0
-         blob = open("./blobs/USR_CPU_CORES.apb","w")
-         blob.write(str(USR_CPU_CORES))
-         blob.close()
+         setPref(LIVE_DIR, "USR_CPU_CORES", str(USR_CPU_CORES))
          stage4()
       else:
          print(color.BOLD+"\n      1. Use default value")
@@ -2373,9 +2635,7 @@ def autopilot():
          if stageSelect == "1":
             cpydLog("ok",str("Using default value of "+str(defaultValue)))
             USR_CPU_CORES = defaultValue
-            blob = open("./blobs/USR_CPU_CORES.apb","w")
-            blob.write(str(USR_CPU_CORES))
-            blob.close()
+            setPref(LIVE_DIR, "USR_CPU_CORES", str(USR_CPU_CORES))
             currentStage = currentStage + 1
             stage4()
 
@@ -2510,9 +2770,7 @@ def autopilot():
          customValue = 0
          #if USR_TARGET_OS > 110 and USR_TARGET_OS < 999:
          #   USR_TARGET_OS = USR_TARGET_OS * 10
-         blob = open("./blobs/USR_TARGET_OS.apb","w")
-         blob.write(str(USR_TARGET_OS))
-         blob.close()
+         setPref(LIVE_DIR, "USR_TARGET_OS", str(USR_TARGET_OS))
          stage3()
 
       elif customValue == 2:
@@ -2547,9 +2805,7 @@ def autopilot():
          customValue = 0
          #if USR_TARGET_OS > 110 and USR_TARGET_OS < 999:
          #   USR_TARGET_OS = USR_TARGET_OS * 10
-         blob = open("./blobs/USR_TARGET_OS.apb","w")
-         blob.write(str(USR_TARGET_OS))
-         blob.close()
+         setPref(LIVE_DIR, "USR_TARGET_OS", str(USR_TARGET_OS))
          stage3()
       else:
          print(color.BOLD+"\n      1. Use default value")
@@ -2570,9 +2826,7 @@ def autopilot():
          if stageSelect == "1":
             cpydLog("ok",str("Using default value of "+str(defaultValue)))
             USR_TARGET_OS = defaultValue
-            blob = open("./blobs/USR_TARGET_OS.apb","w")
-            blob.write(str(USR_TARGET_OS))
-            blob.close()
+            setPref(LIVE_DIR, "USR_TARGET_OS", str(USR_TARGET_OS))
             currentStage = 3
             stage3()
 
@@ -2706,7 +2960,7 @@ def autopilot():
       cpydLog("ok",str("Stage 1 sequence initiated"))
       # remove stale blobs
       cpydLog("ok",str("Removing stale blobs"))
-      os.system("mv -f ./blobs/*.apb ./blobs/stale/")
+      movePrefs(LIVE_DIR, STALE_DIR)
       #os.system("mv -f /blobs/CDN_CONTROL ./blobs/stale/")
       defaultValue = "boot.sh"
       clear()
@@ -2731,9 +2985,7 @@ def autopilot():
          cpydLog("ok",str("Custom value was set to "+str(customInput)))               #+".sh" #<--- change required prefix/suffix
          currentStage = 2
          customValue = 0
-         blob = open("./blobs/USR_CFG.apb","w")
-         blob.write(USR_CFG)
-         blob.close()
+         setPref(LIVE_DIR, "USR_CFG", USR_CFG)
          stage2()
 
       else:
@@ -2755,9 +3007,7 @@ def autopilot():
          if stageSelect == "1":
             cpydLog("ok",str("Using default value of "+str(defaultValue)))
             USR_CFG = "boot.sh"
-            blob = open("./blobs/USR_CFG.apb","w")
-            blob.write(USR_CFG)
-            blob.close()
+            setPref(LIVE_DIR, "USR_CFG", USR_CFG)
             currentStage = 2
             stage2()
 
@@ -2805,7 +3055,16 @@ def autopilot():
    PROC_CLEANUP = 0
 
 
-   def handoff():
+   def handoff(resume=False):
+      global USR_BOOT_FORMAT
+      global USR_CPU_THREADS
+      global USR_CPU_TOTAL_F
+      global USR_CFG
+      global USR_ALLOCATED_RAM
+      global USR_HDD_FORMAT
+      global USR_HDD_SIZE_B
+      global USR_TARGET_OS
+      global USR_NETWORK_DEVICE
       global PROC_PREPARE
       global PROC_CHECKBLOBS
       global PROC_GENCONFIG
@@ -2843,7 +3102,7 @@ def autopilot():
       except:
          None
       clear()
-      time.sleep(2)
+      pace(2)
 
       
 
@@ -2854,13 +3113,173 @@ def autopilot():
          PROC_FETCHDL = -1
          PROC_LOCALCOPY = 0
 
+      # QEMU can attach the recovery DMG read-only, which skips the conversion entirely
+      if args.bootDmg == True and (USR_BOOT_FILE == "-1" or USR_BOOT_FILE.strip("\"' ").lower().endswith(".dmg")):
+         USR_BOOT_FORMAT = "dmg"
+         cpydLog("info",("BaseSystem will be attached as a DMG, skipping conversion"))
+
+      # The script and XML must open the disk in the format it really is
+      diskPlan = None
+      if USR_HDD_ISPHYSICAL == True:
+         USR_HDD_FORMAT = "raw"
+         hddLocation = USR_HDD_PATH
+      elif USR_HDD_SIZE == "-1":
+         USR_HDD_FORMAT = imageFormat(USR_HDD_PATH.replace("$VM_PATH",nrsDir)) or "qcow2"
+         hddLocation = os.path.dirname(USR_HDD_PATH.replace("$VM_PATH",nrsDir)) or nrsDir
+      else:
+         if USR_TARGET_OS >= 1013:
+            USR_HDD_SIZE_B = int(USR_HDD_SIZE.replace("G","")) * 1000000000 + 209756160
+         elif USR_TARGET_OS >= 13 and USR_TARGET_OS <= 99:
+            USR_HDD_SIZE_B = int(USR_HDD_SIZE.replace("G","")) * 1000000000 + 209756160
+         else:
+            USR_HDD_SIZE_B = int(USR_HDD_SIZE.replace("G","")) * 1000000000 + 343973888
+         diskPlan = planDisk(nrsDir, USR_HDD_SIZE_B, USR_HDD_PROFILE)
+         USR_HDD_FORMAT = diskPlan["format"]
+         hddLocation = nrsDir
+      cpydLog("info",("Virtual disk will be attached as "+USR_HDD_FORMAT))
+
+      # How QEMU opens the disk follows the storage it actually sits on
+      hddIO = ioOptions(hddLocation, diskPlan is not None and diskPlan["options"].get("preallocation") in ("falloc", "full"))
+      cpydLog("info",("Disk is stored on "+describeStorage(hddIO["storage"])+", using cache="+hddIO["cache"]+" aio="+hddIO["aio"]+" discard="+hddIO["discard"]+" detect-zeroes="+hddIO["detectZeroes"]))
+
+      # Enough L2 cache for the whole disk, so no read waits on qcow2 metadata
+      hddL2Cache = ""
+      if USR_HDD_FORMAT == "qcow2":
+         hddGeometry = planGeometry(diskPlan, USR_HDD_SIZE_B) if diskPlan is not None else qcow2Geometry(USR_HDD_PATH.replace("$VM_PATH",nrsDir))
+         if hddGeometry is not None:
+            hddL2Cache = l2CacheSize(hddGeometry)
+            cpydLog("info",("qcow2 L2 cache set to "+str(hddL2Cache)+" bytes for "+str(hddGeometry["clusterSize"] // 1024)+"K clusters"))
+
+      # Whole host cores of its own, kept apart from every other VM on this host
+      cpuPins = None
+      pinning = PinningRegistry(defaultStateDir(repoDir))
+      try:
+         if USR_CPU_PINNING == "auto":
+            cpuPins = pinning.allocate(workspace.path(USR_CFG), readTopology(), int(USR_CPU_TOTAL_F), int(USR_CPU_THREADS))
+         else:
+            pinning.release(workspace.path(USR_CFG))
+      except OSError as e:
+         cpydLog("warn",("CPU pinning registry could not be used: "+str(e)))
+      if cpuPins is not None:
+         cpydLog("info",("vCPUs pinned to host CPUs "+formatCpuList(cpuPins["cpus"])+" ("+cpuPins["reason"]+"), emulator threads to "+formatCpuList(cpuPins["emulator"])))
+      elif USR_CPU_PINNING == "auto":
+         cpydLog("warn",("Not enough free host cores to pin "+USR_CPU_TOTAL_F+" vCPUs, leaving them unpinned"))
+
+      # Hugepages are planned against what every other VM on this host counts on
+      hugepagePools = readHugepages()
+      try:
+         memoryPlan = HugepageRegistry(defaultStateDir(repoDir)).reserve(workspace.path(USR_CFG), sizeKiB(USR_ALLOCATED_RAM), USR_MEMORY_BACKING, hugepagePools)
+      except (OSError, ValueError) as e:
+         cpydLog("warn",("Hugepage registry could not be used: "+str(e)))
+         memoryPlan = planMemory(0, "off", hugepagePools)
+      hugepagePath = ""
+      if memoryPlan["backing"] == "hugepages":
+         hugepagePath = hugetlbfsMount(memoryPlan["pageSize"]) or ""
+      cpydLog("info" if memoryPlan["enough"] else "warn",("Guest memory is "+memoryPlan["reason"]))
+      if memoryPlan["backing"] == "hugepages" and not memoryPlan["enough"]:
+         cpydLog("warn",("Reserve them before booting with: "+reserveCommand(memoryPlan["pageSize"], memoryPlan["needed"])))
+
+      # vhost-net and one queue per vCPU when the guest is on a host interface with virtio-net
+      networkPlan = planNetwork(USR_NETWORK_MODE, USR_NETWORK_DEVICE, int(USR_CPU_TOTAL_F), USR_NETWORK_IFACE)
+      cpydLog("info",("Network is "+networkPlan["reason"]))
+      for warning in networkPlan["warnings"]:
+         cpydLog("warn",(warning))
+
+      # QEMU makes its backing file in the mount as whoever boots the VM, memfd needs no mount at all
+      bootsAsRoot = USR_HDD_ISPHYSICAL == True or networkPlan["mode"] == "macvtap"
+      if hugepagePath != "" and bootsAsRoot == False and not os.access(hugepagePath, os.W_OK):
+         cpydLog("info",("Hugepage mount "+hugepagePath+" is not writable, backing guest memory with memfd instead"))
+         hugepagePath = ""
+
+      # Checkpoints only carry over to a run asked to do exactly the same thing
+      resume = resume or args.resume
+      try:
+         runInputs = fingerprint({"prefs": loadPrefs(LIVE_DIR), "version": version, "featureLevel": FEATURE_LEVEL, "bootFormat": USR_BOOT_FORMAT})
+      except PrefsError:
+         runInputs = None
+         resume = False
+      checkpoints = Checkpoints(nrsDir, workspace.path("blobs", CHECKPOINT_FILE), runInputs)
+      if resume != True:
+         checkpoints.clear()
+
+      phaseTimes = {}
+      phaseStarts = {}
+      phasesFailed = []
+      phasesResumed = []
+      phaseLocal = threading.local()
+
+      # Steps work in the workspace and hand the repo to subprocesses as their cwd, never chdir
+      phaseWorkers = max(1, args.phaseWorkers)
+
+      def setErrorMessage(message):
+         # Kept per thread too, so a step running alongside can't replace the message
+         global errorMessage
+         errorMessage = message
+         phaseLocal.errorMessage = message
+
+      def phaseStarted(name):
+         phaseStarts[name] = round(timeit.default_timer() - startTime, 3)
+         runningPhases.append(name)
+         cpydLog("info",(name+" started"))
+
+      def phaseFinished(name, elapsed):
+         runningPhases.remove(name)
+         phaseTimes[name] = elapsed
+         cpydLog("info",(name+" finished in "+str(elapsed)+"s"))
+
+      def writeTrace(status):
+         # Real wall time of each step, kept next to the run log
+         if enableLog != True:
+            return
+         trace = {
+            "status": status,
+            "workers": phaseWorkers,
+            "totalTime": round(timeit.default_timer() - startTime, 3),
+            "phases": [{"name": name, "start": phaseStarts[name], "time": phaseTimes.get(name), "failed": name in phasesFailed} for name in phaseStarts],
+            "resumed": phasesResumed,
+         }
+         try:
+            with open("./logs/APC_RUN_"+logTime+".trace.json","w") as traceFile:
+               json.dump(trace, traceFile, indent=2)
+            cpydLog("info",("Step timings written to ./logs/APC_RUN_"+logTime+".trace.json"))
+         except OSError as e:
+            cpydLog("warn",("Could not write step timings: "+str(e)))
+
+      def headlessSummary(status, exitCode, error=None):
+         # Last line of output, for whatever is driving the headless run
+         summary = {
+            "status": status,
+            "exitCode": exitCode,
+            "config": USR_CFG,
+            "xml": USR_CFG_XML if USR_CREATE_XML == "True" else None,
+            "log": "./logs/APC_RUN_"+logTime+".log" if enableLog == True else None,
+            "totalTime": round(timeit.default_timer() - startTime, 3),
+            "phases": phaseTimes,
+         }
+         if resume == True:
+            summary["resumed"] = phasesResumed
+         if memoryPlan["backing"] == "hugepages":
+            summary["hugepages"] = {"pageSize": pageLabel(memoryPlan["pageSize"]), "pages": memoryPlan["pages"], "fleetNeeds": memoryPlan["needed"], "reserved": hugepagePools[memoryPlan["pageSize"]]["total"], "enough": memoryPlan["enough"]}
+         if error is not None:
+            summary["error"] = error.replace("\n           "," ")
+            summary["failedPhase"] = phasesFailed[-1] if phasesFailed else None
+         cpydLog("info",("Headless run "+status+" with exit code "+str(exitCode)))
+         print(json.dumps(summary))
+         sys.exit(exitCode)
+
       def throwError():
+         if threading.current_thread() is not threading.main_thread():
+            # Stop the scheduler, the error is shown once everything running has settled
+            raise PhaseError(getattr(phaseLocal, "errorMessage", errorMessage))
          clear()
          try: # DISCORD RPC
            RPC.update(large_image=osIcon,large_text=projectVer,details="AutoPilot",state=errorMessage,start=sparkTime,buttons=([{"label": "View on GitHub", "url": "https://github.com/Coopydood/ultimate-macOS-KVM"}])) 
          except:
             None
          cpydLog("error",(errorMessage))
+         if answers is not None:
+            # Nobody to ask, report the failure and stop
+            headlessSummary("failed", EXIT_FAILED, errorMessage)
          print("\n   "+color.BOLD+color.RED+"UNABLE TO CONTINUE"+color.END)
          print("   Unable to continue")
          print("\n   Sorry, something happened and AutoPilot cannot recover. \n   You may try again, or start over from the beginning.\n   If you think this was a bug, please report it on GitHub."+color.END)
@@ -2872,8 +3291,8 @@ def autopilot():
          stageSelectE = str(input(color.BOLD+"Select> "+color.END))
          clear()
          if stageSelectE == "1":
-            time.sleep(2)
-            handoff()
+            pace(2)
+            handoff(resume=True)
 
          elif stageSelectE == "2":
             os.system("./scripts/autopilot.py")
@@ -2883,10 +3302,21 @@ def autopilot():
             exit
 
       def refreshStatusGUI():
+         if answers is not None:
+            return
+         with uiLock:
+            drawStatusGUI()
+
+      def drawStatusGUI():
+         global lastDraw
+         lastDraw = timeit.default_timer()
          clear()
          cpydLog("ok",("Updating status UI"))
          print("   "+"\n   "+color.BOLD+"Status"+color.END)
-         print("   "+"AutoPilot is performing the requested actions.")
+         if len(runningPhases) > 1:
+            print("   "+"AutoPilot is performing "+str(len(runningPhases))+" of the requested actions at once.")
+         else:
+            print("   "+"AutoPilot is performing the requested actions.")
          print("   "+"\n   This may take a few moments."+color.END)
          print("   "+"\n   "+color.BOLD+"───────────────────────────────────────────────────────────────────",color.END)
 
@@ -2979,7 +3409,7 @@ def autopilot():
             #print("\n\n\n")
 
       refreshStatusGUI()
-      time.sleep(3)
+      pace(3)
 
       def apcPrepare():    # PREPARE
          global PROC_PREPARE
@@ -2993,14 +3423,17 @@ def autopilot():
          except:
             None
 
-         global errorMessage
-         errorMessage = "Couldn't prepare files. You may have insufficient\n           permissions or damaged files."
+         setErrorMessage("Couldn't prepare files. You may have insufficient\n           permissions or damaged files.")
          refreshStatusGUI()
          cpydLog("info",("Setting up environment"))
-         os.system("cp "+repoDir+"/resources/baseConfig "+repoDir+"/resources/config.sh")
+         try:
+            loadTemplate(repoDir+"/resources/baseConfig")
+         except (OSError, TemplateError) as e:
+            cpydLog("error",("Could not compile baseConfig: "+str(e)))
+            throwError()
          progressUpdate(12)
-         cpydLog("ok",("Copied baseConfig into live working file"))
-         time.sleep(1)
+         cpydLog("ok",("Compiled baseConfig template"))
+         pace(1)
          cpydLog("info",("Setting up OpenCore image"))
          if os.path.exists("boot/OpenCore.qcow2"):
             cpydLog("warn",("Existing OpenCore image found"))
@@ -3013,7 +3446,7 @@ def autopilot():
             #os.system("mv boot/EFI boot/"+backupOCPath+"/EFI")
             cpydLog("ok",("Existing image backed up to ./boot/"+str(datetime.today().strftime('%d-%m-%Y_%H-%M-%S'))))
             #os.system("rm -rf boot/EFI")
-            time.sleep(2)
+            pace(2)
          cpydLog("info",("Selecting appropriate OpenCore image"))
          if USR_TARGET_OS <= 1015 and USR_TARGET_OS >= 1013 and USR_TARGET_OS > 99:
             cpydLog("ok",("Selected OLD OpenCore image"))
@@ -3065,13 +3498,7 @@ def autopilot():
          
          cpydLog("info",("Performing integrity check"))
          integrityConfig = 1
-         if os.path.exists(""+repoDir+"/resources/config.sh"):
-            integrityConfig = integrityConfig + 0
-         else:
-            integrityConfig = integrityConfig - 1
-            cpydLog("error",("Integrity check FAILED for config file"))
-            throwError()
-         time.sleep(0.5)
+         pace(0.5)
          progressUpdate(74)
          if os.path.exists("boot/OpenCore.qcow2"):
             integrityConfig = integrityConfig + 0
@@ -3092,7 +3519,7 @@ def autopilot():
          PROC_PREPARE = 2
          cpydLog("ok",("Updated stage status, handing off to next stage"))
          progressUpdate(100)
-         time.sleep(1)
+         pace(1)
          refreshStatusGUI()
 
       def apcBlobCheck():  # CHECK BLOBS
@@ -3104,78 +3531,21 @@ def autopilot():
             RPC.update(large_image=osIcon,large_text=projectVer,state="Checking preferences...",details="AutoPilot",small_image="doodrestart",small_text="Running...",start=sparkTime,buttons=([{"label": "View on GitHub", "url": "https://github.com/Coopydood/ultimate-macOS-KVM"}])) 
          except:
             None
-         global errorMessage
-         errorMessage = "The integrity of the wizard preference files\n           could not be verified."
+         setErrorMessage("The integrity of the wizard preference files\n           could not be verified.")
          integrity = 1
          refreshStatusGUI()
          progressUpdate(16)
-         time.sleep(4)
-         if os.path.exists("blobs/USR_ALLOCATED_RAM.apb"):
-            integrity = integrity + 0
-         else:
-            integrity = integrity - 1
-            cpydLog("error",("USR_ALLOCATED_RAM blob integrity failure"))
-            #print("DEBUG: FOUND")
-         if os.path.exists("blobs/USR_BOOT_FILE.apb"):
-            integrity = integrity + 0
-         else:
-            integrity = integrity - 1
-            cpydLog("error",("USR_BOOT_FILE blob integrity failure"))
-         if os.path.exists("blobs/USR_CFG.apb"):
-            integrity = integrity + 0
-         else:
-            integrity = integrity - 1
-            cpydLog("error",("USR_CFG blob integrity failure"))
-         if os.path.exists("blobs/USR_CPU_CORES.apb"):
-            integrity = integrity + 0
-         else:
-            integrity = integrity - 1
-            cpydLog("error",("USR_CPU_CORES blob integrity failure"))
-         if os.path.exists("blobs/USR_CPU_FEATURE_ARGS.apb"):
-            integrity = integrity + 0
-         else:
-            integrity = integrity - 1
-            cpydLog("error",("USR_CPU_FEATURE_ARGS blob integrity failure"))
-         if os.path.exists("blobs/USR_CPU_MODEL.apb"):
-            integrity = integrity + 0
-         else:
-            integrity = integrity - 1
-            cpydLog("error",("USR_CPU_MODEL blob integrity failure"))
-         if os.path.exists("blobs/USR_CPU_THREADS.apb"):
-            integrity = integrity + 0
-         else:
-            integrity = integrity - 1
-            cpydLog("error",("USR_CPU_THREADS blob integrity failure"))
-         if os.path.exists("blobs/USR_HDD_SIZE.apb"):
-            integrity = integrity + 0
-         else:
-            integrity = integrity - 1
-            cpydLog("error",("USR_HDD_SIZE blob integrity failure"))
-         if os.path.exists("blobs/USR_NETWORK_DEVICE.apb"):
-            integrity = integrity + 0
-         else:
-            integrity = integrity - 1
-            cpydLog("error",("USR_NETWORK_DEVICE blob integrity failure"))
-         if os.path.exists("blobs/USR_TARGET_OS.apb"):
-            integrity = integrity + 0
-         else:
-            integrity = integrity - 1
-            cpydLog("error",("USR_TARGET_OS blob integrity failure"))
-         if os.path.exists("blobs/USR_MAC_ADDRESS.apb"):
-            integrity = integrity + 0
-         else:
-            integrity = integrity - 1
-            cpydLog("error",("USR_MAC_ADDRESS blob integrity failure"))
-         if os.path.exists("blobs/USR_SCREEN_RES.apb"):
-            integrity = integrity + 0
-         else:
-            integrity = integrity - 1
-            cpydLog("error",("USR_SCREEN_RES blob integrity failure"))
-         if os.path.exists("blobs/USR_CREATE_XML.apb"):
-            integrity = integrity + 0
-         else:
+         pace(4)
+         try:
+            livePrefs = loadPrefs(LIVE_DIR)
+         except PrefsError as e:
+            livePrefs = {}
             integrity = integrity - 1
-            cpydLog("error",("USR_CREATE_XML blob integrity failure"))
+            cpydLog("error",(str(e)))
+         for key in ["USR_ALLOCATED_RAM", "USR_BOOT_FILE", "USR_CFG", "USR_CPU_CORES", "USR_CPU_FEATURE_ARGS", "USR_CPU_MODEL", "USR_CPU_THREADS", "USR_HDD_SIZE", "USR_NETWORK_DEVICE", "USR_TARGET_OS", "USR_MAC_ADDRESS", "USR_SCREEN_RES", "USR_CREATE_XML"]:
+            if key not in livePrefs:
+               integrity = integrity - 1
+               cpydLog("error",(key+" blob integrity failure"))
          progressUpdate(98)
          if integrity == 1:
             cpydLog("ok",("Integrity check PASSED"))
@@ -3183,7 +3553,7 @@ def autopilot():
             PROC_CHECKBLOBS = 2
             cpydLog("ok",("Updated stage status, handing off to next stage"))
             progressUpdate(100)
-            time.sleep(1)
+            pace(1)
             refreshStatusGUI()
          else:
             cpydLog("fatal",("Integrity of work is damaged, killing flow"))
@@ -3199,8 +3569,7 @@ def autopilot():
          global USR_EXP_AUDIO
          global customValue
          global customInput
-         global errorMessage
-         errorMessage = "The config file could not be written to.\n           You may have insufficient permissions."
+         setErrorMessage("The config file could not be written to.\n           You may have insufficient permissions.")
          integrityCfg3 = 1
          try: # DISCORD RPC
             RPC.update(large_image=osIcon,large_text=projectVer,state="Generating config script...",details="AutoPilot",small_image="doodrestart",small_text="Running...",start=sparkTime,buttons=([{"label": "View on GitHub", "url": "https://github.com/Coopydood/ultimate-macOS-KVM"}])) 
@@ -3231,9 +3600,7 @@ def autopilot():
                cpydLog("ok",str("Custom value was set to "+str(customInput)))               #+".sh" #<--- change required prefix/suffix
                currentStage = 2
                customValue = 0
-               blob = open("./blobs/USR_CFG.apb","w")
-               blob.write(USR_CFG)
-               blob.close()
+               setPref(LIVE_DIR, "USR_CFG", USR_CFG)
                apcGenConfig()
 
             else:
@@ -3242,7 +3609,14 @@ def autopilot():
                print(color.END+"      2. Choose a new name")
                print(color.END+"      3. Overwrite")
                print(color.END+"      Q. Cancel and Quit\n")
-               stageSelect = str(input(color.BOLD+"Select> "+color.END))
+               if answers is not None:
+                  cpydLog("info",str("Resolving with USR_CFG_CONFLICT policy "+answers["USR_CFG_CONFLICT"]))
+                  if answers["USR_CFG_CONFLICT"] == "fail":
+                     setErrorMessage("A boot script named "+str(USR_CFG)+" already exists.")
+                     throwError()
+                  stageSelect = {"rename": "1", "overwrite": "3"}[answers["USR_CFG_CONFLICT"]]
+               else:
+                  stageSelect = str(input(color.BOLD+"Select> "+color.END))
             
                if stageSelect == "1":
                   cpydLog("info",str("Renaming existing config file"))
@@ -3273,127 +3647,115 @@ def autopilot():
          refreshStatusGUI()
          cpydLog("info",("Scanning for file conflict"))
          progressUpdate(23)
-         time.sleep(3)
+         pace(3)
          if os.path.exists("./"+USR_CFG) or os.path.exists("./"+USR_CFG_XML):
             customInput = 0
             customValue = 0
-            existingWarning()
+            with uiLock: # keep other steps from drawing over the question
+               existingWarning()
          progressUpdate(31)
 
          cpydLog("info",("Beginning variable injection"))
-         with open(repoDir+"/resources/config.sh","r") as file:
-            configData = file.read()
-         configData = configData.replace("$USR_CPU_SOCKS",str(USR_CPU_SOCKS))
-         configData = configData.replace("$USR_CPU_CORES",str(USR_CPU_CORES))
-         configData = configData.replace("$USR_CPU_THREADS",str(USR_CPU_TOTAL_F))
-         configData = configData.replace("$USR_CPU_MODEL",str(USR_CPU_MODEL))
-         configData = configData.replace("$USR_CPU_FEATURE_ARGS",str(USR_CPU_FEATURE_ARGS))
-         configData = configData.replace("$USR_ALLOCATED_RAM",str(USR_ALLOCATED_RAM))
-         configData = configData.replace("$USR_REPO_PATH",repoDir)
-         configData = configData.replace("$USR_VM_PATH",nrsDir)
-         configData = configData.replace("$USR_NETWORK_DEVICE",str(USR_NETWORK_DEVICE))
-         progressUpdate(37)
          if USR_TARGET_OS >= 1013 or USR_TARGET_OS <= 99:
-            configData = configData.replace("$USR_NAME","macOS "+str(USR_TARGET_OS_F))
-            configData = configData.replace("$USR_ID","macOS")
+            osFamily = "macOS"
          else:
-            configData = configData.replace("$USR_NAME","Mac OS X "+str(USR_TARGET_OS_F))
-            configData = configData.replace("$USR_ID","Mac OS X")
-         progressUpdate(58)
-         configData = configData.replace("baseConfig",str(USR_CFG))
-         configData = configData.replace("$USR_CFG",str(USR_CFG))
-         configData = configData.replace("$USR_MAC_ADDRESS",str(USR_MAC_ADDRESS))
-         configData = configData.replace("$USR_SCREEN_RES",str(USR_SCREEN_RES))
-         configData = configData.replace("$USR_HDD_PATH",str(USR_HDD_PATH))
-         configData = configData.replace("$USR_HDD_TYPE",str(USR_HDD_TYPE))
-
-
-         cpydLog("info",("Checking disk type"))
+            osFamily = "Mac OS X"
+         configValues = {
+            "APC_RUN": str(datetime.today().strftime('%d-%m-%Y_%H-%M-%S')),
+            "GEN_EPOCH": int(time.time()),
+            "ULTMOS": version,
+            "FEATURE_LEVEL": FEATURE_LEVEL,
+            "USR_ID": osFamily,
+            "USR_NAME": osFamily+" "+str(USR_TARGET_OS_F),
+            "USR_CFG": USR_CFG,
+            "USR_SCREEN_RES": USR_SCREEN_RES,
+            "USR_ALLOCATED_RAM": USR_ALLOCATED_RAM,
+            "USR_CPU_SOCKS": USR_CPU_SOCKS,
+            "USR_CPU_CORES": USR_CPU_CORES,
+            "USR_CPU_THREADS": USR_CPU_TOTAL_F,
+            "USR_CPU_MODEL": USR_CPU_MODEL,
+            "USR_CPU_FEATURE_ARGS": USR_CPU_FEATURE_ARGS,
+            "USR_REPO_PATH": repoDir,
+            "USR_VM_PATH": nrsDir,
+            "USR_NETWORK_DEVICE": USR_NETWORK_DEVICE,
+            "USR_MAC_ADDRESS": USR_MAC_ADDRESS,
+            "NETWORK_MODE": networkPlan["mode"],
+            "NETWORK_IFACE": networkPlan["interface"],
+            "NETWORK_QUEUES": networkPlan["queues"],
+            "NETWORK_VHOST": "on" if networkPlan["vhost"] else "off",
+            "NETWORK_VECTORS": networkPlan["vectors"] or "",
+            "BRIDGE_HELPER": bridgeHelper() or BRIDGE_HELPERS[0],
+            "MACVTAP": macvtapName(USR_MAC_ADDRESS),
+            "USR_OS_NAME": USR_TARGET_OS_NAME,
+            "USR_HDD_PATH": USR_HDD_PATH,
+            "USR_HDD_TYPE": USR_HDD_TYPE,
+            "USR_HDD_ISPHYSICAL": USR_HDD_ISPHYSICAL == True,
+            "USR_HDD_FORMAT": USR_HDD_FORMAT,
+            "HDD_CACHE": hddIO["cache"],
+            "HDD_AIO": hddIO["aio"],
+            "HDD_DISCARD": hddIO["discard"],
+            "HDD_DETECT_ZEROES": hddIO["detectZeroes"],
+            "HDD_L2_CACHE": hddL2Cache,
+            "MEMORY_BACKING": pageLabel(memoryPlan["pageSize"]) if memoryPlan["backing"] == "hugepages" else memoryPlan["backing"],
+            "HUGEPAGE_KIB": memoryPlan["pageSize"] or "",
+            "HUGEPAGES": memoryPlan["pages"],
+            "HUGEPAGE_PATH": hugepagePath,
+            "VCPU_PINS": " ".join(str(cpu) for cpu in cpuPins["vcpus"]) if cpuPins is not None else "",
+            "EMULATOR_PINS": formatCpuList(cpuPins["emulator"]) if cpuPins is not None else "",
+            "USR_EXP_AUDIO": USR_EXP_AUDIO == True,
+            "USR_SMBIOS_SERIAL": USR_SMBIOS_SERIAL,
+            "USR_SMBIOS_UUID": USR_SMBIOS_UUID,
+            "DISCORD_RPC": True,
+            "BASESYSTEM": "" if USR_BOOT_FILE == "-2" else USR_BOOT_FORMAT,
+            "VFIO_ARGS": "",
+            "USB_ARGS": "",
+         }
+         progressUpdate(37)
 
          if USR_HDD_ISPHYSICAL == True:
             cpydLog("warn",("Physical disk requested, changing type to RAW"))
-            configData = configData.replace("file=\"$HDD_PATH\",format=qcow2","file=\"$HDD_PATH\",format=raw")
-            configData = configData.replace("REQUIRES_SUDO=0","REQUIRES_SUDO=1")
-         progressUpdate(64)
          if USR_TARGET_OS_ID == "sonoma": # APPLY 14.4 FIX
-            configData = configData.replace("-device usb-ehci,id=ehci","#-device usb-ehci,id=ehci")
             os.system("cp "+repoDir+"/resources/ovmf/OVMF_VARS_SonomaPatch.fd ovmf/OVMF_VARS.fd")
-
-         if USR_HDD_TYPE == "HDD":
-            cpydLog("ok",("Disk type is HDD, leaving rotation rate as default"))
-         elif USR_HDD_TYPE == "SSD":
-            cpydLog("warn",("Disk type is SSD, modifying rotation rate"))
-            configData = configData.replace("rotation_rate=7200","rotation_rate=1")
-            cpydLog("ok",("Rotation rate updated"))
-         elif USR_HDD_TYPE == "NVMe":
-            cpydLog("warn",("Disk type is NVMe, modifying device"))
-            configData = configData.replace("-device ide-hd,bus=sata.3,drive=HDD,rotation_rate=7200","-device nvme,drive=HDD,serial=ULTMOS")
-            cpydLog("ok",("Disk device updated"))
-         else:
-            cpydLog("warn",("Disk type is UNKNOWN, won't change anything"))
-         
-         progressUpdate(72)
-         
-
+         cpydLog("info",("Disk type is "+str(USR_HDD_TYPE)))
          if USR_EXP_AUDIO == True:
             cpydLog("info",("Enabling experimental audio support"))
-            configData = configData.replace("-device ich9-intel-hda -device hda-duplex","-audio driver=sdl,model=virtio")
-         else:
-            cpydLog("info",("Experimental audio support will not be enabled"))
-
-
-         cpydLog("ok",("Variable injection complete"))
-
-         cpydLog("info",("Stamping with ULTMOS version"))
-         configData = configData.replace("ULTMOS=0.0.0","ULTMOS="+str(version))
-         cpydLog("ok",("Marked working script as using ULTMOS v"+str(version)))
-         progressUpdate(80)
-         cpydLog("info",("Stamping with feature level"))
-         configData = configData.replace("FEATURE_LEVEL=0","FEATURE_LEVEL="+str(FEATURE_LEVEL))
-         cpydLog("ok",("Marked working script as feature level "+str(FEATURE_LEVEL)))
-         progressUpdate(82)
-         cpydLog("info",("Checking if Discord rich presence is available"))
          
          if os.path.exists(repoDir+"/resources/python/pypresence/presence.py"): # Now uses built in script
             cpydLog("ok",("Discord rich presence is available, will enable in script"))
-            configData = configData.replace("DISCORD_RPC=1","DISCORD_RPC=1")
          else:
-            vfcPresence = 0
+            configValues["DISCORD_RPC"] = False
             cpydLog("warn",("Discord rich presence appears unavailable, will NOT enable in script"))
-            configData = configData.replace("DISCORD_RPC=1","DISCORD_RPC=0")
-         refreshStatusGUI()
-         progressUpdate(89)
-         cpydLog("info",("Adding OS ID marker"))
-         configData = configData.replace("$USR_OS_NAME",str(USR_TARGET_OS_NAME))
-         progressUpdate(90)
 
-         cpydLog("info",("Setting up BaseSystem image attachment"))
          if USR_BOOT_FILE == "-2":
             cpydLog("warn",("Detaching BaseSystem from script, user skipped"))
-            configData = configData.replace("-drive id=BaseSystem,if=none,file=\"$VM_PATH/BaseSystem.img\",format=raw","#-drive id=BaseSystem,if=none,file=\"$VM_PATH/BaseSystem.img\",format=raw")
-            configData = configData.replace("-device ide-hd,bus=sata.4,drive=BaseSystem","#-device ide-hd,bus=sata.4,drive=BaseSystem")
-         with open (repoDir+"/resources/config.sh","w") as file:
+         elif USR_BOOT_FORMAT == "dmg":
+            cpydLog("info",("Attaching BaseSystem as a read-only DMG"))
+         progressUpdate(72)
+
+         try:
+            configData = renderTemplate(repoDir+"/resources/baseConfig", configValues)
+         except TemplateError as e:
+            cpydLog("error",(str(e)))
+            throwError()
+         cpydLog("ok",("Variable injection complete, marked as ULTMOS v"+str(version)+" feature level "+str(FEATURE_LEVEL)))
+         progressUpdate(90)
+
+         if "ALLOCATED_RAM=\""+str(USR_ALLOCATED_RAM) not in configData:
+            cpydLog("error",("Integrity check FAILED"))
+            throwError()
+         cpydLog("ok",("Integrity check PASSED"))
+         with open (nrsDir+"/resources/config.sh","w") as file:
             cpydLog("info",("Writing changes"))
             file.write(configData)
             cpydLog("ok",("Changes written to file"))
-         progressUpdate(96)
-         cpydLog("info",("Performing integrity check"))
-         with open(repoDir+"/resources/config.sh","r") as file:
-            configDataTest = file.read()
-         if "ALLOCATED_RAM=\""+str(USR_ALLOCATED_RAM) in configDataTest:
-            integrityCfg3 = 0
-         else:
-            cpydLog("error",("Integrity check FAILED"))
-            integrityCfg3 - 19
-         cpydLog("ok",("Integrity check PASSED"))
          progressUpdate(98)
-         time.sleep(0.5)
+         pace(0.5)
          cpydLog("ok",("Updated stage status, handing off to next stage"))
          progressUpdate(100)
-         time.sleep(0.2)
+         pace(0.2)
          refreshStatusGUI()
          PROC_GENCONFIG = 2
-         time.sleep(1)
+         pace(1)
 
          
 
@@ -3403,6 +3765,23 @@ def autopilot():
          
 
 
+      def reportedCall(command):
+         # Runs a script started with --progress-lines, its progress goes through progressUpdate and everything else to the log
+         process = subprocess.Popen(command, shell=True, cwd=repoDir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, text=True)
+         for line in process.stdout:
+            line = line.strip()
+            if line.startswith("progress ") and line[9:].isdigit():
+               progressUpdate(int(line[9:]))
+            elif line != "":
+               cpydLog("info",(line))
+         return process.wait()
+
+      def bootVM():
+         # Through the launcher, the same way main.py boots it
+         with open("./"+USR_CFG, "r") as configFile:
+            sudo = "sudo " if "REQUIRES_SUDO=1" in configFile.read() else ""
+         os.system(sudo+"\""+repoDir+"/scripts/launch.py\" \"./"+USR_CFG+"\"")
+
       def apcFetchDL():  # FETCH RECOVERY ONLINE
          global PROC_FETCHDL
          global USR_TARGET_OS_F
@@ -3415,48 +3794,90 @@ def autopilot():
             None
 
          PROC_FETCHDL = 1
-         global errorMessage
-         errorMessage = "The download script could not be executed.\n           You may have insufficient permissions or damaged files."
+         setErrorMessage("The download script could not be executed.\n           You may have insufficient permissions or damaged files.")
          integrityImg = 1
          refreshStatusGUI()
-         time.sleep(2)
-         os.chdir(repoDir)
+         pace(2)
          cpydLog("info",("Setting target OS to "+str(USR_TARGET_OS)))
          #print(color.BOLD+"   Downloading macOS",str(USR_TARGET_OS_F)+"...")
          #print(repoDir+"/scripts/dlosx-arg.py -s "+USR_TARGET_OS_ID+" --disable-percentage")
-         if len(USR_TARGET_OS_ID) > 1 and customDownload == False:
+         # Downloads go straight into this workspace, so concurrent runs never share a file
+         dlArgs = " --image-dir \""+nrsDir+"\""+dlosxArgs(USR_BOOT_FORMAT == "dmg")
+         bootImage = "./BaseSystem.dmg" if USR_BOOT_FORMAT == "dmg" else "./BaseSystem.img"
+
+         cachedKey = None
+         if len(USR_TARGET_OS_ID) > 1 and customDownload == False and args.disableCache == False and USR_BOOT_FORMAT == "raw":
+            try:
+               recoveryCache = RecoveryCache(recoveryCacheDir(), args.cacheSize * 2 ** 30)
+               cachedKey = recoveryCache.lookupAlias(USR_TARGET_OS_ID)
+            except OSError as e:
+               cpydLog("warn",("Recovery cache is unavailable: "+str(e)))
+
+         cachePlaced = False
+         if cachedKey is not None:
+            # Known image for this OS, place it straight from the cache without touching the network
+            cpydLog("ok",("Found cached recovery image "+cachedKey+" for "+USR_TARGET_OS_ID))
+            try:
+               method = recoveryCache.place(cachedKey, workspace.path(bootImage[2:]))
+            except OSError as e:
+               cpydLog("warn",("Cached recovery image could not be placed: "+str(e)))
+               method = None
+            if method is not None:
+               cpydLog("ok",("Placed cached recovery image using "+method))
+               cachePlaced = True
+               dlStatus = 0
+            else:
+               cpydLog("warn",("Cached recovery image "+cachedKey+" is gone, downloading it instead"))
+
+         if cachePlaced == False and len(USR_TARGET_OS_ID) > 1 and customDownload == False:
             cpydLog("ok",("OS ID is valid, sending to dlosx script"))
-            if enableProgress == True:
+            if enableProgress == True and phaseWorkers > 1:
+               # Other steps may be drawing or asking questions, so the script only reports numbers and the bar is drawn here
+               dlStatus = reportedCall(repoDir+"/scripts/dlosx-arg.py -s "+USR_TARGET_OS_ID+" --disable-progress --progress-lines --nrs"+dlArgs)
+            elif enableProgress == True:
                if enablePercentage == True: #    NOW USING NRS
-                  os.system(repoDir+"/scripts/dlosx-arg.py -s "+USR_TARGET_OS_ID+" --nrs")
+                  dlStatus = subprocess.call(repoDir+"/scripts/dlosx-arg.py -s "+USR_TARGET_OS_ID+" --nrs"+dlArgs, shell=True, cwd=repoDir)
                else:
-                  os.system(repoDir+"/scripts/dlosx-arg.py -s "+USR_TARGET_OS_ID+" --disable-percentage --nrs")
+                  dlStatus = subprocess.call(repoDir+"/scripts/dlosx-arg.py -s "+USR_TARGET_OS_ID+" --disable-percentage --nrs"+dlArgs, shell=True, cwd=repoDir)
             else:
-               os.system(repoDir+"/scripts/dlosx-arg.py -s "+USR_TARGET_OS_ID+" --disable-progress --nrs")
+               dlStatus = subprocess.call(repoDir+"/scripts/dlosx-arg.py -s "+USR_TARGET_OS_ID+" --disable-progress --nrs"+dlArgs, shell=True, cwd=repoDir)
 
-         else:
+         elif cachePlaced == False:
             cpydLog("warn",("OS ID is NOT valid, running dlosx without passthrough"))
-            os.system(repoDir+"/scripts/dlosx.py --nrs")
+            dlStatus = subprocess.call(repoDir+"/scripts/dlosx.py --nrs --connections "+str(args.dlConnections)+(" --keep-dmg" if USR_BOOT_FORMAT == "dmg" else ""), shell=True, cwd=repoDir)
          #subprocess.Popen(cmd).wait()
          #print(os.path.getsize("./BaseSystem.img"))
 
-         os.chdir(nrsDir)
-         os.system("mv "+repoDir+"/resources/BaseSystem.img ./BaseSystem.img") # Use new resource location
+         if dlStatus == 0:
+            cpydLog("ok",("Chunklist verification PASSED"))
+         elif dlStatus == 3:
+            cpydLog("warn",("Chunklist could not be loaded, image was not verified"))
+         else:
+            cpydLog("error",("Download script exited with status "+str(dlStatus)))
+
+         if not os.path.exists(bootImage) and os.path.exists(repoDir+"/resources/"+bootImage[2:]):
+            moveSparse(repoDir+"/resources/"+bootImage[2:],bootImage) # dlosx.py still uses the repo's resource folder
 
-         if os.path.exists("./BaseSystem.img"):
-            cpydLog("info",("Checking BaseSystem with a size of "+str(os.path.getsize("./BaseSystem.img"))))
-         if os.path.exists("./BaseSystem.img") and os.path.getsize("./BaseSystem.img") > 314572800:
+         # getsize() is the logical size, holes in the sparse image don't count against it
+         if os.path.exists(bootImage):
+            cpydLog("info",("Checking BaseSystem with a size of "+str(os.path.getsize(bootImage))+" ("+str(allocatedSize(bootImage))+" allocated)"))
+         if dlStatus == 2:
+            integrityImg = 0
+            cpydLog("error",("Integrity check FAILED, image did not match its chunklist"))
+            setErrorMessage("The downloaded image failed verification.\n           Run AutoPilot again to re-download the damaged parts.")
+            throwError()
+         elif os.path.exists(bootImage) and os.path.getsize(bootImage) > 314572800:
             integrityImg = 1
             cpydLog("ok",("Integrity check PASSED"))
          else:
             integrityImg = 0
             cpydLog("error",("Integrity check FAILED"))
-            errorMessage = "The image download failed.\n           Please check your internet connection."
+            setErrorMessage("The image download failed.\n           Please check your internet connection.")
             throwError()
          cpydLog("ok",("Updated stage status, handing off to next stage"))
          PROC_FETCHDL = 2
          refreshStatusGUI()
-         time.sleep(3)
+         pace(3)
 
       def apcLocalCopy():  # FETCH RECOVERY LOCALLY
          global PROC_LOCALCOPY
@@ -3469,20 +3890,33 @@ def autopilot():
                RPC.update(large_image=osIcon,large_text=projectVer,state="Copying recovery image into place...",details="AutoPilot",small_image="doodremount",small_text="Copying Files...",start=sparkTime,buttons=([{"label": "View on GitHub", "url": "https://github.com/Coopydood/ultimate-macOS-KVM"}])) 
          except:
             None
-         global errorMessage
-         errorMessage = "The local recovery image could not be found,\n           or it cannot be accessed."
+         setErrorMessage("The local recovery image could not be found,\n           or it cannot be accessed.")
          integrityImg = 1
          refreshStatusGUI()
          progressUpdate(12)
-         time.sleep(2)
+         pace(2)
          cpydLog("info",("Copying "+str(USR_BOOT_FILE)+" to repository directory"))
-         os.system("cp "+USR_BOOT_FILE+" ./")
+         try:
+            bootSource = shlex.split(USR_BOOT_FILE)[0]
+         except (ValueError, IndexError):
+            bootSource = USR_BOOT_FILE
+         bootCopy = "./"+os.path.basename(bootSource)
+         try:
+            if os.path.realpath(bootSource) != os.path.realpath(bootCopy):
+               copySparse(bootSource, bootCopy)
+               cpydLog("info",("Copied "+str(os.path.getsize(bootCopy))+" bytes, "+str(allocatedSize(bootCopy))+" allocated"))
+         except OSError as e:
+            cpydLog("error",("Could not copy recovery image: "+str(e)))
          progressUpdate(88)
          cpydLog("info",("Setting up file name"))
-         os.system("mv ./*.dmg BaseSystem.dmg")
-         os.system("mv ./*.img BaseSystem.img")
+         # Only the copied image, the workspace may hold other images such as a raw HDD.img
+         bootExt = os.path.splitext(bootCopy)[1].lower()
+         if bootExt in (".dmg", ".img") and os.path.exists(bootCopy) and os.path.basename(bootCopy) != "BaseSystem"+bootExt:
+            os.replace(bootCopy, "./BaseSystem"+bootExt)
          progressUpdate(92)
-         if os.path.exists("./BaseSystem.dmg"):
+         if os.path.exists("./BaseSystem.dmg") and USR_BOOT_FORMAT == "dmg":
+            cpydLog("ok",("BaseSystem image will be attached as a DMG, not converting"))
+         elif os.path.exists("./BaseSystem.dmg"):
             cpydLog("warn",("BaseSystem image is still in the DMG format, will convert now"))
             try: # DISCORD RPC
                RPC.update(large_image=osIcon,large_text=projectVer,state="Converting image format...",details="AutoPilot",small_image="doodremount",small_text="Converting...",start=sparkTime,buttons=([{"label": "View on GitHub", "url": "https://github.com/Coopydood/ultimate-macOS-KVM"}])) 
@@ -3490,18 +3924,23 @@ def autopilot():
                None
             PROC_LOCALCOPY_CVTN = 1
             refreshStatusGUI()
-            time.sleep(1)
-            os.system(repoDir+"/resources/dmg2img ./BaseSystem.dmg > /dev/null 2>&1")
-            cpydLog("info",("Finished converting, removing source DMG"))
-            os.system("rm ./BaseSystem.dmg")
-            time.sleep(1)
+            pace(1)
+            try:
+               converter = convertImage("./BaseSystem.dmg", "./BaseSystem.img", repoDir+"/resources/dmg2img", progress=lambda done, total: progressUpdate(92 + round(6 * done / max(total, 1))))
+               cpydLog("info",("Converted image using "+converter))
+               cpydLog("info",("Finished converting, removing source DMG"))
+               os.system("rm ./BaseSystem.dmg")
+            except Exception as e:
+               # The DMG stays so the conversion can be tried again
+               cpydLog("error",("Conversion failed: "+str(e)))
+            pace(1)
             cpydLog("ok",("Updated subphase status, returning to parent"))
             PROC_LOCALCOPY_CVTN = 0
             refreshStatusGUI()
-            time.sleep(1)
+            pace(1)
          progressUpdate(99)
          cpydLog("info",("Performing integrity check"))
-         if os.path.exists("./BaseSystem.img"):
+         if os.path.exists("./BaseSystem.dmg" if USR_BOOT_FORMAT == "dmg" else "./BaseSystem.img"):
             integrityImg = 1
             cpydLog("ok",("Integrity check PASSED"))
          else:
@@ -3511,9 +3950,9 @@ def autopilot():
          cpydLog("ok",("Updated stage status, handing off to next stage"))
          PROC_LOCALCOPY = 2
          progressUpdate(100)
-         time.sleep(1)
+         pace(1)
          refreshStatusGUI()
-         time.sleep(2)
+         pace(2)
 
 
 
@@ -3530,31 +3969,38 @@ def autopilot():
                RPC.update(large_image=osIcon,large_text=projectVer,state="Creating virtual hard disk...",details="AutoPilot",small_image="doodrestart",small_text="Running...",start=sparkTime,buttons=([{"label": "View on GitHub", "url": "https://github.com/Coopydood/ultimate-macOS-KVM"}])) 
          except:
             None
-         global errorMessage
-         errorMessage = "The virtual hard disk file could not be created.\n           You may have insufficient permissions."
+         setErrorMessage("The virtual hard disk file could not be created.\n           You may have insufficient permissions.")
          integrityImg = 1
          refreshStatusGUI()
-         time.sleep(2)
+         pace(2)
          progressUpdate(3)
          cpydLog("info",("Scanning for file conflict"))
+         hddFile = diskFile(USR_HDD_PROFILE)
          def existingWarning1():
             clear()
             try: # DISCORD RPC
                RPC.update(large_image=osIcon,large_text=projectVer,state="Creating virtual hard disk...",details="AutoPilot",small_image="doodsos",small_text="Issue Detected",start=sparkTime,buttons=([{"label": "View on GitHub", "url": "https://github.com/Coopydood/ultimate-macOS-KVM"}])) 
             except:
                None
-            cpydLog("warn",("Existing file with name HDD.qcow2 detected, asking the user"))
+            cpydLog("warn",("Existing file with name "+hddFile+" detected, asking the user"))
             print("\n   "+color.BOLD+color.YELLOW+"⚠ PROBLEM DETECTED"+color.END)
             print("   Resolve the issue to continue")
             print("\n   This is not an error and can be resolved with your input. \n   You must select an option to continue. Once selected,\n   the process can continue from where it was left."+color.END)
-            print("\n   "+color.BOLD+color.YELLOW+"PROBLEM:",color.END+"A virtual hard disk with the name \"HDD.qcow2\" already exists."+color.END)
+            print("\n   "+color.BOLD+color.YELLOW+"PROBLEM:",color.END+"A virtual hard disk with the name \""+hddFile+"\" already exists."+color.END)
             print(color.BOLD+"\n      1. Automatically rename existing file")
             print(color.END+"      2. Use existing file")
             print(color.END+color.RED+"      X. Delete"+color.END)
             print(color.END+"      Q. Cancel and Quit\n")
-            cpydLog("wait",("Waiting for user input"))
-            stageSelect = str(input(color.BOLD+"Select> "+color.END))
-            cpydLog("ok",("User input received"))
+            if answers is not None:
+               cpydLog("info",str("Resolving with USR_HDD_CONFLICT policy "+answers["USR_HDD_CONFLICT"]))
+               if answers["USR_HDD_CONFLICT"] == "fail":
+                  setErrorMessage("A virtual hard disk named "+hddFile+" already exists.")
+                  throwError()
+               stageSelect = {"rename": "1", "use": "2", "delete": "x"}[answers["USR_HDD_CONFLICT"]]
+            else:
+               cpydLog("wait",("Waiting for user input"))
+               stageSelect = str(input(color.BOLD+"Select> "+color.END))
+               cpydLog("ok",("User input received"))
             if stageSelect == "1":
                #cpydLog("ok",str("Using default value of "+str(defaultValue)))
                global PROC_GENHDD
@@ -3562,8 +4008,8 @@ def autopilot():
                   RPC.update(large_image=osIcon,large_text=projectVer,state="Creating virtual hard disk...",details="AutoPilot",small_image="doodrestart",small_text="Running...",start=sparkTime,buttons=([{"label": "View on GitHub", "url": "https://github.com/Coopydood/ultimate-macOS-KVM"}])) 
                except:
                   None
-               cpydLog("ok",("Moving HDD.qcow2"+" to "+str(datetime.today().strftime('%d-%m-%Y_%H-%M-%S'))+"_HDD.qcow2"))
-               os.system("mv ./HDD.qcow2"+" ./"+str(datetime.today().strftime('%d-%m-%Y_%H-%M-%S'))+"_HDD.qcow2")
+               cpydLog("ok",("Moving "+hddFile+" to "+str(datetime.today().strftime('%d-%m-%Y_%H-%M-%S'))+"_"+hddFile))
+               os.system("mv ./"+hddFile+" ./"+str(datetime.today().strftime('%d-%m-%Y_%H-%M-%S'))+"_"+hddFile)
                PROC_GENHDD = 2
                cpydLog("ok",("Resetting phase status and re-sparking"))
                apcGenHDD()
@@ -3582,45 +4028,57 @@ def autopilot():
                   RPC.update(large_image=osIcon,large_text=projectVer,state="Creating virtual hard disk...",details="AutoPilot",small_image="doodrestart",small_text="Running...",start=sparkTime,buttons=([{"label": "View on GitHub", "url": "https://github.com/Coopydood/ultimate-macOS-KVM"}])) 
                except:
                   None
-               cpydLog("warn",("Deleting HDD.qcow2"))
-               os.system("rm HDD.qcow2")
+               cpydLog("warn",("Deleting "+hddFile))
+               os.system("rm "+hddFile)
                PROC_GENHDD = 2
                apcGenHDD()
 
             elif stageSelect == "q" or stageSelect == "Q":
                cpydLog("fatal",("User quit"))
                exit
-         progressUpdate(24)
-         if USR_TARGET_OS >= 1013:
-            USR_HDD_SIZE_B = int(USR_HDD_SIZE.replace("G","")) * 1000000000 + 209756160
-         elif USR_TARGET_OS >= 13 and USR_TARGET_OS <= 99:
-            USR_HDD_SIZE_B = int(USR_HDD_SIZE.replace("G","")) * 1000000000 + 209756160
-         else:
-            USR_HDD_SIZE_B = int(USR_HDD_SIZE.replace("G","")) * 1000000000 + 343973888
          progressUpdate(27)
          
          
-         if os.path.exists("./HDD.qcow2"):
-            existingWarning1()
+         if os.path.exists("./"+hddFile):
+            with uiLock: # keep other steps from drawing over the question
+               existingWarning1()
          else:
             cpydLog("info",("Generating hard disk image file"))
-            os.system("qemu-img create -f qcow2 HDD.qcow2 "+str(USR_HDD_SIZE_B)+"B > /dev/null 2>&1")
-            time.sleep(3)
+            cpydLog("info",("Using the "+diskPlan["profile"]+" disk profile on "+diskPlan["filesystem"]+" ("+diskPlan["reason"]+")"))
+            hddCommand, dropped = createCommand(diskPlan, hddFile, USR_HDD_SIZE_B)
+            if dropped:
+               cpydLog("warn",("This qemu-img doesn't support "+", ".join(dropped)+", creating the disk without"))
+            cpydLog("info",("Running "+" ".join(hddCommand)))
+            progressUpdate(31)
+            def createDisk(command):
+               try:
+                  return subprocess.call(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+               except OSError:
+                  return 127 # no qemu-img, reported below
+            if createDisk(hddCommand) != 0 and diskPlan["options"].get("preallocation", "off") != "off":
+               # Reserving the space can still fail (quota, a full disk), a sparse disk is better than none
+               cpydLog("warn",("Preallocated disk could not be created, retrying without preallocation"))
+               if os.path.exists("./"+hddFile):
+                  os.remove("./"+hddFile)
+               diskPlan["options"]["preallocation"] = "off"
+               hddCommand, dropped = createCommand(diskPlan, hddFile, USR_HDD_SIZE_B)
+               createDisk(hddCommand)
+            pace(3)
             PROC_GENHDD = 2
          progressUpdate(39)
          # Hard disk creation error catcher - thanks Cyber!
-         if not os.path.exists("./HDD.qcow2"):
+         if not os.path.exists("./"+hddFile):
             cpydLog("error",("Hard disk image file generation failed"))
-            errorMessage = "The virtual hard disk file could not be created.\n           Did you install QEMU + tools?"
+            setErrorMessage("The virtual hard disk file could not be created.\n           Did you install QEMU + tools?")
             throwError()
          else:
             cpydLog("ok",("Hard disk image file generation verified"))
             PROC_GENHDD = 2
          progressUpdate(100)
          cpydLog("ok",("Updated stage status, handing off to next stage"))
-         time.sleep(0.4)
+         pace(0.4)
          refreshStatusGUI()
-         time.sleep(2)
+         pace(2)
 
       def apcApplyPrefs():  # APPLY USER PREFERENCES
          global PROC_APPLYPREFS
@@ -3632,13 +4090,12 @@ def autopilot():
                RPC.update(large_image=osIcon,large_text=projectVer,state="Applying preferences...",details="AutoPilot",small_image="doodrestart",small_text="Running...",start=sparkTime,buttons=([{"label": "View on GitHub", "url": "https://github.com/Coopydood/ultimate-macOS-KVM"}])) 
          except:
             None
-         global errorMessage
-         errorMessage = "Could not apply preferences to generated files.\n           You may have insufficient permissions."
+         setErrorMessage("Could not apply preferences to generated files.\n           You may have insufficient permissions.")
          integrityImg = 1
          refreshStatusGUI()
-         time.sleep(2)
+         pace(2)
          
-         if os.path.exists(repoDir+"/resources/config.sh"):
+         if os.path.exists(nrsDir+"/resources/config.sh"):
             cpydLog("ok",("Integrity check PASSED"))
             integrityImg = 1
          else:
@@ -3647,29 +4104,9 @@ def autopilot():
             throwError()
          
          progressUpdate(2)
-         with open(repoDir+"/resources/config.sh","r") as file:
-            cpydLog("info",("Dumping contents of baseConfig to memory"))
-            configData = file.read()
-         progressUpdate(8)
-         cpydLog("info",("Stripping warning headers"))
-         configData = configData.replace("baseConfig",str(USR_NAME))
-         configData = configData.replace("#    THIS CONFIG FILE SHOULD NOT BE EDITED BY THE USER!    #","#   APC-RUN_"+str(datetime.today().strftime('%d-%m-%Y_%H-%M-%S'))+"\n#\n#   THIS FILE WAS GENERATED USING AUTOPILOT.")
-         configData = configData.replace("#                                                          #\n","")
-         configData = configData.replace("# It is intended to be used by the automatic setup wizard. #\n","")
-         configData = configData.replace("#    To use the wizard, run the included \"main.py\" file;   #\n","")
-         configData = configData.replace("#                                                          #","#")
-         configData = configData.replace("#                       $ ./main.py                        #","#\n#   To boot this script, run the following command:\n#   $ ./"+str(USR_CFG))
-         configData = configData.replace("#    ./main.py","")
-         configData = configData.replace("############################################################.","#")
-         cpydLog("info",("Generating epoch timestamp"))
-         configData = configData.replace("GEN_EPOCH=000000000","GEN_EPOCH="+str(int(time.time())))
-         cpydLog("ok",("Epoch timestamped as "+str(int(time.time()))))
-         with open (repoDir+"/resources/config.sh","w") as file:
-            cpydLog("info",("Writing to file"))
-            file.write(configData)
-         progressUpdate(12)
-         with open(repoDir+"/resources/config.sh","r") as file:
+         with open(nrsDir+"/resources/config.sh","r") as file:
             configDataTest = file.read()
+         progressUpdate(12)
          if "#   THIS FILE WAS GENERATED USING AUTOPILOT." in configDataTest:
             integrityImg + 0
             cpydLog("ok",("Header verification complete"))
@@ -3679,7 +4116,7 @@ def autopilot():
             throwError()
          progressUpdate(77)
          cpydLog("info",("Moving working file into place"))
-         os.system("mv "+repoDir+"/resources/config.sh ./"+USR_CFG)
+         os.system("mv "+nrsDir+"/resources/config.sh ./"+USR_CFG)
          
          progressUpdate(91)
          #if USR_CREATE_XML == "True":
@@ -3698,11 +4135,11 @@ def autopilot():
             integrityImg = 0
             throwError()
          progressUpdate(100)
-         time.sleep(0.6)
+         pace(0.6)
          PROC_APPLYPREFS = 2
          cpydLog("ok",("Updated stage status, handing off to next stage"))
          refreshStatusGUI()
-         time.sleep(2)
+         pace(2)
       
       def apcGenXML():
          progressUpdate(-1)
@@ -3720,27 +4157,24 @@ def autopilot():
             PROC_GENXML = 1
             refreshStatusGUI()
             cpydLog("info",("Copying current session blobs into user backdir"))
-            os.system("cp blobs/*.apb blobs/user/")
+            copyPrefs(LIVE_DIR, USER_DIR)
             progressUpdate(38)
-            time.sleep(1)
+            pace(1)
             nrsTargetConfig = os.path.abspath("./"+USR_CFG)
             nrsTargetDir = nrsDir
-            os.chdir(repoDir)
             cpydLog("ok",("Handing off to XMLC and waiting for result"))
             #print(repoDir+"/scripts/extras/xml-convert.py --no-import --quiet --mark-ap --convert "+nrsTargetConfig+" --nrs-dir "+nrsTargetDir)
-            os.system(repoDir+"/scripts/extras/xml-convert.py --no-import --quiet --mark-ap --convert "+nrsTargetConfig+" --nrs-dir "+nrsTargetDir)
+            subprocess.call(repoDir+"/scripts/extras/xml-convert.py --no-import --quiet --mark-ap --convert \""+nrsTargetConfig+"\" --nrs-dir \""+nrsTargetDir+"\"", shell=True, cwd=repoDir)
             cpydLog("info",("Got exit signal from XMLC, checking integrity"))
-            os.chdir(nrsDir)
             progressUpdate(94)
-            global errorMessage
-            errorMessage = "Failed to convert script to XML."
+            setErrorMessage("Failed to convert script to XML.")
             if os.path.exists("./"+USR_CFG_XML):
                cpydLog("ok",("XML file was successfully generated at "+USR_CFG_XML))
                PROC_GENXML = 2
                progressUpdate(100)
-               time.sleep(0.4)
+               pace(0.4)
                refreshStatusGUI()
-               time.sleep(2)
+               pace(2)
             else:
                cpydLog("error",("XMLC failed to create the XML file"))
                throwError()
@@ -3758,30 +4192,29 @@ def autopilot():
                RPC.update(large_image=osIcon,large_text=projectVer,state="Fixing up permissions...",details="AutoPilot",small_image="doodrestart",small_text="Running...",start=sparkTime,buttons=([{"label": "View on GitHub", "url": "https://github.com/Coopydood/ultimate-macOS-KVM"}])) 
          except:
             None
-         global errorMessage
-         errorMessage = "Could not set permissions on generated files.\n           You can attempt to do this manually."
+         setErrorMessage("Could not set permissions on generated files.\n           You can attempt to do this manually.")
          integrityImg = 1
          refreshStatusGUI()
          progressUpdate(50)
-         time.sleep(2)
+         pace(2)
          cpydLog("info",("Setting execute permissions"))
          os.system("chmod +x ./"+USR_CFG)
          progressUpdate(63)
          cpydLog("info",("Setting readwrite permissions"))
          os.system("chmod +rw ./BaseSystem.img > /dev/null 2>&1")
+         os.system("chmod +r ./BaseSystem.dmg > /dev/null 2>&1")
          progressUpdate(91)
          cpydLog("ok",("Permissons set for new user files"))
          cpydLog("ok",("Updated stage status, handing off to next stage"))
          progressUpdate(100)
          PROC_FIXPERMS = 2
-         time.sleep(0.3)
+         pace(0.3)
          refreshStatusGUI()
-         time.sleep(2)
+         pace(2)
          
       def apcCleanUp():  # CLEAN BLOBS AND TEMP
          global PROC_CLEANUP
          global USR_CFG
-         global errorMessage
          progressUpdate(0)
          try: # DISCORD RPC
                RPC.update(large_image=osIcon,large_text=projectVer,state="Cleaning up...",details="AutoPilot",small_image="doodrestart",small_text="Running...",start=sparkTime,buttons=([{"label": "View on GitHub", "url": "https://github.com/Coopydood/ultimate-macOS-KVM"}])) 
@@ -3791,72 +4224,120 @@ def autopilot():
          refreshStatusGUI()
          cpydLog("info",("STARTING CLEANUP PHASE"))
          progressUpdate(14)
-         time.sleep(1)
+         pace(1)
 
          cpydLog("info",("Copying current session blobs into user backdir"))
-         os.system("cp blobs/*.apb blobs/user/")
+         copyPrefs(LIVE_DIR, USER_DIR)
          progressUpdate(29)
          cpydLog("info",("Marking blobs as stale"))
          cpydLog("info",("Moving blobs into stale folder"))
-         os.system("mv blobs/*.apb blobs/stale/")
+         movePrefs(LIVE_DIR, STALE_DIR)
          progressUpdate(78)
          cpydLog("ok",("Blob cleanup complete"))
          cpydLog("ok",("Updated stage status, handing off to next stage"))
          progressUpdate(100)
-         time.sleep(0.2)
+         pace(0.2)
          PROC_CLEANUP = 2
          refreshStatusGUI()
-         time.sleep(1)
+         pace(1)
 
-      apcPrepare()
+      # Each step waits only for the steps whose files it needs
+      phaseGraph = PhaseGraph()
+      phaseGraph.add("apcPrepare", apcPrepare)
       if enableBlobCheck == True:
-         apcBlobCheck()
-      apcGenConfig()
+         phaseGraph.add("apcBlobCheck", apcBlobCheck)
+      phaseGraph.add("apcGenConfig", apcGenConfig, after=["apcPrepare", "apcBlobCheck"])
       if PROC_FETCHDL == 0 and USR_BOOT_FILE != "-2":
          cpydLog("ok",("User requested a new macOS recovery image, arming downloader"))
-         apcFetchDL()
+         phaseGraph.add("apcFetchDL", apcFetchDL)
       elif PROC_LOCALCOPY == 0 and USR_BOOT_FILE != "-2":
          cpydLog("ok",("User is using their own macOS recovery image, disarming downloader"))
          cpydLog("ok",("Switching to local copy mode"))
-         apcLocalCopy()
+         phaseGraph.add("apcLocalCopy", apcLocalCopy)
 
       if PROC_GENHDD == 0 and USR_HDD_SIZE != "-1" and USR_HDD_SIZE != "-2":
          cpydLog("ok",("User requested a new HDD file, generation will go ahead"))
-         apcGenHDD()
+         phaseGraph.add("apcGenHDD", apcGenHDD)
          
-      
-      
-      apcApplyPrefs()
+      phaseGraph.add("apcApplyPrefs", apcApplyPrefs, after=["apcGenConfig"])
       if USR_CREATE_XML == "True":
-         apcGenXML()
-      apcFixPerms()
+         phaseGraph.add("apcGenXML", apcGenXML, after=["apcApplyPrefs"])
+      phaseGraph.add("apcFixPerms", apcFixPerms, after=["apcApplyPrefs", "apcGenXML", "apcFetchDL", "apcLocalCopy", "apcGenHDD"])
       if enableClean == True:
-         apcCleanUp()
+         phaseGraph.add("apcCleanUp", apcCleanUp, after=[name for name in phaseGraph.phases])
+
+      # Files each step leaves behind, relative to the workspace. The config
+      # apcGenConfig renders is moved into place by apcApplyPrefs.
+      bootImage = "BaseSystem.dmg" if USR_BOOT_FORMAT == "dmg" else "BaseSystem.img"
+      phaseOutputs = {
+         "apcPrepare": ["boot/OpenCore.qcow2", "ovmf/OVMF_CODE.fd", "ovmf/OVMF_VARS.fd", "ovmf/user_store/OVMF_VARS.fd"],
+         "apcGenConfig": ["resources/config.sh"] + (["ovmf/OVMF_VARS.fd"] if USR_TARGET_OS_ID == "sonoma" else []),
+         "apcFetchDL": [bootImage],
+         "apcLocalCopy": [bootImage],
+         "apcGenHDD": [diskFile(USR_HDD_PROFILE)],
+      }
+      phaseConsumes = {"apcApplyPrefs": ["resources/config.sh"]}
+      phaseStatus = {"apcPrepare": "PROC_PREPARE", "apcBlobCheck": "PROC_CHECKBLOBS", "apcGenConfig": "PROC_GENCONFIG", "apcFetchDL": "PROC_FETCHDL", "apcLocalCopy": "PROC_LOCALCOPY", "apcGenHDD": "PROC_GENHDD", "apcApplyPrefs": "PROC_APPLYPREFS", "apcGenXML": "PROC_GENXML", "apcFixPerms": "PROC_FIXPERMS"}
+
+      def recordCheckpoint(name):
+         if name not in phaseStatus:
+            return # cleaning up is never worth skipping
+         outputs = phaseOutputs.get(name, [])
+         if name == "apcApplyPrefs":
+            outputs = [USR_CFG] # may have been renamed during the run
+         elif name == "apcGenXML":
+            outputs = [USR_CFG_XML]
+         try:
+            checkpoints.record(name, outputs, phaseConsumes.get(name, []))
+         except OSError as e:
+            cpydLog("warn",("Could not record a checkpoint for "+name+": "+str(e)))
+
+      if resume == True:
+         # A step is skipped only if everything before it was skipped too
+         for name in phaseGraph.order():
+            if name in phaseStatus and all(dep in phasesResumed for dep in phaseGraph.dependencies(name)) and checkpoints.isDone(name):
+               phasesResumed.append(name)
+         for name in phasesResumed:
+            phaseGraph.remove(name)
+            globals()[phaseStatus[name]] = 2
+            cpydLog("ok",(name+" finished in an earlier run and its files are unchanged, skipping"))
+         if not phasesResumed:
+            cpydLog("info",("Nothing to resume, running every step"))
+      # Whatever runs now replaces what those steps recorded before
+      checkpoints.forget(list(phaseGraph.phases))
+      refreshStatusGUI()
+
+      cpydLog("info",("Running "+str(len(phaseGraph.phases))+" steps with up to "+str(phaseWorkers)+" at once"))
+      try:
+         phaseGraph.run(phaseWorkers, onStart=phaseStarted, onFinish=phaseFinished, onDone=recordCheckpoint)
+      except PhaseError as e:
+         cpydLog("error",(str(e.phase)+" failed, remaining steps were not started"))
+         phasesFailed.append(e.phase)
+         writeTrace("failed")
+         setErrorMessage(str(e))
+         throwError()
+         return
+      checkpoints.clear()
       cpydLog("info",("Stopping timer"))
       stopTime = timeit.default_timer()
+      writeTrace("ok")
       try: # DISCORD RPC
          RPC.update(large_image=osIcon,large_text=projectVer,state="Finishing...",details="AutoPilot",small_image="doodshutdown",small_text="Stopping...",start=sparkTime,buttons=([{"label": "View on GitHub", "url": "https://github.com/Coopydood/ultimate-macOS-KVM"}])) 
       except:
          None
-      time.sleep(2)
+      pace(2)
       
 
       cpydLog("info",("Updating variable definition"))
       global USR_CPU_SOCKS
       global USR_CPU_CORES
-      global USR_CPU_THREADS
       global USR_CPU_MODEL
       global USR_CPU_FEATURE_ARGS
-      global USR_ALLOCATED_RAM
       global USR_REPO_PATH
       global USR_VM_PATH
-      global USR_NETWORK_DEVICE
       global USR_ID
       global USR_NAME
-      global USR_CFG
-      global USR_TARGET_OS
       global USR_TARGET_OS_F
-      global USR_CPU_TOTAL_F
       global USR_CFG_XML
       global customValue
       global currentStage
@@ -3869,6 +4350,8 @@ def autopilot():
          None
 
       cpydLog("ok",("Timer was stopped with a recorded time of "+str(exTime)+" seconds in live mode"))
+      if answers is not None:
+         headlessSummary("ok", EXIT_OK)
       clear()
       cpydLog("ok",("AutoPilot stages complete, displaying user summary screen"))
       cpydLog("ok",("───────────────── AUTOPILOT COMPLETE! SESSION TIME WAS "+str(exTime)+" SEC ─────────────────"))
@@ -3918,7 +4401,7 @@ def autopilot():
             cpydLog("fatal",("bye"))
             cpydLog("fatal","───────────────── END OF LOGFILE ─────────────────")
             
-            os.system(repoDir+"/scripts/extras/xml-convert.py --import "+USR_CFG_XML)
+            subprocess.call(repoDir+"/scripts/extras/xml-convert.py --import \""+workspace.path(USR_CFG_XML)+"\"", shell=True, cwd=repoDir)
          
          elif stageSelect == "2":
             cpydLog("info",("Handing off to QEMU; booting "+USR_CFG))
@@ -3939,7 +4422,7 @@ def autopilot():
                print("   Have a nice night - "+color.CYAN+"and remember to sleep!"+color.END+" :]\n\n\n")
             time.sleep(3)
             clear()
-            os.system("./"+USR_CFG)
+            bootVM()
 
          elif stageSelect == "m" or stageSelect == "M":
             cpydLog("info",("Returning to main menu"))
@@ -3993,7 +4476,7 @@ def autopilot():
                print("   Have a nice night - "+color.CYAN+"and remember to sleep!"+color.END+" :]\n\n\n")
             time.sleep(3)
             clear()
-            os.system("./"+USR_CFG)
+            bootVM()
            
          
          elif stageSelect == "2":
@@ -4048,7 +4531,89 @@ def autopilot():
             
 
 
-   stage1()
+   def applyAnswers():
+      global USR_CFG
+      global USR_CFG_XML
+      global USR_TARGET_OS
+      global USR_TARGET_OS_NAME
+      global USR_TARGET_OS_ID
+      global USR_TARGET_OS_F
+      global USR_CPU_CORES
+      global USR_CPU_THREADS
+      global USR_CPU_TOTAL_F
+      global USR_CPU_MODEL
+      global USR_CPU_FEATURE_ARGS
+      global USR_ALLOCATED_RAM
+      global USR_HDD_SIZE
+      global USR_HDD_PATH
+      global USR_HDD_PATH_F
+      global USR_HDD_ISPHYSICAL
+      global USR_HDD_TYPE
+      global USR_NETWORK_DEVICE
+      global USR_MAC_ADDRESS
+      global USR_BOOT_FILE
+      global USR_SCREEN_RES
+      global USR_CREATE_XML
+      global USR_EXP_AUDIO
+      global USR_SMBIOS_SERIAL
+      global USR_SMBIOS_UUID
+      global USR_HDD_PROFILE
+      global USR_CPU_PINNING
+      global USR_MEMORY_BACKING
+      global USR_NETWORK_MODE
+      global USR_NETWORK_IFACE
+      global osIcon
+      cpydLog("ok",str("Applying answers from "+args.answers))
+      # Same clean slate stage 1 starts from
+      movePrefs(LIVE_DIR, STALE_DIR)
+      writeBlobs(answers)
+
+      USR_CFG = answers["USR_CFG"]
+      USR_CFG_XML = USR_CFG.replace(".sh",".xml")
+      USR_TARGET_OS = answers["USR_TARGET_OS"]
+      USR_TARGET_OS_NAME = answers["USR_TARGET_OS_NAME"]
+      USR_TARGET_OS_ID = answers["USR_TARGET_OS_ID"]
+      if USR_TARGET_OS > 1000:
+         USR_TARGET_OS_F = USR_TARGET_OS / 100
+      elif USR_TARGET_OS >= 100 and USR_TARGET_OS < 1000:
+         USR_TARGET_OS_F = USR_TARGET_OS / 10
+      else:
+         USR_TARGET_OS_F = USR_TARGET_OS
+      USR_CPU_CORES = answers["USR_CPU_CORES"]
+      USR_CPU_THREADS = answers["USR_CPU_THREADS"]
+      USR_CPU_TOTAL_F = str(USR_CPU_CORES * USR_CPU_THREADS)
+      USR_CPU_MODEL = answers["USR_CPU_MODEL"]
+      USR_CPU_FEATURE_ARGS = answers["USR_CPU_FEATURE_ARGS"]
+      USR_ALLOCATED_RAM = answers["USR_ALLOCATED_RAM"]
+      USR_HDD_SIZE = answers["USR_HDD_SIZE"]
+      USR_HDD_PATH = answers["USR_HDD_PATH"]
+      USR_HDD_PATH_F = answers.get("USR_HDD_PATH_F", USR_HDD_PATH)
+      USR_HDD_ISPHYSICAL = answers["USR_HDD_ISPHYSICAL"]
+      USR_HDD_TYPE = answers["USR_HDD_TYPE"]
+      USR_NETWORK_DEVICE = answers["USR_NETWORK_DEVICE"]
+      USR_MAC_ADDRESS = answers["USR_MAC_ADDRESS"]
+      USR_BOOT_FILE = answers["USR_BOOT_FILE"]
+      USR_SCREEN_RES = answers["USR_SCREEN_RES"]
+      USR_CREATE_XML = answers["USR_CREATE_XML"]
+      USR_EXP_AUDIO = answers["USR_EXP_AUDIO"]
+      USR_SMBIOS_SERIAL = answers["USR_SMBIOS_SERIAL"]
+      USR_SMBIOS_UUID = answers["USR_SMBIOS_UUID"]
+      USR_HDD_PROFILE = answers["USR_HDD_PROFILE"]
+      USR_CPU_PINNING = answers["USR_CPU_PINNING"]
+      USR_MEMORY_BACKING = answers["USR_MEMORY_BACKING"]
+      USR_NETWORK_MODE = answers["USR_NETWORK_MODE"]
+      USR_NETWORK_IFACE = answers["USR_NETWORK_IFACE"]
+
+      osIcon = "ap-"+USR_TARGET_OS_NAME.lower().replace(" beta","")+"-g2"
+      if int(USR_TARGET_OS) < 1013 and int(USR_TARGET_OS) >= 100:
+         osIcon = "ap-legacy"
+      cpydLog("ok",str("Answers applied, handing off to AP autoflow"))
+
+   if answers is not None:
+      applyAnswers()
+      handoff()
+   else:
+      stage1()
 
 if detectChoice == "1":
    cpydLog("ok",("───────────────── STARTING INTERROGATION SEQUENCE ─────────────────"))
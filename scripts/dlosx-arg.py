@@ -18,13 +18,14 @@ import time
 import math
 sys.path.append('./resources/python')
 from cpydColours import color
+from cpydDownload import RangedDownload, VerificationError, DEFAULT_CONNECTIONS
+from cpydChunklist import parseChunklist, ChunklistError
+from cpydHTTP import getPool, configure, DEFAULT_TIMEOUT, DEFAULT_RETRIES
+from cpydParallel import fanOut, gather, DEFAULT_WORKERS, DEFAULT_RATE
+from cpydUDIF import convertImage, StreamConverter, UDIFError
+from cpydRecoveryCache import RecoveryCache, cacheKey, defaultCacheDir, DEFAULT_CACHE_SIZE
 
-try:
-    from urllib.request import Request, urlopen
-    from urllib.parse import urlparse
-except ImportError:
-    from urllib2 import Request, urlopen
-    from urlparse import urlparse
+from urllib.parse import urlparse
 
 SELF_DIR = os.path.dirname(os.path.realpath(__file__))
 repoDir = os.path.abspath(os.curdir)
@@ -44,6 +45,9 @@ INFO_IMAGE_SESS = 'AT'
 INFO_SIGN_LINK = 'CU'
 INFO_SIGN_HASH = 'CH'
 INFO_SIGN_SESS = 'CT'
+EXIT_VERIFY_FAILED = 2
+EXIT_UNVERIFIED = 3
+EXIT_CONVERT_FAILED = 4
 INFO_REQURED = [INFO_PRODUCT, INFO_IMAGE_LINK, INFO_IMAGE_HASH, INFO_IMAGE_SESS,
                 INFO_SIGN_LINK, INFO_SIGN_HASH, INFO_SIGN_SESS]
 
@@ -54,6 +58,8 @@ global enableProgress
 global enablePercentage
 enableProgress = True
 enablePercentage = True
+progressLines = False
+imageDir = None
 
 def run_query(url, headers, post=None, raw=False):
     if post is not None:
@@ -63,11 +69,11 @@ def run_query(url, headers, post=None, raw=False):
     else:
         data = None
 
-    req = Request(url=url, headers=headers, data=data)
-    response = urlopen(req)
+    response = getPool().request('GET' if data is None else 'POST', url, headers, data)
     if raw:
         return response
-    return dict(response.info()), response.read()
+    output = response.read()
+    return dict(response.info()), output
 
 
 def generate_id(itype, nid=None):
@@ -91,7 +97,6 @@ def mlb_from_eeee(eeee):
 def get_session(args):
     headers = {
         'Host': 'osrecovery.apple.com',
-        'Connection': 'close',
         'User-Agent': 'InternetRecovery/1.0',
     }
 
@@ -115,7 +120,6 @@ def get_session(args):
 def get_image_info(session, bid, mlb=MLB_ZERO, diag=False, os_type='default', cid=None):
     headers = {
         'Host': 'osrecovery.apple.com',
-        'Connection': 'close',
         'User-Agent': 'InternetRecovery/1.0',
         'Cookie': session,
         'Content-Type': 'text/plain',
@@ -154,20 +158,44 @@ def get_image_info(session, bid, mlb=MLB_ZERO, diag=False, os_type='default', ci
 
     return info
 
-def passon():
+def get_chunklist(url, sess):
+    purl = urlparse(url)
+    headers = {
+        'Host': purl.hostname,
+        'User-Agent': 'InternetRecovery/1.0',
+        'Cookie': '='.join(['AssetToken', sess])
+    }
+    _, data = run_query(url, headers)
+    return parseChunklist(data)
+
+def passon(pipeline=None):
     global nrs
+    global imageDir
     os.chdir(repoDir)
-    if nrs == True: # NEW RESOURCE SYSTEM
-        os.system('./scripts/cvtosx.sh --nrs > /dev/null 2>&1')
+    if pipeline is not None:
+        # Everything was decoded during the download, just wait for the last chunks
+        try:
+            pipeline.finish()
+            os.remove(pipeline.source)
+            return
+        except UDIFError:
+            pass
+    if imageDir is not None: # AUTOPILOT WORKSPACE
+        dmgPath = os.path.join(imageDir, 'BaseSystem.dmg')
+    elif nrs == True: # NEW RESOURCE SYSTEM
+        dmgPath = './resources/BaseSystem.dmg'
     else:
-        os.system('./scripts/cvtosx.sh > /dev/null 2>&1')
+        dmgPath = './BaseSystem.dmg'
+    if not os.path.exists(dmgPath):
+        return
+    convertImage(dmgPath, dmgPath[:-len('.dmg')] + '.img', './resources/dmg2img')
+    os.remove(dmgPath)
     
 
-def save_image(url, sess, filename='', directory=''):
+def save_image(url, sess, filename='', directory='', connections=DEFAULT_CONNECTIONS, chunklist=None, convert=True):
     purl = urlparse(url)
     headers = {
         'Host': purl.hostname,
-        'Connection': 'close',
         'User-Agent': 'InternetRecovery/1.0',
         'Cookie': '='.join(['AssetToken', sess])
     }
@@ -180,13 +208,25 @@ def save_image(url, sess, filename='', directory=''):
     #print('Saving ' + url + ' to ' + filename + '...')
     
 
-    with open(os.path.join(directory, filename), 'wb') as fhandle:
-        response = run_query(url, headers, raw=True)
+    path = os.path.abspath(os.path.join(directory, filename))
+    download = RangedDownload(url, headers, path, connections=connections, session=sess, chunklist=chunklist)
+    download.probe()
+
+    # Decode the image as its chunks land instead of waiting for the whole file
+    pipeline = None
+    if convert and download.ranged and path.endswith('.dmg'):
+        try:
+            pipeline = StreamConverter.forDownload(download, path[:-len('.dmg')] + '.img')
+        except (UDIFError, OSError):
+            pipeline = None
+    # The pipeline owns a process pool and a half written image, neither may outlive a failed download
+    try:
+        download.start()
 
-        total_size = int(response.headers['content-length']) / float(2 ** 20)
+        total_size = download.length / float(2 ** 20)
         # print(total_size)
         if total_size < 1:
-            total_size = response.headers['content-length']
+            total_size = download.length
             #print("Note: The total download size is %s bytes" % total_size)
         #else:
             #print("Note: The total download size is %0.2f MB" % total_size)
@@ -197,14 +237,12 @@ def save_image(url, sess, filename='', directory=''):
         smEnd = 0
         lastTime = 0
         lastSize = 0
+        lastReported = -1
         #print("   ───────────────────────────────────────────────────────────────────")
         while True:
             #print("   ───────────────────────────────────────────────────────────────────")
-            chunk = response.read(1000000)
-            if not chunk:
-                break
-            fhandle.write(chunk)
-            size += len(chunk)
+            finished = download.wait(0.5)
+            size = download.received
             if enableProgress == True:
                 progress = (round(float(100 * size / (1048576))/float(total_size)))
 
@@ -263,7 +301,7 @@ def save_image(url, sess, filename='', directory=''):
                     lastSize = (size / 2 ** 20) # in MBs
                     lastTime = int(time.time())
 
-                
+            
                 #lastSize = size / (2 ** 20)
                 #
 
@@ -280,35 +318,51 @@ def save_image(url, sess, filename='', directory=''):
                     print('   \r      {2}    {0:0.1f} MB / {1:0.1f} MB    {3}         '.format((size / (2 ** 20)),(total_size),(progressGUI+"  "+color.END+color.BOLD+str(progress)+"% "+color.END),((str(speed))+" MB/s")), end='\n')
                 else:
                     print('   \r      {2}                                             '.format((size / (2 ** 20)),(total_size),(progressGUI+"  "+color.END+color.BOLD+color.END)), end='\n')
-                
+            
                 sys.stdout.flush()
+            elif progressLines == True and download.length > 0:
+                reported = int(100 * size / download.length)
+                if reported != lastReported:
+                    print('progress '+str(reported), flush=True)
+                    lastReported = reported
+            if finished:
+                break
+        download.close()
+    except BaseException:
+        if pipeline is not None:
+            pipeline.abort()
+        raise
+    
+    #print('   \r    ✓  {2}      {0:0.1f} MB / {1:0.1f} MB          '.format((size / (2 ** 20)),(total_size),(progressGUI+"  "+color.END+color.BOLD+str(progress)+"% "+color.END),('   ─────────────────────────────────────────────────────────────────── ')), end='')
+    if enableProgress == True:
+        sys.stdout.write('\033[F\033[2K\033[1G')
+        if enablePercentage == True:
+            print('   \r      {2}       Download Complete                     '.format((size / (2 ** 20)),(total_size),(progressGUI+"  "+color.END+color.BOLD+str(progress)+"% "+color.END),('\n   ─────────────────────────────────────────────────────────────────── ')), end='\n')
+        else:
+            print('   \r      {2}                                             '.format((size / (2 ** 20)),(total_size),(progressGUI+"  "+color.END+color.BOLD+color.END)), end='')
+        if not convert:
+            # The DMG is attached as-is, nothing left to do
+            return
         
-        #print('   \r    ✓  {2}      {0:0.1f} MB / {1:0.1f} MB          '.format((size / (2 ** 20)),(total_size),(progressGUI+"  "+color.END+color.BOLD+str(progress)+"% "+color.END),('   ─────────────────────────────────────────────────────────────────── ')), end='')
-        if enableProgress == True:
-            sys.stdout.write('\033[F\033[2K\033[1G')
-            if enablePercentage == True:
-                print('   \r      {2}       Download Complete                     '.format((size / (2 ** 20)),(total_size),(progressGUI+"  "+color.END+color.BOLD+str(progress)+"% "+color.END),('\n   ─────────────────────────────────────────────────────────────────── ')), end='\n')
-            else:
-                print('   \r      {2}                                             '.format((size / (2 ** 20)),(total_size),(progressGUI+"  "+color.END+color.BOLD+color.END)), end='')
-            time.sleep(3)
-            
-            sys.stdout.write('\033[F\033[2K\033[1G')
-            progressGUI = (color.GRAY+"━━━━━━━━━━━━━━━━━━━━"+color.GRAY+"")
-            if enablePercentage == True:
-                print('   \r      {2}           Converting...                '.format((size / (2 ** 20)),(total_size),(progressGUI+"  "+color.END+color.BOLD+"⊚ "+color.END),('\n   ─────────────────────────────────────────────────────────────────── ')), end='\n')
-            else:
-                print('   \r      {2}                                             '.format((size / (2 ** 20)),(total_size),(progressGUI+"  "+color.END+color.BOLD+color.END)), end='')
-            passon()
-            sys.stdout.write('\033[F\033[2K\033[1G')
-            progressGUI = (color.GREEN+"━━━━━━━━━━━━━━━━━━━━"+color.GRAY+"")
-            if enablePercentage == True:
-                print('   \r      {2}       Conversion Complete              '.format((size / (2 ** 20)),(total_size),(progressGUI+"  "+color.END+color.BOLD+"100% "+color.END),('\n   ─────────────────────────────────────────────────────────────────── ')), end='\n')
-            else:
-                print('   \r      {2}                                             '.format((size / (2 ** 20)),(total_size),(progressGUI+"  "+color.END+color.BOLD+color.END)), end='')
-            time.sleep(2)
-                #print('\r{} MBs downloaded...'.format(size / (2 ** 20)), end='')
-           
-        #print('\rDownload complete!' + ' ' * 32)
+        sys.stdout.write('\033[F\033[2K\033[1G')
+        progressGUI = (color.GRAY+"━━━━━━━━━━━━━━━━━━━━"+color.GRAY+"")
+        if enablePercentage == True:
+            print('   \r      {2}           Converting...                '.format((size / (2 ** 20)),(total_size),(progressGUI+"  "+color.END+color.BOLD+"⊚ "+color.END),('\n   ─────────────────────────────────────────────────────────────────── ')), end='\n')
+        else:
+            print('   \r      {2}                                             '.format((size / (2 ** 20)),(total_size),(progressGUI+"  "+color.END+color.BOLD+color.END)), end='')
+        passon(pipeline)
+        sys.stdout.write('\033[F\033[2K\033[1G')
+        progressGUI = (color.GREEN+"━━━━━━━━━━━━━━━━━━━━"+color.GRAY+"")
+        if enablePercentage == True:
+            print('   \r      {2}       Conversion Complete              '.format((size / (2 ** 20)),(total_size),(progressGUI+"  "+color.END+color.BOLD+"100% "+color.END),('\n   ─────────────────────────────────────────────────────────────────── ')), end='\n')
+        else:
+            print('   \r      {2}                                             '.format((size / (2 ** 20)),(total_size),(progressGUI+"  "+color.END+color.BOLD+color.END)), end='')
+        time.sleep(2)
+            #print('\r{} MBs downloaded...'.format(size / (2 ** 20)), end='')
+    elif convert:
+        passon(pipeline)
+       
+    #print('\rDownload complete!' + ' ' * 32)
        
 
 
@@ -347,7 +401,45 @@ def action_download(args):
         print(info)
     #print('Downloading ' + info[INFO_PRODUCT] + '...')
     dmgname = '' if args.basename == '' else args.basename + '.dmg'
-    save_image(info[INFO_IMAGE_LINK], info[INFO_IMAGE_SESS], dmgname, args.outdir)
+
+    # Converted images are cached by product and hash, so a hit skips the download entirely
+    cache = None
+    alias = args.shortname if args.shortname != '' else None
+    if imageDir is not None:
+        imagePath = os.path.join(imageDir, 'BaseSystem.img')
+    else:
+        imagePath = os.path.join(repoDir, 'resources', 'BaseSystem.img') if nrs == True else os.path.join(repoDir, 'BaseSystem.img')
+    if args.cache_dir != '':
+        cache = RecoveryCache(args.cache_dir, args.cache_size * 2 ** 30)
+        key = cacheKey(info[INFO_PRODUCT], info[INFO_IMAGE_HASH])
+        method = cache.place(key, imagePath)
+        if method is not None:
+            if alias is not None:
+                cache.setAlias(alias, key)
+            print(color.GREEN+color.BOLD+"   ✓ "+color.END+"Using cached recovery image "+key+" ("+method+")")
+            return 0
+
+    # The chunklist lets every chunk be checked as it streams in; carry on unverified if it can't be fetched
+    try:
+        chunklist = get_chunklist(info[INFO_SIGN_LINK], info[INFO_SIGN_SESS])
+    except (ChunklistError, OSError) as e:
+        print(color.YELLOW+color.BOLD+"   ⚠ "+color.END+"Could not load the chunklist, the image will not be verified ("+str(e)+")")
+        chunklist = None
+
+    try:
+        save_image(info[INFO_IMAGE_LINK], info[INFO_IMAGE_SESS], dmgname, args.outdir, args.connections, chunklist, not args.keep_dmg)
+    except VerificationError as e:
+        print(color.RED+color.BOLD+"\n   ✖ "+color.END+"The downloaded image failed verification ("+str(e)+")")
+        return EXIT_VERIFY_FAILED
+    except UDIFError as e:
+        print(color.RED+color.BOLD+"\n   ✖ "+color.END+"The image could not be converted, the DMG was kept ("+str(e)+")")
+        return EXIT_CONVERT_FAILED
+    if chunklist is None:
+        return EXIT_UNVERIFIED
+
+    # Only images that passed the chunklist are worth keeping
+    if cache is not None and os.path.exists(imagePath):
+        cache.insert(imagePath, key, alias)
     return 0
 
 
@@ -369,18 +461,26 @@ def action_selfcheck(args):
     """
 
     session = get_session(args)
-    valid_default = get_image_info(session, bid=RECENT_MAC, mlb=MLB_VALID,
-                                   diag=False, os_type='default')
-    valid_latest = get_image_info(session, bid=RECENT_MAC, mlb=MLB_VALID,
-                                  diag=False, os_type='latest')
-    product_default = get_image_info(session, bid=RECENT_MAC, mlb=MLB_PRODUCT,
-                                     diag=False, os_type='default')
-    product_latest = get_image_info(session, bid=RECENT_MAC, mlb=MLB_PRODUCT,
-                                    diag=False, os_type='latest')
-    generic_default = get_image_info(session, bid=RECENT_MAC, mlb=MLB_ZERO,
-                                     diag=False, os_type='default')
-    generic_latest = get_image_info(session, bid=RECENT_MAC, mlb=MLB_ZERO,
-                                    diag=False, os_type='latest')
+    results = gather({
+        'valid_default': lambda: get_image_info(session, bid=RECENT_MAC, mlb=MLB_VALID,
+                                                diag=False, os_type='default'),
+        'valid_latest': lambda: get_image_info(session, bid=RECENT_MAC, mlb=MLB_VALID,
+                                               diag=False, os_type='latest'),
+        'product_default': lambda: get_image_info(session, bid=RECENT_MAC, mlb=MLB_PRODUCT,
+                                                  diag=False, os_type='default'),
+        'product_latest': lambda: get_image_info(session, bid=RECENT_MAC, mlb=MLB_PRODUCT,
+                                                 diag=False, os_type='latest'),
+        'generic_default': lambda: get_image_info(session, bid=RECENT_MAC, mlb=MLB_ZERO,
+                                                  diag=False, os_type='default'),
+        'generic_latest': lambda: get_image_info(session, bid=RECENT_MAC, mlb=MLB_ZERO,
+                                                 diag=False, os_type='latest'),
+    }, args.workers, args.rate)
+    valid_default = results['valid_default']
+    valid_latest = results['valid_latest']
+    product_default = results['product_default']
+    product_latest = results['product_latest']
+    generic_default = results['generic_default']
+    generic_latest = results['generic_latest']
 
     if args.verbose:
         print(valid_default)
@@ -428,15 +528,21 @@ def action_verify(args):
     """
     Try to verify MLB serial number.
     """
-    session = get_session()
-    generic_latest = get_image_info(session, bid=RECENT_MAC, mlb=MLB_ZERO,
-                                    diag=False, os_type='latest')
-    uvalid_default = get_image_info(session, bid=args.board_id, mlb=args.mlb,
-                                    diag=False, os_type='default')
-    uvalid_latest = get_image_info(session, bid=args.board_id, mlb=args.mlb,
-                                   diag=False, os_type='latest')
-    uproduct_default = get_image_info(session, bid=args.board_id, mlb=product_mlb(args.mlb),
-                                      diag=False, os_type='default')
+    session = get_session(args)
+    results = gather({
+        'generic_latest': lambda: get_image_info(session, bid=RECENT_MAC, mlb=MLB_ZERO,
+                                                 diag=False, os_type='latest'),
+        'uvalid_default': lambda: get_image_info(session, bid=args.board_id, mlb=args.mlb,
+                                                 diag=False, os_type='default'),
+        'uvalid_latest': lambda: get_image_info(session, bid=args.board_id, mlb=args.mlb,
+                                                diag=False, os_type='latest'),
+        'uproduct_default': lambda: get_image_info(session, bid=args.board_id, mlb=product_mlb(args.mlb),
+                                                   diag=False, os_type='default'),
+    }, args.workers, args.rate)
+    generic_latest = results['generic_latest']
+    uvalid_default = results['uvalid_default']
+    uvalid_latest = results['uvalid_latest']
+    uproduct_default = results['uproduct_default']
 
     if args.verbose:
         print(generic_latest)
@@ -485,37 +591,42 @@ def action_guess(args):
     generic_latest = get_image_info(session, bid=RECENT_MAC, mlb=MLB_ZERO,
                                     diag=False, os_type='latest')
 
-    for model in db:
-        try:
-            if anon:
-                # For anonymous lookup check when given model does not match latest.
-                model_latest = get_image_info(session, bid=model, mlb=MLB_ZERO,
-                                              diag=False, os_type='latest')
-
-                if model_latest[INFO_PRODUCT] != generic_latest[INFO_PRODUCT]:
-                    if db[model] == 'current':
-                        print('WARN: Skipped {} due to using latest product {} instead of {}'.format(
-                            model, model_latest[INFO_PRODUCT], generic_latest[INFO_PRODUCT]))
-                    continue
-
-                user_default = get_image_info(session, bid=model, mlb=mlb,
-                                              diag=False, os_type='default')
-
-                if user_default[INFO_PRODUCT] != generic_latest[INFO_PRODUCT]:
-                    supported[model] = [db[model], user_default[INFO_PRODUCT], generic_latest[INFO_PRODUCT]]
-            else:
-                # For normal lookup check when given model has mismatching normal and latest.
-                user_latest = get_image_info(session, bid=model, mlb=mlb,
-                                             diag=False, os_type='latest')
+    def check_model(model):
+        if anon:
+            # For anonymous lookup check when given model does not match latest.
+            model_latest = get_image_info(session, bid=model, mlb=MLB_ZERO,
+                                          diag=False, os_type='latest')
+
+            if model_latest[INFO_PRODUCT] != generic_latest[INFO_PRODUCT]:
+                if db[model] == 'current':
+                    print('WARN: Skipped {} due to using latest product {} instead of {}'.format(
+                        model, model_latest[INFO_PRODUCT], generic_latest[INFO_PRODUCT]))
+                return None
 
-                user_default = get_image_info(session, bid=model, mlb=mlb,
-                                              diag=False, os_type='default')
+            user_default = get_image_info(session, bid=model, mlb=mlb,
+                                          diag=False, os_type='default')
 
-                if user_latest[INFO_PRODUCT] != user_default[INFO_PRODUCT]:
-                    supported[model] = [db[model], user_default[INFO_PRODUCT], user_latest[INFO_PRODUCT]]
+            if user_default[INFO_PRODUCT] != generic_latest[INFO_PRODUCT]:
+                return [db[model], user_default[INFO_PRODUCT], generic_latest[INFO_PRODUCT]]
+        else:
+            # For normal lookup check when given model has mismatching normal and latest.
+            user_latest = get_image_info(session, bid=model, mlb=mlb,
+                                         diag=False, os_type='latest')
 
-        except Exception as e:
-            print('WARN: Failed to check {}, exception: {}'.format(model, str(e)))
+            user_default = get_image_info(session, bid=model, mlb=mlb,
+                                          diag=False, os_type='default')
+
+            if user_latest[INFO_PRODUCT] != user_default[INFO_PRODUCT]:
+                return [db[model], user_default[INFO_PRODUCT], user_latest[INFO_PRODUCT]]
+        return None
+
+    # Boards are checked in parallel, stopping at the first match unless every match was asked for
+    stop = None if args.all_matches else (lambda model, result: result is not None)
+    for model, result, error in fanOut(check_model, list(db), args.workers, args.rate, stop):
+        if error is not None:
+            print('WARN: Failed to check {}, exception: {}'.format(model, str(error)))
+        elif result is not None:
+            supported[model] = result
 
     if len(supported) > 0:
         print('SUCCESS: MLB {} looks supported for:'.format(mlb))
@@ -539,7 +650,9 @@ class gdata:
 def main():
     global enableProgress
     global enablePercentage
+    global progressLines
     global nrs
+    global imageDir
     parser = argparse.ArgumentParser(description='Gather recovery information for Macs')
     parser.add_argument('--action', choices=['download', 'selfcheck', 'verify', 'guess'], default='',
                         help='Action to perform: "download" - performs recovery downloading,'
@@ -564,20 +677,42 @@ def main():
     parser.add_argument('-db', '--board-db', type=str, default=os.path.join(SELF_DIR, 'boards.json'),
                         help='use custom board list for checking, defaults to boards.json')
     parser.add_argument("--disable-progress", dest="disableProgress", help="Disable progress bar UI displays",action="store_true")
+    parser.add_argument("--progress-lines", dest="progressLines", help="With --disable-progress, print the download progress as 'progress <percent>' lines for a parent process - INTERNAL USE ONLY",action="store_true")
     parser.add_argument("--disable-percentage", dest="disablePercentage", help="Disable progress bar percentages and data labels",action="store_true")
+    parser.add_argument("-c", "--connections", dest="connections", type=int, default=DEFAULT_CONNECTIONS, help="Number of parallel connections used to download the image, defaults to "+str(DEFAULT_CONNECTIONS))
+    parser.add_argument("--timeout", dest="timeout", type=float, default=DEFAULT_TIMEOUT, help="Network timeout in seconds, defaults to "+str(DEFAULT_TIMEOUT))
+    parser.add_argument("--retries", dest="retries", type=int, default=DEFAULT_RETRIES, help="Number of times a failed request is retried, defaults to "+str(DEFAULT_RETRIES))
+    parser.add_argument("--workers", dest="workers", type=int, default=DEFAULT_WORKERS, help="Number of parallel queries used by selfcheck, verify and guess, defaults to "+str(DEFAULT_WORKERS))
+    parser.add_argument("--rate", dest="rate", type=float, default=DEFAULT_RATE, help="Maximum recovery queries started per second, defaults to "+str(DEFAULT_RATE))
+    parser.add_argument("--all-matches", dest="all_matches", help="Make guess check every board instead of stopping at the first match",action="store_true")
     parser.add_argument("--nrs", dest="nrs", help="Specify whether to use New Resource System (NRS) - INTERNAL USE ONLY",action="store_true")
+    parser.add_argument("--image-dir", dest="image_dir", type=str, default='', help="Place the image in this folder instead of the repository, overrides --nrs - INTERNAL USE ONLY")
+    parser.add_argument("--cache-dir", dest="cache_dir", type=str, default=defaultCacheDir(repoDir), help="Directory used to cache converted recovery images")
+    parser.add_argument("--cache-size", dest="cache_size", type=float, default=DEFAULT_CACHE_SIZE, help="Maximum size of the recovery image cache in GB, defaults to "+str(DEFAULT_CACHE_SIZE))
+    parser.add_argument("--no-cache", dest="no_cache", help="Always download, don't use the recovery image cache",action="store_true")
+    parser.add_argument("--keep-dmg", dest="keep_dmg", help="Keep the downloaded BaseSystem.dmg instead of converting it to a raw image",action="store_true")
     args = parser.parse_args()
+    configure(timeout=args.timeout, retries=args.retries)
+
+    # The cache only holds converted images
+    if args.no_cache == True or args.keep_dmg == True:
+        args.cache_dir = ''
 
     if args.nrs == True:
          nrs = True
     else:
         nrs = False
+
+    # Relative to the repository, this script works from ./resources
+    imageDir = os.path.join(repoDir, args.image_dir) if args.image_dir != '' else None
     
     if args.disableProgress == True:
          enableProgress = False
     else:
         enableProgress = True
 
+    progressLines = args.progressLines
+
     if args.disablePercentage == True:
          enablePercentage = False
     else:
@@ -650,8 +785,10 @@ def main():
     except:
         os_type = "default"
     args = gdata(mlb = product["m"], board_id = product["b"], diagnostics =
-            False, os_type = os_type, verbose=False, basename="", outdir=".")
-    action_download(args)
+            False, os_type = os_type, verbose=False, basename="", outdir=imageDir if imageDir is not None else ".", connections=args.connections,
+            shortname=product["short"], cache_dir=args.cache_dir, cache_size=args.cache_size,
+            keep_dmg=args.keep_dmg)
+    return action_download(args)
 
 
 if __name__ == '__main__':
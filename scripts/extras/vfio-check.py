@@ -24,6 +24,8 @@ import sys
 import argparse
 from datetime import datetime
 import timeit
+sys.path.append('./resources/python')
+from cpydPrefs import getPref, USER_DIR
 
 class color:
    PURPLE = '\033[95m'
@@ -142,9 +144,8 @@ clear()
 print("Checking your system... (7/7)")
 
 # vfcConfig 
-if os.path.exists("./blobs/user/USR_CFG.apb"):
-            apFilePath = open("./blobs/user/USR_CFG.apb")
-            apFilePath = apFilePath.read()
+apFilePath = getPref(USER_DIR, "USR_CFG")
+if apFilePath is not None:
             if os.path.exists("./"+apFilePath):
                 apFile = open("./"+apFilePath,"r")
             
@@ -18,6 +18,7 @@ import argparse
 # import platform
 sys.path.append('./resources/python')
 from cpydColours import color
+from cpydPrefs import getPref, setPref, USER_DIR
 
 
 # Coopydoopydoo Logs
@@ -427,9 +428,8 @@ def phase3():
 
 def autoAPSelect():
     clear()
-    if os.path.exists("./blobs/user/USR_CFG.apb"):
-        apFilePath = open("./blobs/user/USR_CFG.apb")
-        apFilePath = apFilePath.read()
+    apFilePath = getPref(USER_DIR, "USR_CFG")
+    if apFilePath is not None:
         if os.path.exists("./"+apFilePath):
             apFile = open("./"+apFilePath,"r")
             if "APC-RUN" in apFile.read():
@@ -489,9 +489,7 @@ def autoAPSelect():
 
                             apFileM = apFileM.replace("VFIO_DEVICES="+str(currentAmount),"VFIO_DEVICES="+str(totalVD))
                             
-                            blob = open("./blobs/user/USR_VFIO_DEVICES.apb","w")
-                            blob.write(str(totalVD))
-                            blob.close()
+                            setPref(USER_DIR, "USR_VFIO_DEVICES", totalVD)
 
                             apFileM = apFileM.replace("-device qxl-vga,vgamem_mb=128,vram_size_mb=128    ","#-device qxl-vga,vgamem_mb=128,vram_size_mb=128   # DISABLED BY VFIO-PCI PASSTHROUGH ASSISTANT")
                             apFileM = apFileM.replace("/OVMF_VARS.fd","/OVMF_VARS_PT.fd")
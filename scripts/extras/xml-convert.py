@@ -29,6 +29,10 @@ import io
 import pathlib
 sys.path.append('./resources/python')
 from cpydColours import color
+from cpydPrefs import loadPrefs, getPref, copyPrefs, LIVE_DIR, USER_DIR
+from cpydTemplate import renderTemplate
+from cpydMemory import PAGE_SIZES
+from cpydNetwork import VIRTIO_DEVICES
 
 global apFileSelect
 global autodetect
@@ -47,6 +51,7 @@ nrsdir = None
 global cpydPassthrough
 cpydPassthrough = 0
 
+repoDir = os.path.abspath(os.curdir)
 version = open("./.version")
 version = version.read()
 
@@ -172,13 +177,19 @@ def convertBrains():
             print("   Please wait\n")
             print("   The assistant is now converting your AutoPilot config file\n   into a valid domain XML file for use with virsh.")
             print(color.BOLD+"\n   This may take a few moments.\n   Your source config won't be modified.\n")
-        time.sleep(2)
+            time.sleep(2)
         with open(""+apFilePath,"r") as source:
             global apVars
             global useBlobs
             apFileS = source.read()
             apVars = ["macOS","macOS",apFilePath,0,0,1,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-            
+            smbiosSerial = ""
+            smbiosUUID = ""
+
+            # AutoPilot workspaces keep the VM's files away from the repository
+            sourceDir = os.getcwd()
+            if nrsdir is not None:
+                os.chdir(nrsdir)
             
             if autodetect == False or args.noblobs is True:
                 apVars = (re.findall(r'"([^"]*)"', apFileS))
@@ -193,39 +204,40 @@ def convertBrains():
 
                 # HOWEVER, because this method relies on blob existence, there's no guarantee of a APC lineup
                 # Therefore, this will only be used if the APC was autodetected and user authorises this
-                sourceDir = "."+os.curdir
-
-                if nrsdir is not None:
-                    os.chdir(nrsdir)
-                #with open("./blobs/user/USR_NAME.apb") as blob: apVars[0] = str(blob.read())
-                with open("./blobs/user/USR_TARGET_OS.apb") as blob: macOSVer = int(blob.read())
-                with open("./blobs/user/USR_TARGET_OS.apb") as blob: apVars[1] = ""+str(blob.read())
-                with open("./blobs/user/USR_TARGET_OS_NAME.apb") as blob: apVars[18] = ""+str(blob.read())
-                with open("./blobs/user/USR_ALLOCATED_RAM.apb") as blob: apVars[4] = str(blob.read())
-                with open("./blobs/user/USR_CPU_CORES.apb") as blob: apVars[6] = str(blob.read())
-                with open("./blobs/user/USR_CPU_THREADS.apb") as blob: apVars[7] = str(blob.read())
-                with open("./blobs/user/USR_CPU_MODEL.apb") as blob: apVars[8] = str(blob.read())
-                with open("./blobs/user/USR_CPU_FEATURE_ARGS.apb") as blob: apVars[9] = str(blob.read())
-                with open("./blobs/user/USR_NETWORK_DEVICE.apb") as blob: apVars[16] = str(blob.read())
-                with open("./blobs/user/USR_MAC_ADDRESS.apb") as blob: apVars[17] = str(blob.read())
-                with open("./blobs/user/USR_BOOT_FILE.apb") as blob: apVars[21] = str(blob.read())
+                userPrefs = loadPrefs(USER_DIR)
+                #apVars[0] = userPrefs["USR_NAME"]
+                macOSVer = int(userPrefs["USR_TARGET_OS"])
+                apVars[1] = ""+userPrefs["USR_TARGET_OS"]
+                apVars[18] = ""+userPrefs["USR_TARGET_OS_NAME"]
+                apVars[4] = userPrefs["USR_ALLOCATED_RAM"]
+                apVars[6] = userPrefs["USR_CPU_CORES"]
+                apVars[7] = userPrefs["USR_CPU_THREADS"]
+                apVars[8] = userPrefs["USR_CPU_MODEL"]
+                apVars[9] = userPrefs["USR_CPU_FEATURE_ARGS"]
+                apVars[16] = userPrefs["USR_NETWORK_DEVICE"]
+                apVars[17] = userPrefs["USR_MAC_ADDRESS"]
+                apVars[21] = userPrefs["USR_BOOT_FILE"]
+
+                # Only set for VMs that must not share an identity, e.g. batch runs
+                smbiosSerial = userPrefs.get("USR_SMBIOS_SERIAL", "")
+                smbiosUUID = userPrefs.get("USR_SMBIOS_UUID", "")
 
 
                 # REQUIRES FL 7
-                if os.path.exists("./blobs/user/USR_HDD_ISPHYSICAL.apb"):
-                    with open("./blobs/user/USR_HDD_ISPHYSICAL.apb") as blob: apVars[22] = str(blob.read())
+                if "USR_HDD_ISPHYSICAL" in userPrefs:
+                    apVars[22] = userPrefs["USR_HDD_ISPHYSICAL"]
                     USR_HDD_ISPHYSICAL = apVars[22]
                 else: USR_HDD_ISPHYSICAL = False
 
                 # REQUIRES FL 6
-                if os.path.exists("./blobs/user/USR_HDD_TYPE.apb"):
-                    with open("./blobs/user/USR_HDD_TYPE.apb") as blob: apVars[20] = str(blob.read())
+                if "USR_HDD_TYPE" in userPrefs:
+                    apVars[20] = userPrefs["USR_HDD_TYPE"]
                     USR_HDD_TYPE = apVars[20]
                 else: USR_HDD_TYPE == "HDD"
 
                 # REQUIRES FL 5
-                if os.path.exists("./blobs/user/USR_HDD_PATH.apb"):
-                    with open("./blobs/user/USR_HDD_PATH.apb") as blob: apVars[19] = str(blob.read())
+                if "USR_HDD_PATH" in userPrefs:
+                    apVars[19] = userPrefs["USR_HDD_PATH"]
                 else:
                     apVars[19] = "$VM_PATH/HDD.qcow2"
                     apVars[19] = apVars[19].replace("$VM_PATH",workdir)
@@ -235,9 +247,8 @@ def convertBrains():
                     apVars[18] = apVars[18].replace("macOS","Mac OS X")
                 
 
-                if os.path.exists("./blobs/user/USR_TARGET_OS_NAME.apb"):
-                    macOSVer = open("./blobs/user/USR_TARGET_OS_NAME.apb")
-                    macOSVer = macOSVer.read()
+                if "USR_TARGET_OS_NAME" in userPrefs:
+                    macOSVer = userPrefs["USR_TARGET_OS_NAME"]
             
                 USR_BOOT_FILE = apVars[21]
 
@@ -345,152 +356,148 @@ def convertBrains():
 
         apFilePathNoExt = apFilePath.replace(".sh","")
         apFilePathNoExt = r"{}".format(apFilePathNoExt)
-        if ".." in sourceDir:
-            sourceDir = sourceDir.replace("..",".") # fix sourcing paths
-        os.system("cp "+sourceDir+"/resources/baseDomain"+" "+apFilePathNoExt+".xml")
-        with open(""+apFilePathNoExt+".xml","r") as file1:
-            apFileM = file1.read()
-            apFileM = apFileM.replace("baseDomain",str(apFilePathNoExt+".xml"))
-            apFileM = apFileM.replace("#    THIS DOMAIN FILE SHOULD NOT BE EDITED BY THE USER!    #","    APC-RUN_"+str(datetime.today().strftime('%d-%m-%Y_%H-%M-%S'))+"\n \n    THIS FILE WAS GENERATED USING AUTOPILOT.")
-            apFileM = apFileM.replace("#                                                          #\n","")
-            apFileM = apFileM.replace("	#    It is intended to be used by the XML import wizard.   #\n","")
-            apFileM = apFileM.replace("#    To use the wizard, run the included \"main.py\" file;   #\n","")
-            apFileM = apFileM.replace("#                                                          #"," ")
-            apFileM = apFileM.replace("#                       $ ./main.py                        #"," \n     To be used with virsh / virt-manager.")
-            apFileM = apFileM.replace("#    ./main.py","")
-            apFileM = apFileM.replace("############################################################."," ")
 
-            
-            # Decide whether or not to probe array for VHD type
-            if apVars[20] != 0 and useBlobs == False:
-                USR_HDD_TYPE = apVars[20]
-            elif useBlobs == False:
-                USR_HDD_TYPE = "HDD" # Couldn't determine, fallback to regular HDD
+        # Decide whether or not to probe array for VHD type
+        if apVars[20] != 0 and useBlobs == False:
+            USR_HDD_TYPE = apVars[20]
+        elif useBlobs == False:
+            USR_HDD_TYPE = "HDD" # Couldn't determine, fallback to regular HDD
 
-            # Decide whether or not to probe array for physical disk
-            if apVars[21] != 0 and useBlobs == False:
-                USR_HDD_ISPHYSICAL = apVars[21]
-            elif useBlobs == False:
-                USR_HDD_ISPHYSICAL = False # Couldn't determine, fallback to regular HDD
+        # Decide whether or not to probe array for physical disk
+        if apVars[21] != 0 and useBlobs == False:
+            USR_HDD_ISPHYSICAL = apVars[21]
+        elif useBlobs == False:
+            USR_HDD_ISPHYSICAL = False # Couldn't determine, fallback to regular HDD
 
 
-            apVars[1] = apVars[1].replace("macOS ","")
-            apVars[1] = apVars[1].replace("Mac OS X ","")
+        apVars[1] = apVars[1].replace("macOS ","")
+        apVars[1] = apVars[1].replace("Mac OS X ","")
 
-            macOSVer = int(apVars[1].replace(".",""))
+        macOSVer = int(apVars[1].replace(".",""))
 
 
-            if int(macOSVer) <= 999 and int(macOSVer) > 99:
-                apFileM = apFileM.replace("$USR_NAME","Mac OS X "+apVars[18]+"")
-                domainTitle = "Mac OS X "+apVars[18]
-            else:
-                apFileM = apFileM.replace("$USR_NAME","macOS "+apVars[18]+"")
-                domainTitle = "macOS "+apVars[18]
-
-            apFileM = apFileM.replace("$USR_NAME",apVars[18]+"")
-            apFileM = apFileM.replace("$USR_UUID",str(uuid.uuid4()))
-
-            # CONVERT MEMORY TO VIRSH FORMAT
-            apMemCvt = apVars[4].replace("G","")
-            apMemCvt = int(apMemCvt)
-            apMemCvt = apMemCvt * 1048576
-
-            # GET WD
-            workdir = os.getcwd()
-
-            # CONVERT THREADS TO VIRSH FORMAT
-            apThreadsCvt = apVars[7]
-            apThreadsCvt = int(apThreadsCvt)
-            #apThreadsCvt = round(apThreadsCvt / 2)
-
-            # CONVERT VCPUS TO VIRSH FORMAT
-            apTotalCvt = apVars[6]
-            apTotalCvt = int(apTotalCvt)
-            apTotalCvt = round(apTotalCvt * apThreadsCvt)
-
-            # CONVERT OS VERSION TO VIRSH FORMAT
-            apOSCvt = apVars[1]
-            apOSCvt = apOSCvt.replace("macOS ","")
-            apOSCvt = apOSCvt.replace("Mac OS X ","")
-            apOSCvt = apOSCvt.replace(".","")
-
-            if USR_HDD_ISPHYSICAL == "True":
-                apFileM = apFileM.replace("    <disk type=\"file\" device=\"disk\"> <!-- HDD HEADER -->\n      <driver name=\"qemu\" type=\"qcow2\"/>\n      <source file=\"$USR_HDD_PATH\"/>\n      <target dev=\"sdb\" bus=\"sata\" rotation_rate=\"7200\"/>\n      <address type=\"drive\" controller=\"0\" bus=\"0\" target=\"0\" unit=\"1\"/>\n    </disk> <!-- HDD FOOTER -->","    <disk type=\"block\" device=\"disk\"> <!-- HDD HEADER -->\n      <driver name=\"qemu\" type=\"raw\"/>\n      <source dev=\"$USR_HDD_PATH\"/>\n      <target dev=\"sdb\" bus=\"sata\" rotation_rate=\"7200\"/>\n      <address type=\"drive\" controller=\"0\" bus=\"0\" target=\"0\" unit=\"1\"/>\n    </disk> <!-- HDD FOOTER -->")
-
-            if USR_HDD_TYPE == "HDD":       # DISK TYPE ROUTINE; REQUIRES CONFIG FL 6!
-                    None
-            elif USR_HDD_TYPE == "SSD":
-                apFileM = apFileM.replace("rotation_rate=\"7200\"","rotation_rate=\"1\"")
-            elif USR_HDD_TYPE == "NVMe":
-                apFileM = apFileM.replace("<!-- NVME HEADER -->","<qemu:arg value=\"-drive\"/>\n    <qemu:arg value=\"file=$USR_HDD_PATH,format=qcow2,if=none,id=HDD\"/>\n    <qemu:arg value=\"-device\"/>\n    <qemu:arg value=\"nvme,drive=HDD,serial=ULTMOS,bus=pcie.0,addr=10\"/>")
-                apFileM = apFileM.replace("<disk type=\"file\" device=\"disk\"> <!-- HDD HEADER -->","<!-- <disk type=\"file\" device=\"disk\">")
-                apFileM = apFileM.replace("</disk> <!-- HDD FOOTER -->","</disk> -->")
-
-            if USR_BOOT_FILE != "-2":
-                apFileM = apFileM.replace("<!-- BASESYSTEM HEADER -->","<!--############# REMOVE THESE LINES AFTER MACOS INSTALLATION #############-->\n\n    <disk type=\"file\" device=\"disk\"> \n      <driver name=\"qemu\" type=\"raw\"/>\n      <source file=\"$VM_PATH/BaseSystem.img\"/>\n      <target dev=\"sdc\" bus=\"sata\"/>\n      <address type=\"drive\" controller=\"0\" bus=\"0\" target=\"0\" unit=\"2\"/>\n	  </disk> \n\n<!--#######################################################################-->")
-
-
-            if USR_BOOT_FILE == "-2" and useBlobs == True:       # DISABLE THE DETACHED BASESYSTEM; REQUIRES BLOB METHOD!
-                apFileM = apFileM.replace("<!--############# REMOVE THESE LINES AFTER MACOS INSTALLATION #############-->","<!--############# REMOVE THESE LINES AFTER MACOS INSTALLATION #############")
-                apFileM = apFileM.replace("<!--#######################################################################-->","    #######################################################################-->")
-                apFileM = apFileM.replace("<!-- BASESYSTEM HEADER -->","")
-                apFileM = apFileM.replace("<!-- BASESYSTEM FOOTER -->","")
-
-            
-            apFileM = apFileM.replace("$USR_MEMORY",str(apMemCvt))
-            apFileM = apFileM.replace("$USR_CPU_CORES",apVars[6])
-            apFileM = apFileM.replace("$USR_CPU_TOTAL",str(apTotalCvt))
-            apFileM = apFileM.replace("$USR_CPU_THREADS",str(apThreadsCvt))
-            apFileM = apFileM.replace("$USR_CPU_MODEL",apVars[8])
-            apFileM = apFileM.replace("$OVMF_DIR","ovmf")
-            
-            apFileM = apFileM.replace("$USR_CPU_ARGS",apVars[9])
-            apFileM = apFileM.replace("$USR_CPU_CORES",apVars[6])
-            apFileM = apFileM.replace("$USR_NETWORK_ADAPTER",apVars[16])
-            apFileM = apFileM.replace("$USR_MAC_ADDRESS",apVars[17])
-            if apVars[19] == 0:
-                apFileM = apFileM.replace("$USR_HDD_PATH","$VM_PATH/HDD.qcow2")
-            else:
-                apFileM = apFileM.replace("$USR_HDD_PATH",apVars[19])
-            apFileM = apFileM.replace("$VM_PATH",workdir)
-            apFileM = apFileM.replace("$USR_OS_VERSION",apOSCvt)
-            apFileM = apFileM.replace("$USR_OS_NAME",apVars[18])
-            apFileM = apFileM.replace("$USR_HEADER","Converted from "+apFilePath)
-            apFileM = apFileM.replace("$REPO_VERSION",version)
-            apFileM = apFileM.replace("$XML_FILE",apFilePathNoExt+".xml")
-            apFileM = apFileM.replace("$AP_FILE",apFilePath)
-            apFileM = apFileM.replace("$AP_RUNTIME",str(datetime.today().strftime('%H:%M:%S %d/%m/%Y')))
-            
-            if "-device vfio-pci" in apFileS: # DISABLE VGA VIDEO OUT IF PASSTHROUGH DETECTED
-                apFileM = apFileM.replace("    <video>\n      <model type=\"vga\" vram=\"16384\" heads=\"1\" primary=\"yes\"/>\n      <address type=\"pci\" domain=\"0x0000\" bus=\"0x09\" slot=\"0x01\" function=\"0x0\"/>\n    </video>","    <video>\n		<model type=\"none\"/>\n    </video>")
-            
-            
-            if autodetect == True:
-                apFileM = apFileM.replace("$AP_AUTO","Yes")
-            else:
-                apFileM = apFileM.replace("$AP_AUTO","No")
-            if useBlobs == True:
-                apFileM = apFileM.replace("$AP_BLOB","Yes")
-            else:
-                apFileM = apFileM.replace("$AP_BLOB","No")
-
-            if args.markap == True:
-                apFileM = apFileM.replace("$AP_FLOW","Yes")
-            else:
-                apFileM = apFileM.replace("$AP_FLOW","No")
-
-            if "-device vfio-pci" in apFileS:
-                apFileM = apFileM.replace("<!-- VFIO-PCI HEADER -->",('\n    '.join(vfioXML)))
+        if int(macOSVer) <= 999 and int(macOSVer) > 99:
+            domainTitle = "Mac OS X "+apVars[18]
+        else:
+            domainTitle = "macOS "+apVars[18]
+
+        # CONVERT MEMORY TO VIRSH FORMAT
+        apMemCvt = apVars[4].replace("G","")
+        apMemCvt = int(apMemCvt)
+        apMemCvt = apMemCvt * 1048576
+
+        # GET WD
+        workdir = os.getcwd()
+
+        # CONVERT THREADS TO VIRSH FORMAT
+        apThreadsCvt = apVars[7]
+        apThreadsCvt = int(apThreadsCvt)
+        #apThreadsCvt = round(apThreadsCvt / 2)
+
+        # CONVERT VCPUS TO VIRSH FORMAT
+        apTotalCvt = apVars[6]
+        apTotalCvt = int(apTotalCvt)
+        apTotalCvt = round(apTotalCvt * apThreadsCvt)
+
+        # CONVERT OS VERSION TO VIRSH FORMAT
+        apOSCvt = apVars[1]
+        apOSCvt = apOSCvt.replace("macOS ","")
+        apOSCvt = apOSCvt.replace("Mac OS X ","")
+        apOSCvt = apOSCvt.replace(".","")
+
+        # Follow the script, which attaches BaseSystem either as a raw image or read-only as a DMG
+        if USR_BOOT_FILE == "-2" and useBlobs == True:       # DISABLE THE DETACHED BASESYSTEM; REQUIRES BLOB METHOD!
+            baseSystem = ""
+        elif re.search(r'^-drive id=BaseSystem,if=none,file="\$VM_PATH/BaseSystem\.dmg",format=dmg', apFileS, re.MULTILINE):
+            baseSystem = "dmg"
+        else:
+            baseSystem = "raw"
 
-            if "-device usb-host" in apFileS:
-                apFileM = apFileM.replace("<!-- USB HEADER -->",('\n    '.join(usbXML)))
-        # apFileM = apFileM.replace("$USR_",apVars[])
-        
-        file1.close
+        if apVars[19] == 0:
+            hddPath = workdir+"/HDD.qcow2"
+        else:
+            hddPath = apVars[19].replace("$VM_PATH",workdir)
+
+        # Open the disk the same way the script does, raw disks aren't always physical
+        hddDrive = re.search(r'^-drive id=HDD,if=none,file="[^"]*",(\S*)', apFileS, re.MULTILINE)
+        hddOptions = {}
+        if hddDrive is not None:
+            hddOptions = dict(option.split("=", 1) for option in hddDrive.group(1).split(",") if "=" in option)
+        hddFormat = hddOptions.get("format", "raw" if str(USR_HDD_ISPHYSICAL) == "True" else "qcow2")
+
+        # Back the memory the same way the script does
+        memoryBacking = re.search(r'^MEMORY_BACKING="([^"]*)"', apFileS, re.MULTILINE)
+        memoryBacking = memoryBacking.group(1) if memoryBacking is not None else ""
+
+        # Connect the network the same way the script does
+        networkMode = re.search(r'^NETWORK_MODE="([a-z]*)"', apFileS, re.MULTILINE)
+        networkMode = networkMode.group(1) if networkMode is not None else "user"
+        networkIface = re.search(r'^NETWORK_IFACE="([^"]*)"', apFileS, re.MULTILINE)
+        networkQueues = re.search(r'^NETWORK_QUEUES=([0-9]+)', apFileS, re.MULTILINE)
+        networkQueues = int(networkQueues.group(1)) if networkQueues is not None else 1
+        networkModel = apVars[16]
+        if networkMode != "user" and networkModel in VIRTIO_DEVICES:
+            networkModel = "virtio"
+        networkVhost = re.search(r'^-netdev tap,\S*vhost=on', apFileS, re.MULTILINE) is not None
+
+        # Keep the host CPUs AutoPilot set aside for the script
+        vcpuPins = re.search(r'^VCPU_PINS="([0-9 ]*)"', apFileS, re.MULTILINE)
+        emulatorPins = re.search(r'^EMULATOR_PINS="([0-9,-]*)"', apFileS, re.MULTILINE)
+        vcpuPinXML = []
+        if vcpuPins is not None:
+            vcpuPinXML = ['<vcpupin vcpu="'+str(vcpu)+'" cpuset="'+cpu+'"/>' for vcpu, cpu in enumerate(vcpuPins.group(1).split())]
+
+        domainValues = {
+            "APC_RUN": str(datetime.today().strftime('%d-%m-%Y_%H-%M-%S')),
+            "XML_FILE": apFilePathNoExt+".xml",
+            "USR_OS_VERSION": apOSCvt,
+            "USR_NAME": domainTitle,
+            "USR_HEADER": "Converted from "+apFilePath,
+            "REPO_VERSION": version,
+            "AP_FILE": apFilePath,
+            "AP_FLOW": "Yes" if args.markap == True else "No",
+            "AP_AUTO": "Yes" if autodetect == True else "No",
+            "AP_BLOB": "Yes" if useBlobs == True else "No",
+            "AP_RUNTIME": str(datetime.today().strftime('%H:%M:%S %d/%m/%Y')),
+            "USR_UUID": smbiosUUID if smbiosUUID != "" else str(uuid.uuid4()),
+            "USR_SMBIOS_SERIAL": smbiosSerial,
+            "USR_MEMORY": apMemCvt,
+            "USR_CPU_TOTAL": apTotalCvt,
+            "USR_CPU_CORES": apVars[6],
+            "USR_CPU_THREADS": apThreadsCvt,
+            "USR_CPU_MODEL": apVars[8],
+            "USR_CPU_ARGS": apVars[9],
+            "VM_PATH": workdir,
+            "OVMF_DIR": "ovmf",
+            "USR_NETWORK_ADAPTER": networkModel,
+            "NETWORK_MODE": networkMode,
+            "NETWORK_IFACE": networkIface.group(1) if networkIface is not None else "",
+            "NETWORK_DRIVER": "vhost" if networkVhost else "",
+            "NETWORK_QUEUES": networkQueues if networkQueues > 1 else "",
+            "USR_MAC_ADDRESS": apVars[17],
+            "USR_HDD_PATH": hddPath,
+            "USR_HDD_TYPE": USR_HDD_TYPE,
+            "USR_HDD_ISPHYSICAL": str(USR_HDD_ISPHYSICAL) == "True",
+            "USR_HDD_FORMAT": hddFormat,
+            "HDD_CACHE": hddOptions.get("cache", ""),
+            "HDD_AIO": hddOptions.get("aio", ""),
+            "HDD_DISCARD": hddOptions.get("discard", ""),
+            "HDD_DETECT_ZEROES": hddOptions.get("detect-zeroes", ""),
+            "HDD_L2_CACHE": hddOptions.get("l2-cache-size", ""),
+            "MEMORY_BACKING": memoryBacking,
+            "HUGEPAGE_KIB": PAGE_SIZES.get(memoryBacking, ""),
+            "VCPU_PINS_XML": '\n    '.join(vcpuPinXML),
+            "EMULATOR_PINS": emulatorPins.group(1) if emulatorPins is not None else "",
+            "BASESYSTEM": baseSystem,
+            "VFIO_XML": '\n    '.join(vfioXML) if "-device vfio-pci" in apFileS else "", # ALSO DISABLES VGA VIDEO OUT
+            "USB_XML": '\n    '.join(usbXML) if "-device usb-host" in apFileS else "",
+        }
+        apFileM = renderTemplate(repoDir+"/resources/baseDomain", domainValues)
 
         with open(""+apFilePathNoExt+".xml","w") as file:
             file.write(apFileM)
-        time.sleep(2)
+        if args.quiet != True:
+            time.sleep(2)
 
         os.chdir(sourceDir)         
 
@@ -503,7 +510,7 @@ def convertBrains():
             print("\n\n   "+color.BOLD+color.GREEN+"SUCCESS"+color.END,"")
             print("   AutoPilot config file converted\n")
             print("   The config file was converted successfully into\n   "+color.BOLD+""+apFilePathNoExt+".xml"+color.END+"\n\n\n\n\n   Please wait...\n\n") 
-        time.sleep(3)
+            time.sleep(3)
         if args.noimport != True:
             clear()
             print("\n\n   "+color.BOLD+color.BLUE+"IMPORT XML FILE"+color.END,"")
@@ -542,7 +549,8 @@ def manualAPSelect():
         elif cpydPassthrough == 1:
             apFileSelect = args.convert
         clear()
-        time.sleep(1)
+        if args.quiet != True:
+            time.sleep(1)
         if os.path.exists(apFileSelect):
             apFile = open(apFileSelect)
             if "APC-RUN" in apFile.read() and ".sh" in apFileSelect:
@@ -622,11 +630,10 @@ else:
 if detectChoiceM == "1":
     clear()
     global apFile
-    if not os.path.exists("blobs/user/USR_CFG.apb"):
-        os.system("cp blobs/*.apb blobs/user/")
-    if os.path.exists("./blobs/user/USR_CFG.apb"):
-            apFilePath = open("./blobs/user/USR_CFG.apb")
-            apFilePath = apFilePath.read()
+    if getPref(USER_DIR, "USR_CFG") is None:
+        copyPrefs(LIVE_DIR, USER_DIR)
+    apFilePath = getPref(USER_DIR, "USR_CFG")
+    if apFilePath is not None:
             if os.path.exists("./"+apFilePath):
                 apFile = open("./"+apFilePath,"r")
                 if "APC-RUN" in apFile.read():
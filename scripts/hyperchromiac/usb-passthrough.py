@@ -18,6 +18,7 @@ import argparse
 # import platform
 sys.path.append('./resources/python')
 from cpydColours import color
+from cpydPrefs import getPref, USER_DIR
 
 
 # Coopydoopydoo Logs
@@ -354,9 +355,8 @@ def phase3():
 
 def autoAPSelect():
     clear()
-    if os.path.exists("./blobs/user/USR_CFG.apb"):
-        apFilePath = open("./blobs/user/USR_CFG.apb")
-        apFilePath = apFilePath.read()
+    apFilePath = getPref(USER_DIR, "USR_CFG")
+    if apFilePath is not None:
         if os.path.exists("./"+apFilePath):
             apFile = open("./"+apFilePath,"r")
             if "APC-RUN" in apFile.read():
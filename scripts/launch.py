@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# pylint: disable=C0301,C0116,C0103,R0903
+
+"""
+This script was created by Coopydood as part of the ultimate-macOS-KVM project.
+
+https://github.com/user/Coopydood
+https://github.com/Coopydood/ultimate-macOS-KVM
+Signature: 4CD28348A3DD016F
+
+Boots a VM from its AutoPilot boot script.
+
+   $ ./scripts/launch.py boot.sh
+
+Scripts without an args array (made by hand, or by something else) are
+run with bash as before.
+"""
+
+import os
+import sys
+import signal
+import argparse
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'resources', 'python')) # VMs made with --vm-dir boot from their own folder
+from cpydColours import color
+from cpydLauncher import Launcher, LaunchError, missingHugepages
+
+parser = argparse.ArgumentParser("launch")
+parser.add_argument("script", help="the boot script to boot")
+parser.add_argument("-d", dest="discordRPC", type=int, choices=[0, 1], default=1, help="0 to start without Discord rich presence")
+args = parser.parse_args()
+
+try:
+    launcher = Launcher(args.script, args.discordRPC == 1)
+except LaunchError as e:
+    print(color.YELLOW+color.BOLD+"\n   ⚠ "+color.END+str(e)+", running it with bash instead\n")
+    os.execvp("bash", ["bash", args.script] + (["-d", "0"] if args.discordRPC == 0 else []))
+
+values = launcher.values
+if values.get("VERBOSE") == "1":
+    print("")
+    print("   ──────────────────────────────────────────────")
+    print("     "+values.get("FILE", args.script))
+    print("     "+values.get("ID", "")+" "+values.get("OS_ID", ""))
+    print("")
+    print("     Built with ULTMOS v"+values.get("ULTMOS", ""))
+    print("     Using "+values.get("CPU_MODEL", "")+" CPU model")
+    if values.get("REQUIRES_SUDO") == "1":
+        print("     Superuser privileges enabled")
+    print("     Passthrough enabled" if values.get("VFIO_PTA") == "1" else "     Passthrough disabled")
+    if values.get("MEMORY_BACKING"):
+        print("     Memory backing: "+values["MEMORY_BACKING"])
+    if values.get("NETWORK_MODE", "user") != "user":
+        print("     Network: "+values["NETWORK_MODE"]+" on "+values.get("NETWORK_IFACE", "")+", "+values.get("NETWORK_QUEUES", "1")+" queue(s)")
+    if values.get("VCPU_PINS"):
+        print("     vCPUs pinned to host CPUs "+values["VCPU_PINS"])
+    print("     Discord RPC enabled" if launcher.discordRPC else "     Discord RPC disabled")
+    print("   ──────────────────────────────────────────────")
+    print("")
+
+missing = missingHugepages(values)
+if missing > 0:
+    print("     Not enough free "+values["MEMORY_BACKING"]+" hugepages, "+str(missing)+" more are needed.")
+    print("     Reserve more with: ./scripts/autopilot.py --hugepage-plan")
+
+for signalNumber in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+    signal.signal(signalNumber, launcher.stop)
+
+try:
+    exitCode = launcher.run()
+except LaunchError as e:
+    print(color.RED+color.BOLD+"\n   ✖ "+color.END+str(e)+"\n")
+    sys.exit(1)
+sys.exit(exitCode if exitCode >= 0 else 128 - exitCode)
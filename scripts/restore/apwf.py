@@ -20,6 +20,7 @@ import json
 import sys
 sys.path.append('./resources/python')
 from cpydColours import color
+from cpydPrefs import getPref, clearPrefs, LIVE_DIR, USER_DIR, STALE_DIR
 
 detectChoice = 1
 latestOSName = "Ventura"
@@ -32,14 +33,16 @@ version = version.read()
 
 def clear(): print("\n" * 150)
 
+def dataLeft():
+    # The stale copy is only read when there's no user config
+    return getPref(USER_DIR, "USR_CFG") is not None or getPref(STALE_DIR, "USR_CFG") is not None
+
 
 clear()
 print("\n\n   "+color.BOLD+color.RED+"↺  DELETE AUTOPILOT DATA"+color.END,"")
 print("   Please wait\n")
 print(color.END+"\n\n\n   Checking data...\n\n\n\n\n")
-if os.path.exists("./blobs/user/USR_CFG.apb"):
-    integrity = 1
-elif os.path.exists("./blobs/stale/USR_CFG.apb"):
+if dataLeft():
     integrity = 1
 else:
     integrity = 0
@@ -100,15 +103,15 @@ if detectChoice2 == "X" or detectChoice2 == "x":
     print("   Processing...\n\n\n")
     print("   Please wait while the deletion process is in progress.\n   This may take a few moments.\n\n   DO NOT INTERRUPT THIS OPERATION.\n\n\n")
     time.sleep(5)
-    os.system("rm ./blobs/*.apb > /dev/null 2>&1")
-    os.system("rm ./blobs/stale/*.apb > /dev/null 2>&1")
+    clearPrefs(LIVE_DIR)
+    clearPrefs(STALE_DIR)
     os.system("rm ./resources/config.sh > /dev/null 2>&1")
     time.sleep(2)
 
     
     errorMessage = "Restoration failed. You may not have sufficient\n           permissions or damaged files."
 
-    if os.path.exists("./blobs/user/USR_CFG.apb") or os.path.exists("./blobs/stale/USR_CFG.apb"):
+    if dataLeft():
         throwError()
     else:
         success()
@@ -20,6 +20,7 @@ import json
 import sys
 sys.path.append('./resources/python')
 from cpydColours import color
+from cpydPrefs import getPref, USER_DIR
 
 detectChoice = 1
 latestOSName = "Ventura"
@@ -151,13 +152,10 @@ if detectChoice2 == "X" or detectChoice2 == "x":
 
     global USR_TARGET_OS
 
-    if os.path.exists("./blobs/user/USR_TARGET_OS.apb"):
-        blob = open("./blobs/user/USR_TARGET_OS.apb","r")
-        USR_TARGET_OS = blob.read()
-        USR_TARGET_OS = int(USR_TARGET_OS)
+    if getPref(USER_DIR, "USR_TARGET_OS") is not None:
+        USR_TARGET_OS = int(getPref(USER_DIR, "USR_TARGET_OS"))
         if USR_TARGET_OS < 999:
             USR_TARGET_OS = USR_TARGET_OS * 100
-        blob.close()
     else:
         USR_TARGET_OS = 9999
 
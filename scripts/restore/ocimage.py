@@ -20,6 +20,7 @@ import json
 import sys
 sys.path.append('./resources/python')
 from cpydColours import color
+from cpydPrefs import loadPrefs, USER_DIR
 
 detectChoice = 1
 latestOSName = "Ventura"
@@ -107,12 +108,9 @@ if detectChoice2 == "X" or detectChoice2 == "x":
 
     global USR_TARGET_OS
 
-    blob = open("./blobs/user/USR_TARGET_OS.apb","r")
-    USR_TARGET_OS = blob.read()
-    USR_TARGET_OS = int(USR_TARGET_OS)
+    USR_TARGET_OS = int(loadPrefs(USER_DIR)["USR_TARGET_OS"])
     if USR_TARGET_OS < 999:
         USR_TARGET_OS = USR_TARGET_OS * 100
-    blob.close()
 
     time.sleep(2)
     if USR_TARGET_OS <= 1015:
@@ -24,6 +24,7 @@ import sys
 import shutil
 sys.path.append('./resources/python')
 from cpydColours import color
+from cpydPrefs import loadPrefs, PrefsError, LIVE_DIR, USER_DIR, STALE_DIR
 import distro
 import cpuinfo
 import psutil
@@ -197,27 +198,30 @@ if os.path.exists("./resources/script_store/.version"):
             storeList.append(x)
     if ".script_store" in storeList: storeList.remove(".script_store")
 
-if os.path.exists("./blobs/user/USR_CFG.apb"):
+try:
+    userPrefs = loadPrefs(USER_DIR)
+    userPrefsError = None
+except PrefsError as e:
+    userPrefs = {}
+    userPrefsError = str(e)
+
+if "USR_CFG" in userPrefs:
     
     global macOSVer
     global mOSString
 
-    apFilePath = open("./blobs/user/USR_CFG.apb")
-    apFilePath = apFilePath.read()
-    if os.path.exists("./blobs/user/USR_TARGET_OS_NAME.apb"):
-        macOSVer = open("./blobs/user/USR_TARGET_OS_NAME.apb")
-        macOSVer = macOSVer.read()
+    apFilePath = userPrefs["USR_CFG"]
+    if "USR_TARGET_OS_NAME" in userPrefs:
+        macOSVer = userPrefs["USR_TARGET_OS_NAME"]
 
-    macOSVer = open("./blobs/user/USR_TARGET_OS.apb")
-    macOSVer = macOSVer.read()
+    macOSVer = userPrefs["USR_TARGET_OS"]
     if int(macOSVer) <= 999 and int(macOSVer) > 99:
         macOSVer = str(int(macOSVer) / 100)
         mOSString = "Mac OS X"
     else:
         mOSString = "macOS"
-    if os.path.exists("./blobs/user/USR_TARGET_OS_NAME.apb"):
-        macOSVer = open("./blobs/user/USR_TARGET_OS_NAME.apb")
-        macOSVer = macOSVer.read()
+    if "USR_TARGET_OS_NAME" in userPrefs:
+        macOSVer = userPrefs["USR_TARGET_OS_NAME"]
     if os.path.exists("./"+apFilePath):
         global REQUIRES_SUDO
         global VALID_FILE
@@ -721,18 +725,21 @@ else:
     warnings.append("is invalid, integrity can't be verified\n")
 time.sleep(0.1)
 progressUpdate(63)
-userBlobList = os.listdir("./blobs/user")
-if ".user_control" in userBlobList: userBlobList.remove(".user_control")
+userBlobList = sorted(userPrefs)
+if userPrefsError is not None:
+    warnings.append(userPrefsError+"\n")
 
-staleBlobList = os.listdir("./blobs/stale")
-if ".stale_control" in staleBlobList: staleBlobList.remove(".stale_control")
+try:
+    staleBlobList = sorted(loadPrefs(STALE_DIR))
+except PrefsError:
+    staleBlobList = []
 time.sleep(0.1)
 progressUpdate(64)
-liveBlobList = []
-for x in os.listdir("./blobs/"):
-    if ".apb" in x:
-        liveBlobList.append(x)
-if ".cdn_control" in liveBlobList: liveBlobList.remove(".cdn_control")
+try:
+    liveBlobList = sorted(loadPrefs(LIVE_DIR))
+except PrefsError as e:
+    liveBlobList = []
+    warnings.append(str(e)+"\n")
 time.sleep(0.1)
 progressUpdate(65)
 if len(userBlobList) > 0:
@@ -852,51 +859,22 @@ if apFilePath is not None:
     cpydProfile(("ULTMOS     : "+str(ultmosGenVer)))
     cpydProfile(("GenTime    : "+str(genEpoch)))
     cpydProfile(" ")
-    if os.path.exists("./blobs/user/USR_TARGET_OS_NAME.apb"): 
-        targetOSName = open("./blobs/user/USR_TARGET_OS_NAME.apb")
-        targetOSName = targetOSName.read()
-    else: 
-        targetOSName = "Unknown"
-    
-    if os.path.exists("./blobs/user/USR_TARGET_OS.apb"):
-        targetOS = open("./blobs/user/USR_TARGET_OS.apb")
-        targetOS = targetOS.read()
-    else:
-        targetOS = "Unknown"
+    targetOSName = userPrefs.get("USR_TARGET_OS_NAME", "Unknown")
+    targetOS = userPrefs.get("USR_TARGET_OS", "Unknown")
 
-    if os.path.exists("./blobs/user/USR_HDD_PATH.apb"):
-        targetHDDPath = open("./blobs/user/USR_HDD_PATH.apb")
-        targetHDDPath = targetHDDPath.read()
-        targetHDDPath = targetHDDPath.replace("$VM_PATH",os.path.realpath(os.path.curdir))
+    if "USR_HDD_PATH" in userPrefs:
+        targetHDDPath = userPrefs["USR_HDD_PATH"].replace("$VM_PATH",os.path.realpath(os.path.curdir))
     else:
         targetHDDPath = "Unknown"
     
-    if os.path.exists("./blobs/user/USR_HDD_SIZE.apb"):
-        targetHDDSize = open("./blobs/user/USR_HDD_SIZE.apb")
-        targetHDDSize = targetHDDSize.read()
-        targetHDDSize = targetHDDSize.replace("G"," GB")
+    if "USR_HDD_SIZE" in userPrefs:
+        targetHDDSize = userPrefs["USR_HDD_SIZE"].replace("G"," GB")
     else:
         targetHDDSize = "Unknown"
 
-    if os.path.exists("./blobs/user/USR_HDD_TYPE.apb"):
-        targetHDDType = open("./blobs/user/USR_HDD_TYPE.apb")
-        targetHDDType = targetHDDType.read()
-    else:
-        targetHDDType = "Unknown"
-    
-    if os.path.exists("./blobs/user/USR_HDD_ISPHYSICAL.apb"):
-        targetHDDPhysical = open("./blobs/user/USR_HDD_ISPHYSICAL.apb")
-        targetHDDPhysical = targetHDDPhysical.read()
-    else:
-        targetHDDPhysical = "Unknown"
-
-    
-
-    if os.path.exists("./blobs/user/USR_BOOT_FILE.apb"):
-        recoveryImagePath = open("./blobs/user/USR_BOOT_FILE.apb")
-        recoveryImagePath = recoveryImagePath.read()
-    else:
-        recoveryImagePath = "Unknown"
+    targetHDDType = userPrefs.get("USR_HDD_TYPE", "Unknown")
+    targetHDDPhysical = userPrefs.get("USR_HDD_ISPHYSICAL", "Unknown")
+    recoveryImagePath = userPrefs.get("USR_BOOT_FILE", "Unknown")
 
     if targetHDDPhysical == "True":
         disk = psutil.disk_usage(targetHDDPath)